@@ -0,0 +1,244 @@
+#!/usr/bin/python
+"""
+Headless batch runner: load a map, run a stream of shortest path
+queries against it on a pool of worker processes and write the
+results as JSON lines.
+
+Every query is a JSON object on its own line:
+    {"id": 1, "src": [0, 0], "dst": [10, 20],
+     "diagonals": true, "algorithm": "A*"}
+"id", "diagonals" and "algorithm" are optional, so is "heuristic"
+(one of walkers.heuristics.HEURISTICS) for walkers that take it. Every result is
+a JSON object on its own line too:
+    {"id": 1, "path": [[0, 0], ..., [10, 20]], "cost": 230,
+     "expansions": 120}
+"path" and "cost" are null if the path doesn't exist. "cost" is
+the sum of weights of all the path cells except the source.
+Queries that can't be run (lines that aren't JSON objects, points
+out of the map, "diagonals" that isn't a bool, etc.) get an "error"
+result instead, "id" is null if it couldn't be read.
+With --stats results also have "stats": counters and timings of
+the search, see walkers.probe.SearchProbe (counters the walker
+doesn't keep are null).
+
+Maps can be in any format core.mapio.load_map() reads, and queries
+can be a Moving AI ".scen" file as well.
+"""
+
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+from core import *
+from walkers import WALKERS
+from walkers.heuristics import HEURISTICS
+from walkers.probe import SearchProbe, save_trace
+from walkers.alt import (LandmarkTable, load_landmarks, save_landmarks,
+                         set_landmarks)
+
+# The map queries run against. Worker processes inherit it
+# from the parent on fork(), otherwise load it themselves.
+_graph = None
+# Keyword arguments of run_query() turning instrumentation on
+_probe_opts = {}
+
+
+class BadQuery(object):
+    """
+    Stands in for a line read_queries() couldn't parse, run_query()
+    turns it into an error result. Errors must not be raised while
+    the pool reads queries, it would take them for the end of input.
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+
+def run_query(graph, query, stats=False, trace=False):
+    """
+    Run a single query (a dictionary) on the "graph" until
+    the walker is finished. Return a result dictionary, with
+    SearchProbe() counters and timings under "stats" if "stats"
+    is True and Chrome trace events under "trace" if "trace" is.
+    """
+    if isinstance(query, BadQuery):
+        return {'id': None, 'error': "Bad query: %s" % query.error}
+
+    result = {'id': query.get('id')}
+    try:
+        src = graph.get_cell(*_checked_point(graph, query['src']))
+        dst = graph.get_cell(*_checked_point(graph, query['dst']))
+        wclass = WALKERS[query.get('algorithm', DEFAULT_WALKER)]
+        use_diags = query.get('diagonals', DEFAULT_USE_DIAGS)
+        if not isinstance(use_diags, bool):
+            raise ValueError("\"diagonals\" must be true or false")
+        kwargs = {}
+        if 'heuristic' in query:
+            if not wclass.pluggable_heuristic:
+                raise ValueError("%s doesn't take a heuristic" %
+                                 query.get('algorithm', DEFAULT_WALKER))
+            if query['heuristic'] not in HEURISTICS:
+                raise ValueError("Unknown heuristic %r" % query['heuristic'])
+            kwargs['heuristic'] = query['heuristic']
+    except (KeyError, TypeError, ValueError) as err:
+        result['error'] = "Bad query: %s" % err
+        return result
+
+    try:
+        if stats or trace:
+            walker = SearchProbe(wclass, graph, src, dst, use_diags, **kwargs)
+        else:
+            walker = wclass(graph, src, dst, use_diags, **kwargs)
+        walker.advance()
+
+        path = walker.get_path()
+        result['expansions'] = graph.count_status(CellStatus.Visited)
+        if stats:
+            result['stats'] = walker.stats()
+        if trace:
+            result['trace'] = walker.trace_events()
+        walker.close()
+        if len(path) == 1 and src != dst:
+            result['path'] = None
+            result['cost'] = None
+        else:
+            path.reverse()
+            result['path'] = [[c.row, c.col] for c in path]
+            result['cost'] = sum(c.weight for c in path[1:])
+    finally:
+        graph.clear(clear_walls=False)
+
+    return result
+
+
+def run_queries(map_file, queries, processes=None, chunksize=16,
+                landmarks_file=None, stats=False, trace=False):
+    """
+    Run "queries" (an iterable of query dictionaries) against
+    the map loaded from "map_file" on a pool of "processes" workers.
+    Results are yielded in the order of queries as they're ready.
+    If "landmarks_file" is given, ALT walkers use landmarks from it
+    (the file is created first if it doesn't exist). "stats" and
+    "trace" are passed to run_query().
+    """
+    global _graph, _probe_opts
+    _probe_opts = {'stats': stats, 'trace': trace}
+    _graph = load_map(map_file)
+    if landmarks_file is not None:
+        if not os.path.exists(landmarks_file):
+            save_landmarks([LandmarkTable.build(_graph, use_diags)
+                            for use_diags in (False, True)],
+                           landmarks_file)
+        _load_landmarks(_graph, landmarks_file)
+
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (map_file, landmarks_file, _probe_opts))
+    try:
+        for result in pool.imap(_run_query, queries, chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def read_queries(fobj):
+    """
+    Parse JSON lines queries from the file object, lines that
+    aren't JSON objects are yielded as BadQuery()
+    """
+    for num, line in enumerate(fobj):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            query = json.loads(line)
+        except ValueError as err:
+            yield BadQuery("line %d: %s" % (num + 1, err))
+            continue
+
+        if isinstance(query, dict):
+            yield query
+        else:
+            yield BadQuery("line %d: not a JSON object" % (num + 1))
+
+
+def _checked_point(graph, point):
+    row, col = [int(i) for i in point]
+    if not (0 <= row < graph.get_rows() and 0 <= col < graph.get_cols()):
+        raise ValueError("[%d, %d] is out of the map" % (row, col))
+    if graph.get_cell(row, col).status == CellStatus.Blocked:
+        raise ValueError("[%d, %d] is a wall" % (row, col))
+
+    return row, col
+
+
+def _load_landmarks(graph, landmarks_file):
+    for table in load_landmarks(landmarks_file):
+        set_landmarks(graph, table)
+
+
+def _init_worker(map_file, landmarks_file, probe_opts):
+    global _graph, _probe_opts
+    _probe_opts = probe_opts
+    if _graph is None:
+        _graph = load_map(map_file)
+        if landmarks_file is not None:
+            _load_landmarks(_graph, landmarks_file)
+
+
+def _run_query(query):
+    return run_query(_graph, query, **_probe_opts)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run shortest path queries without visualisation")
+    parser.add_argument('map', help="map file (text, binary or Moving AI)")
+    parser.add_argument('queries', nargs='?', default='-',
+                        help="JSON lines queries file or Moving AI "
+                        "scenario (default: stdin)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="results file (default: stdout)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes "
+                        "(default: number of CPUs)")
+    parser.add_argument('--landmarks', metavar='FILE',
+                        help="landmarks for ALT queries, "
+                        "built and saved to FILE if it doesn't exist")
+    parser.add_argument('--stats', action='store_true',
+                        help="add search counters and timings to results")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="save a Chrome trace of all the queries "
+                        "to FILE")
+    opts = parser.parse_args(args)
+
+    ofile = sys.stdout if opts.output == '-' else open(opts.output, 'w')
+    try:
+        if opts.queries == '-':
+            queries = read_queries(sys.stdin)
+        elif opts.queries.endswith('.scen'):
+            queries = load_moving_ai_scen(opts.queries)
+        else:
+            queries = read_queries(open(opts.queries))
+
+        events = []
+        for result in run_queries(opts.map, queries,
+                                  processes=opts.jobs,
+                                  landmarks_file=opts.landmarks,
+                                  stats=opts.stats,
+                                  trace=opts.trace is not None):
+            events.extend(result.pop('trace', ()))
+            ofile.write(json.dumps(result) + '\n')
+            ofile.flush()
+
+        if opts.trace is not None:
+            save_trace(events, opts.trace)
+    except (IOError, ValueError) as err:
+        sys.stderr.write("Error: " + str(err) + "\n")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+"""
+Benchmark suite for walkers.
+
+Builds seeded maps of different kinds and sizes, runs every selected
+walker with and without diagonal moves from the top left to the bottom
+right corner and writes a JSON report with wall time, expanded nodes,
+peak open set size and peak RSS of every run. Every run happens in its
+own process, so peak RSS values don't leak from one run to another.
+
+Two reports can be compared with "--compare OLD NEW", which prints
+runs that got slower or expanded more nodes.
+"""
+
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import multiprocessing
+from core import *
+from walkers import WALKERS
+
+DEFAULT_SIZES = [64, 128, 256, 512, 1024, 2048, 4096]
+DEFAULT_SEED = 42
+DEFAULT_TIMEOUT = 600  # seconds per run
+REGRESSION_THRESHOLD = 0.1  # 10%
+
+
+def make_empty_map(size, rnd):
+    """A map without walls and weights"""
+    return GridGraph(size, size)
+
+
+def make_random_map(size, rnd, density=0.25):
+    """A map where every cell is a wall with given probability"""
+    graph = GridGraph(size, size)
+    for idx in xrange(0, graph.get_size()):
+        if rnd.random() < density:
+            graph.set_status(idx, CellStatus.Blocked)
+
+    return graph
+
+
+def make_maze_map(size, rnd):
+    """
+    A perfect maze built by randomized depth first search.
+    Passages are one cell wide, so are walls.
+    """
+    graph = GridGraph(size, size)
+    for idx in xrange(0, graph.get_size()):
+        graph.set_status(idx, CellStatus.Blocked)
+
+    # Cells with even coordinates are maze "rooms",
+    # cells between them are either walls or passages.
+    def open_cell(row, col):
+        graph.set_status(graph.get_index(row, col), CellStatus.NotVisited)
+
+    open_cell(0, 0)
+    stack = [(0, 0)]
+    while stack:
+        row, col = stack[-1]
+        nexts = [(row + dr, col + dc)
+                 for dr, dc in ((-2, 0), (2, 0), (0, -2), (0, 2))
+                 if (0 <= row + dr < size and 0 <= col + dc < size and
+                     graph.get_status(graph.get_index(row + dr, col + dc))
+                     == CellStatus.Blocked)]
+        if not nexts:
+            stack.pop()
+            continue
+
+        nrow, ncol = rnd.choice(nexts)
+        open_cell((row + nrow) / 2, (col + ncol) / 2)
+        open_cell(nrow, ncol)
+        stack.append((nrow, ncol))
+
+    # Make sure the bottom right corner is reachable
+    # when size is even.
+    last = size - 1
+    if last % 2:
+        open_cell(last - 1, last)
+        open_cell(last, last)
+
+    return graph
+
+
+def make_weighted_map(size, rnd, density=0.1):
+    """A map with random walls and rectangular weighted regions"""
+    graph = make_random_map(size, rnd, density)
+    for _ in xrange(0, max(1, size / 8)):
+        weight = rnd.choice([1, 2, 3])
+        top = rnd.randrange(size)
+        left = rnd.randrange(size)
+        height = rnd.randrange(1, max(2, size / 4))
+        width = rnd.randrange(1, max(2, size / 4))
+        for row in xrange(top, min(top + height, size)):
+            for col in xrange(left, min(left + width, size)):
+                graph.set_weight(graph.get_index(row, col), weight)
+
+    return graph
+
+
+MAPS = {
+    'empty': make_empty_map,
+    'random': make_random_map,
+    'maze': make_maze_map,
+    'weighted': make_weighted_map
+}
+
+
+def build_map(kind, size, seed):
+    rnd = random.Random("%s-%s-%s" % (kind, size, seed))
+    graph = MAPS[kind](size, rnd)
+    for idx in (0, graph.get_size() - 1):
+        graph.set_status(idx, CellStatus.NotVisited)
+
+    return graph
+
+
+def run_case(kind, size, seed, wname, use_diags):
+    """
+    Build the map and run a single walker on it.
+    Return a dictionary with measurements.
+    """
+    graph = build_map(kind, size, seed)
+    src = graph.get_cell(0, 0)
+    dst = graph.get_cell(size - 1, size - 1)
+
+    start = time.time()
+    walker = WALKERS[wname](graph, src, dst, use_diags)
+    walker.advance()
+    path = walker.get_path()
+    elapsed = time.time() - start
+
+    found = len(path) > 1
+    return {
+        'time': elapsed,
+        'expansions': graph.count_status(CellStatus.Visited),
+        'peak_open': walker.queue_stats().get('peak_size'),
+        'path_length': len(path) if found else None,
+        'path_cost': sum(c.weight for c in path[:-1]) if found else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def _case_process(conn, args):
+    try:
+        conn.send(run_case(*args))
+    except Exception as err:
+        conn.send({'error': "%s: %s" % (type(err).__name__, err)})
+    finally:
+        conn.close()
+
+
+def run_isolated(args, timeout):
+    """Run run_case(*args) in a separate process"""
+    rconn, wconn = multiprocessing.Pipe(False)
+    proc = multiprocessing.Process(target=_case_process, args=(wconn, args))
+    proc.start()
+    wconn.close()
+    if rconn.poll(timeout):
+        result = rconn.recv()
+    else:
+        result = {'error': 'timeout'}
+
+    proc.terminate()
+    proc.join()
+    return result
+
+
+def run_suite(sizes, kinds, wnames, seed, timeout, log=None):
+    results = []
+    for size in sizes:
+        for kind in kinds:
+            for wname in wnames:
+                for use_diags in (False, True):
+                    res = {'map': kind, 'size': size, 'walker': wname,
+                           'diagonals': use_diags}
+                    res.update(run_isolated((kind, size, seed, wname,
+                                             use_diags), timeout))
+                    results.append(res)
+                    if log is None:
+                        continue
+
+                    log.write("%(map)s %(size)s %(walker)s "
+                              "diagonals=%(diagonals)s: " % res)
+                    if 'error' in res:
+                        log.write("%s\n" % res['error'])
+                    else:
+                        log.write("%.3fs\n" % res['time'])
+
+    return {
+        'meta': {
+            'seed': seed,
+            'timeout': timeout,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results': results
+    }
+
+
+def compare_reports(old, new, threshold=REGRESSION_THRESHOLD):
+    """
+    Get a list of (case name, metric, old value, new value)
+    tuples for metrics that got worse by more than "threshold".
+    """
+    def key(res):
+        return (res['map'], res['size'], res['walker'], res['diagonals'])
+
+    old_results = {key(r): r for r in old['results']}
+    regressions = []
+    for res in new['results']:
+        ores = old_results.get(key(res))
+        if ores is None:
+            continue
+
+        name = "%s %s %s diagonals=%s" % key(res)
+        if 'error' in res and 'error' not in ores:
+            regressions.append((name, 'error', None, res['error']))
+            continue
+
+        for metric in ('time', 'expansions', 'peak_open', 'peak_rss_kb',
+                       'path_cost'):
+            oval = ores.get(metric)
+            nval = res.get(metric)
+            if oval is None or nval is None:
+                continue
+            if nval > oval * (1 + threshold):
+                regressions.append((name, metric, oval, nval))
+
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark walkers")
+    parser.add_argument('-s', '--sizes', type=int, nargs='+',
+                        default=DEFAULT_SIZES, help="map sizes")
+    parser.add_argument('-m', '--maps', nargs='+', default=sorted(MAPS),
+                        choices=sorted(MAPS), help="map kinds")
+    parser.add_argument('-w', '--walkers', nargs='+',
+                        default=sorted(WALKERS), choices=sorted(WALKERS),
+                        help="walkers to run")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help="max seconds per run")
+    parser.add_argument('-o', '--output', default='-',
+                        help="report file (default: stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two reports instead of running")
+    opts = parser.parse_args(args)
+
+    if opts.compare:
+        with open(opts.compare[0]) as f:
+            old = json.load(f)
+        with open(opts.compare[1]) as f:
+            new = json.load(f)
+
+        regressions = compare_reports(old, new)
+        for name, metric, oval, nval in regressions:
+            print "%s: %s %s -> %s" % (name, metric, oval, nval)
+        sys.exit(1 if regressions else 0)
+
+    report = run_suite(opts.sizes, opts.maps, opts.walkers, opts.seed,
+                       opts.timeout, log=sys.stderr)
+    out = sys.stdout if opts.output == '-' else open(opts.output, 'w')
+    json.dump(report, out, indent=1, sort_keys=True)
+    out.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+"""
+Equivalence check of core.ChunkedGridGraph against core.GridGraph.
+
+Builds the same seeded maps (random walls and weights) in both kinds
+of graphs, with so few tiles kept unpacked that most of them are
+packed and unpacked on the way, and runs every walker with and without
+diagonal moves from the top left to the bottom right corner on both.
+Arrays, checksums, weights and status counts of the maps and paths,
+statuses and parents of all the cells left by every search must be
+the same. Prints the first difference and exits with 1 if there's one.
+"""
+
+import sys
+import random
+import argparse
+from core import *
+from walkers import WALKERS
+
+DEFAULT_SEEDS = 3
+DEFAULT_MAX_TILES = 4
+
+
+class Mismatch(Exception):
+    pass
+
+
+def build_map(gclass, rows, cols, seed, **kwargs):
+    """A map with random walls and weights made of the seed"""
+    graph = gclass(rows, cols, **kwargs)
+    rnd = random.Random(seed)
+    for idx in xrange(0, rows * cols):
+        x = rnd.random()
+        if x < 0.2:
+            graph.set_status(idx, CellStatus.Blocked)
+        elif x < 0.3:
+            graph.set_weight(idx, rnd.choice([1, 2, 3, 7]))
+
+    for idx in (0, rows * cols - 1):
+        graph.set_status(idx, CellStatus.NotVisited)
+
+    return graph
+
+
+def search_state(graph, wclass, use_diags):
+    """
+    Run the walker on the graph, get indices of the path cells,
+    statuses and parents of all the cells.
+    """
+    graph.clear(clear_walls=False)
+    walker = wclass(graph, graph.get_cell(0, 0),
+                    graph.get_cell(graph.get_rows() - 1,
+                                   graph.get_cols() - 1), use_diags)
+    walker.advance()
+    path = [cell.index for cell in walker.get_path()]
+    walker.close()
+    size = graph.get_size()
+    return (path, [graph.get_status(idx) for idx in xrange(0, size)],
+            [graph.get_parent(idx) for idx in xrange(0, size)])
+
+
+def check_same(what, expected, got):
+    if expected != got:
+        raise Mismatch("%s differ" % what)
+
+
+def check_maps(grid, chunked):
+    check_same("arrays", grid.get_arrays(), chunked.get_arrays())
+    # Checksums of chunked graphs are computed another way
+    check_same("checksums", grid.checksum(),
+               chunked.to_grid_graph().checksum())
+    check_same("weights", (grid.min_weight(), grid.max_weight()),
+               (chunked.min_weight(), chunked.max_weight()))
+    check_same("status counts",
+               [grid.count_status(s) for s in xrange(0, 4)],
+               [chunked.count_status(s) for s in xrange(0, 4)])
+
+
+def check_seed(seed, walkers, max_tiles, log=None):
+    rows, cols = 70 + seed * 23, 150 + seed * 11
+    grid = build_map(GridGraph, rows, cols, seed)
+    chunked = build_map(ChunkedGridGraph, rows, cols, seed,
+                        max_tiles=max_tiles)
+    check_maps(grid, chunked)
+    for wname in walkers:
+        for use_diags in (False, True):
+            expected = search_state(grid, WALKERS[wname], use_diags)
+            got = search_state(chunked, WALKERS[wname], use_diags)
+            what = "%dx%d map, seed %d, %s%s:" % (
+                rows, cols, seed, wname, " with diagonals" * use_diags)
+            check_same(what + " paths", expected[0], got[0])
+            check_same(what + " statuses", expected[1], got[1])
+            check_same(what + " parents", expected[2], got[2])
+            check_same(what + " status counts",
+                       [grid.count_status(s) for s in xrange(0, 4)],
+                       [chunked.count_status(s) for s in xrange(0, 4)])
+
+    if log is not None:
+        log.write("seed %d: %dx%d, %s\n" % (seed, rows, cols,
+                                            chunked.tile_stats()))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Check that walkers work the same way on "
+                    "ChunkedGridGraph and GridGraph")
+    parser.add_argument('-s', '--seeds', type=int, default=DEFAULT_SEEDS,
+                        help="number of maps to check")
+    parser.add_argument('-w', '--walkers', nargs='+',
+                        choices=sorted(WALKERS.keys()),
+                        default=sorted(WALKERS.keys()),
+                        help="walkers to run")
+    parser.add_argument('--max-tiles', type=int, default=DEFAULT_MAX_TILES,
+                        help="unpacked tiles of chunked graphs")
+    opts = parser.parse_args(args)
+
+    try:
+        for seed in xrange(0, opts.seeds):
+            check_seed(seed, opts.walkers, opts.max_tiles, log=sys.stderr)
+    except Mismatch as err:
+        sys.stderr.write("%s\n" % err)
+        sys.exit(1)
+
+    sys.stderr.write("OK\n")
+
+
+if __name__ == '__main__':
+    main()
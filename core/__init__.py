@@ -1,3 +1,5 @@
 from cell import *
 from gridgraph import *
+from chunkedgraph import *
 from config import *
+from mapio import *
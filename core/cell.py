@@ -1,62 +1,88 @@
-from core.config import DEFAULT_CELL_WEIGHT
-
-
 class CellStatus:
-    NotVisited = "NotVisited"
-    Discovered = "Discovered"
-    Visited = "Visited"
-    Blocked = "Blocked"
+    # Statuses are small integers, so GridGraph() can keep
+    # them in a compact typed array.
+    NotVisited = 0
+    Discovered = 1
+    Visited = 2
+    Blocked = 3
 
 
 class Cell(object):
     """
-    A cell of the GraphGrid()
+    A cell of the GraphGrid().
+    Cell() doesn't keep any state itself, it's just a thin view
+    over the arrays of the graph it belongs to.
     """
 
+    __slots__ = ('_graph', '_idx', 'row', 'col')
+
     def __init__(self, graph, row, col):
         """
         Make a cell of a GridGraph "graph" at
         given row and column ("col").
         """
         self._graph = graph
+        self._idx = graph.get_index(row, col)
         self.row = row
         self.col = col
-        self.parent = None
-        self.status = CellStatus.NotVisited
-        self.weight = DEFAULT_CELL_WEIGHT
 
     def __str__(self):
         return ("([%s, %s], w: %s, status: %s)" %
                 (self.row, self.col, self.weight, self.status))
 
+    def __eq__(self, other):
+        return (isinstance(other, Cell) and self._idx == other._idx
+                and self._graph is other._graph)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return self._idx
+
+    @property
+    def index(self):
+        """Index of the cell in the arrays of the graph"""
+        return self._idx
+
+    @property
+    def status(self):
+        return self._graph.get_status(self._idx)
+
+    @status.setter
+    def status(self, status):
+        self._graph.set_status(self._idx, status)
+
+    @property
+    def weight(self):
+        return self._graph.get_weight(self._idx)
+
+    @weight.setter
+    def weight(self, weight):
+        self._graph.set_weight(self._idx, weight)
+
+    @property
+    def parent(self):
+        pidx = self._graph.get_parent(self._idx)
+        if pidx < 0:
+            return None
+
+        return self._graph.get_cell_by_index(pidx)
+
+    @parent.setter
+    def parent(self, cell):
+        self._graph.set_parent(self._idx, -1 if cell is None else cell._idx)
+
     def neighbours(self, diagonals=False):
         """
         Get a list of neighbours of the given cell.
         If "diagonals" is Flase, get neighbours in 4-neighbourhood,
         otherwise get neighbours from 8-neighbourhood.
         NOTE: Cells with "Blocked" status are ignored.
+        NOTE: Walkers should rather iterate over neighbours' indices
+        with GridGraph.neighbour_mask() and neighbour_deltas().
         """
-        def valid_coordinate(coord):
-            return ((coord[0] >= 0 and coord[0] < self._graph.get_rows())
-                    and (coord[1] >= 0 and coord[1] < self._graph.get_cols()))
-
-        if diagonals:
-            neighbours = [(self.row + rd, self.col + cd)
-                          for rd in (1, 0, -1)
-                          for cd in (1, 0, -1) if (rd != 0 or cd != 0)]
-        else:
-            neighbours = ([(self.row + rd, self.col) for rd in (-1, 1)] +
-                          [(self.row, self.col + cd) for cd in (-1, 1)])
-
-        ret = []
-        for n in neighbours:
-            if not valid_coordinate(n):
-                continue
-
-            cell = self._graph.get_cell(n[0], n[1])
-            if cell.status == CellStatus.Blocked:
-                continue
-
-            ret.append(cell)
-
-        return ret
+        graph = self._graph
+        deltas = graph.neighbour_deltas(diagonals)
+        return [graph.get_cell_by_index(self._idx + d)
+                for d in deltas[graph.neighbour_mask(self._idx)]]
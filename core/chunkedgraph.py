@@ -0,0 +1,454 @@
+import zlib
+import struct
+from array import array
+from collections import OrderedDict
+from core.cell import CellStatus
+from core.config import DEFAULT_CELL_WEIGHT
+from core.gridgraph import (BaseGridGraph, GridGraph, MAX_EPOCH,
+                            NEIGHBOUR_OFFSETS)
+
+# Tiles are TILE_SIZE x TILE_SIZE squares of cells
+TILE_BITS = 6
+TILE_SIZE = 1 << TILE_BITS
+TILE_MASK = TILE_SIZE - 1
+TILE_CELLS = TILE_SIZE * TILE_SIZE
+
+# Max number of tiles kept unpacked, each takes about 13 bytes per cell
+MAX_MATERIALISED_TILES = 1024
+
+_TILE_KEY = struct.Struct('<Q')
+
+# Arrays of a new tile, copied by slicing
+_NEW_WEIGHTS = array('H', [DEFAULT_CELL_WEIGHT]) * TILE_CELLS
+_NEW_WALLS = array('b', [CellStatus.NotVisited]) * TILE_CELLS
+# Indices of huge maps don't fit in 32 bits
+_NEW_PARENTS = array('l', [-1]) * TILE_CELLS
+_NEW_STAMPS = array('I', [0]) * TILE_CELLS
+_NEW_MAP = _NEW_WEIGHTS.tostring() + _NEW_WALLS.tostring()
+
+
+class _Tile(object):
+    """
+    Arrays of a tile, indexed by "row * TILE_SIZE + col" within the
+    tile. "blocked" and "weighted" are numbers of walls and cells
+    that don't have the default weight.
+    """
+
+    __slots__ = ('weights', 'walls', 'masks', 'statuses', 'parents',
+                 'stamps', 'blocked', 'weighted')
+
+
+class ChunkedGridGraph(BaseGridGraph):
+    """
+    A grid graph for huge, mostly empty maps: cells are kept in tiles
+    of TILE_SIZE x TILE_SIZE cells, which are made only when one of
+    their cells becomes a wall, gets a weight other than the default
+    one or gets a status or a parent from a walker. Reading cells of
+    tiles that don't exist costs nothing: they're free, have the
+    default weight and no search state.
+
+    At most "max_tiles" tiles are kept unpacked in arrays. The least
+    recently used ones are packed (zlib compressed), or dropped if
+    there's nothing left in them but stale search state, and unpacked
+    again on access. The search state is stamped with epochs like in
+    GridGraph(), so clear(False) doesn't touch the tiles at all.
+
+    Walkers keeping arrays of their own for every cell (flow fields,
+    ALT landmarks, HPA* clusters and wavefronts) still need as much
+    memory as the whole map, while A* with friends need memory for the
+    cells they touch only. get_arrays() makes flat copies of the map.
+    """
+
+    def __init__(self, rows, cols, max_tiles=MAX_MATERIALISED_TILES):
+        super(ChunkedGridGraph, self).__init__(rows, cols)
+        self._max_tiles = max(max_tiles, 4)
+        self._tile_cols = (cols + TILE_MASK) >> TILE_BITS
+        # Unpacked tiles by key ("tile row * tile cols + tile col"),
+        # the least recently used goes first
+        self._tiles = OrderedDict()
+        # Packed tiles by key, see _pack()
+        self._packed = {}
+        # The last tile looked up (None if it doesn't exist), saves
+        # reordering _tiles while a walker stays in the same tile
+        self._last_key = -1
+        self._last_tile = None
+        self._last_template = None
+        # Neighbour masks of tiles without walls by their shapes
+        self._templates = {}
+
+        # Numbers of cells by weight, but the default one
+        self._weight_counts = {}
+        self._epoch = 1
+
+    def get_status(self, idx):
+        tile, off = self._find(idx)
+        if tile is None:
+            return CellStatus.NotVisited
+        if tile.stamps[off] == self._epoch:
+            return tile.statuses[off]
+
+        return tile.walls[off]
+
+    def set_status(self, idx, status):
+        tile, off = self._find(idx, create=True)
+        if tile.stamps[off] == self._epoch:
+            old_status = tile.statuses[off]
+        else:
+            old_status = tile.walls[off]
+            tile.stamps[off] = self._epoch
+            tile.parents[off] = -1
+
+        tile.statuses[off] = status
+        if old_status == status:
+            return
+
+        counts = self._counts
+        counts[old_status] -= 1
+        counts[status] += 1
+        if self._dirty is not None:
+            self._dirty.add(idx)
+        if ((old_status == CellStatus.Blocked) !=
+                (status == CellStatus.Blocked)):
+            blocked = (status == CellStatus.Blocked)
+            tile.walls[off] = (CellStatus.Blocked if blocked
+                               else CellStatus.NotVisited)
+            tile.blocked += 1 if blocked else -1
+            # The tile may be packed by patching its neighbours
+            self._patch_adjacency(idx, blocked)
+            self._notify_listeners(idx)
+        elif self._recorder is not None:
+            self._recorder.set_status(idx, status)
+
+    def get_weight(self, idx):
+        tile, off = self._find(idx)
+        if tile is None:
+            return DEFAULT_CELL_WEIGHT
+
+        return tile.weights[off]
+
+    def set_weight(self, idx, weight):
+        old_weight = self.get_weight(idx)
+        if old_weight == weight:
+            return
+
+        tile, off = self._find(idx, create=True)
+        tile.weights[off] = weight
+        counts = self._weight_counts
+        if old_weight == DEFAULT_CELL_WEIGHT:
+            tile.weighted += 1
+        elif counts[old_weight] == 1:
+            del counts[old_weight]
+        else:
+            counts[old_weight] -= 1
+        if weight == DEFAULT_CELL_WEIGHT:
+            tile.weighted -= 1
+        else:
+            counts[weight] = counts.get(weight, 0) + 1
+
+        if self._dirty is not None:
+            self._dirty.add(idx)
+        self._notify_listeners(idx)
+
+    def min_weight(self):
+        return min(self._weights_present())
+
+    def max_weight(self):
+        return max(self._weights_present())
+
+    def get_parent(self, idx):
+        tile, off = self._find(idx)
+        if tile is not None and tile.stamps[off] == self._epoch:
+            return tile.parents[off]
+
+        return -1
+
+    def set_parent(self, idx, pidx):
+        tile, off = self._find(idx, create=True)
+        if tile.stamps[off] != self._epoch:
+            tile.stamps[off] = self._epoch
+            tile.statuses[off] = tile.walls[off]
+        tile.parents[off] = pidx
+        if self._recorder is not None:
+            self._recorder.set_parent(idx, pidx)
+
+    def neighbour_mask(self, idx):
+        tile, off = self._find(idx)
+        if tile is None:
+            # There are no walls around, or the tile would exist
+            return self._last_template[off]
+
+        return tile.masks[off]
+
+    def checksum(self):
+        """
+        Get a checksum of walls and weights of the graph (statuses and
+        parents left by searches don't count). It's not comparable
+        with checksums of GridGraph().
+        """
+        crc = zlib.crc32(struct.pack('<QQ', self._rows, self._cols))
+        for key in sorted(set(self._tiles) | set(self._packed)):
+            tile = self._tiles.get(key)
+            if tile is not None:
+                if not tile.blocked and not tile.weighted:
+                    continue
+                raw = tile.weights.tostring() + tile.walls.tostring()
+            else:
+                packed = self._packed[key]
+                if not packed[0]:
+                    continue
+                raw = zlib.decompress(packed[1])[:TILE_CELLS * 3]
+                if raw == _NEW_MAP:
+                    continue
+
+            crc = zlib.crc32(raw, zlib.crc32(_TILE_KEY.pack(key), crc))
+
+        return crc & 0xFFFFFFFF
+
+    def get_arrays(self):
+        """
+        Get (weights, walls, masks) arrays of the whole map, copied
+        into flat arrays, see to_grid_graph().
+        """
+        return self.to_grid_graph().get_arrays()
+
+    def to_grid_graph(self):
+        """Make a GridGraph() of the same map (without the search state)"""
+        rows, cols = self._rows, self._cols
+        weights = array('H', [DEFAULT_CELL_WEIGHT]) * (rows * cols)
+        walls = array('b', [CellStatus.NotVisited]) * (rows * cols)
+        for key in list(self._tiles) + list(self._packed):
+            # Peek without reordering tiles
+            tile = self._tiles.get(key)
+            if tile is None:
+                tile = self._unpack(self._packed[key])
+            if not tile.blocked and not tile.weighted:
+                continue
+
+            top, left = self._tile_origin(key)
+            width = min(TILE_SIZE, cols - left)
+            for row in xrange(0, min(TILE_SIZE, rows - top)):
+                start = (top + row) * cols + left
+                toff = row * TILE_SIZE
+                weights[start:start + width] = tile.weights[toff:toff + width]
+                walls[start:start + width] = tile.walls[toff:toff + width]
+
+        return GridGraph(rows, cols, weights, walls)
+
+    def tile_areas(self, top, left, bottom, right):
+        """
+        Get (top, left, bottom, right) of the parts of tiles inside the
+        area of rows from "top" to "bottom" and columns from "left" to
+        "right" (the last ones not included). Cells outside of them
+        are free, have the default weight and no search state.
+        """
+        areas = []
+        for key in sorted(set(self._tiles) | set(self._packed)):
+            row, col = self._tile_origin(key)
+            if (row < bottom and row + TILE_SIZE > top and
+                    col < right and col + TILE_SIZE > left):
+                areas.append((max(row, top), max(col, left),
+                              min(row + TILE_SIZE, bottom),
+                              min(col + TILE_SIZE, right)))
+
+        return areas
+
+    def tile_stats(self):
+        """Get numbers of unpacked and packed tiles"""
+        return {'tiles': len(self._tiles), 'packed': len(self._packed)}
+
+    def clear(self, clear_walls=True):
+        if self._dirty is not None:
+            self._all_dirty = True
+        if self._recorder is not None:
+            self._recorder.reset()
+
+        self._last_key = -1
+        self._last_tile = None
+        if clear_walls:
+            self._tiles.clear()
+            self._packed.clear()
+            self._weight_counts.clear()
+            self._counts = [self.get_size(), 0, 0, 0]
+            self._notify_listeners(None)
+            return
+
+        if self._epoch == MAX_EPOCH:
+            # Stamps would overflow, forget all the search state
+            self._epoch = 0
+            for tile in self._tiles.itervalues():
+                tile.stamps = _NEW_STAMPS[:]
+            for key, packed in self._packed.items():
+                self._packed[key] = packed[:2] + (0, None)
+        self._epoch += 1
+        # Walls stay
+        blocked = self._counts[CellStatus.Blocked]
+        self._counts = [self.get_size() - blocked, 0, 0, blocked]
+
+        # Tiles made for the search aren't needed anymore
+        for key, tile in self._tiles.items():
+            if self._is_empty(key, tile):
+                del self._tiles[key]
+        for key, packed in self._packed.items():
+            if not packed[0]:
+                del self._packed[key]
+
+    def _find(self, idx, create=False):
+        """
+        Get (tile, offset) of the cell, the tile is None if it doesn't
+        exist, unless "create" is True.
+        """
+        row, col = divmod(idx, self._cols)
+        key = (row >> TILE_BITS) * self._tile_cols + (col >> TILE_BITS)
+        off = ((row & TILE_MASK) << TILE_BITS) | (col & TILE_MASK)
+        if key != self._last_key:
+            self._last_tile = self._get_tile(key)
+            self._last_key = key
+            if self._last_tile is None:
+                self._last_template = self._template(key)
+        if self._last_tile is None and create:
+            self._last_tile = self._make_tile(key)
+
+        return self._last_tile, off
+
+    def _get_tile(self, key):
+        """Get the tile unpacking it if it's packed, None if there's none"""
+        tile = self._tiles.pop(key, None)
+        if tile is None:
+            packed = self._packed.pop(key, None)
+            if packed is None:
+                return None
+
+            tile = self._unpack(packed)
+
+        # The most recently used tile goes last
+        self._tiles[key] = tile
+        self._evict()
+        return tile
+
+    def _make_tile(self, key):
+        tile = _Tile()
+        tile.weights = _NEW_WEIGHTS[:]
+        tile.walls = _NEW_WALLS[:]
+        # Without walls in the tile there are none around it either,
+        # otherwise the tile would have been made to patch its masks.
+        tile.masks = self._template(key)[:]
+        tile.statuses = _NEW_WALLS[:]
+        tile.parents = _NEW_PARENTS[:]
+        tile.stamps = _NEW_STAMPS[:]
+        tile.blocked = tile.weighted = 0
+        self._tiles[key] = tile
+        self._evict()
+        return tile
+
+    def _evict(self):
+        """Pack least recently used tiles while there are too many"""
+        tiles = self._tiles
+        while len(tiles) > self._max_tiles:
+            key, tile = tiles.popitem(last=False)
+            if key == self._last_key:
+                self._last_key = -1
+                self._last_tile = None
+            if not self._is_empty(key, tile):
+                self._packed[key] = self._pack(key, tile)
+
+    def _is_empty(self, key, tile):
+        """Check if the tile is of no use anymore"""
+        return (not tile.blocked and not tile.weighted and
+                self._epoch not in tile.stamps and
+                tile.masks == self._template(key))
+
+    def _pack(self, key, tile):
+        """
+        Get a tuple of (True if the tile keeps a part of the map, map
+        data, epoch, search state), the data is compressed arrays.
+        """
+        has_map = bool(tile.blocked or tile.weighted or
+                       tile.masks != self._template(key))
+        data = zlib.compress(tile.weights.tostring() + tile.walls.tostring() +
+                             tile.masks.tostring(), 1)
+        if self._epoch in tile.stamps:
+            search = zlib.compress(tile.statuses.tostring() +
+                                   tile.parents.tostring() +
+                                   tile.stamps.tostring(), 1)
+            return (has_map, data, self._epoch, search)
+
+        return (has_map, data, 0, None)
+
+    def _unpack(self, packed):
+        has_map, data, epoch, search = packed
+        tile = _Tile()
+        raw = zlib.decompress(data)
+        tile.weights = array('H', raw[:TILE_CELLS * 2])
+        tile.walls = array('b', raw[TILE_CELLS * 2:TILE_CELLS * 3])
+        tile.masks = array('B', raw[TILE_CELLS * 3:])
+        tile.blocked = tile.walls.count(CellStatus.Blocked)
+        tile.weighted = TILE_CELLS - tile.weights.count(DEFAULT_CELL_WEIGHT)
+        if search is not None and epoch == self._epoch:
+            raw = zlib.decompress(search)
+            end = TILE_CELLS * (1 + _NEW_PARENTS.itemsize)
+            tile.statuses = array('b', raw[:TILE_CELLS])
+            tile.parents = array('l', raw[TILE_CELLS:end])
+            tile.stamps = array('I', raw[end:])
+        else:
+            tile.statuses = _NEW_WALLS[:]
+            tile.parents = _NEW_PARENTS[:]
+            tile.stamps = _NEW_STAMPS[:]
+
+        return tile
+
+    def _tile_origin(self, key):
+        """Get (row, col) of the top left cell of the tile"""
+        trow, tcol = divmod(key, self._tile_cols)
+        return trow << TILE_BITS, tcol << TILE_BITS
+
+    def _template(self, key):
+        """Get neighbour masks of the tile if it had no walls around"""
+        top, left = self._tile_origin(key)
+        # Only tiles on the borders of the map lack some neighbours
+        shape = (top == 0, left == 0,
+                 min(TILE_SIZE, self._rows - top),
+                 min(TILE_SIZE, self._cols - left),
+                 top + TILE_SIZE >= self._rows,
+                 left + TILE_SIZE >= self._cols)
+        masks = self._templates.get(shape)
+        if masks is not None:
+            return masks
+
+        height, width = shape[2], shape[3]
+        masks = array('B', [0]) * TILE_CELLS
+        for row in xrange(0, height):
+            for col in xrange(0, width):
+                mask = 0
+                for k, (dr, dc) in enumerate(NEIGHBOUR_OFFSETS):
+                    if (0 <= top + row + dr < self._rows and
+                            0 <= left + col + dc < self._cols):
+                        mask |= 1 << k
+                masks[row * TILE_SIZE + col] = mask
+
+        self._templates[shape] = masks
+        return masks
+
+    def _weights_present(self):
+        weights = self._weight_counts.keys()
+        if sum(self._weight_counts.itervalues()) < self.get_size():
+            weights.append(DEFAULT_CELL_WEIGHT)
+
+        return weights
+
+    def _patch_adjacency(self, idx, blocked):
+        """
+        Update masks of neighbours of the cell that became blocked or
+        not blocked, making tiles of the neighbours if needed.
+        """
+        row, col = divmod(idx, self._cols)
+        for k, (dr, dc) in enumerate(NEIGHBOUR_OFFSETS):
+            nrow, ncol = row + dr, col + dc
+            if not (0 <= nrow < self._rows and 0 <= ncol < self._cols):
+                continue
+
+            tile, off = self._find(nrow * self._cols + ncol, create=True)
+            bit = 1 << NEIGHBOUR_OFFSETS.index((-dr, -dc))
+            if blocked:
+                tile.masks[off] &= ~bit & 0xFF
+            else:
+                tile.masks[off] |= bit
@@ -1,6 +1,22 @@
 DEFAULT_FPS = 40
+# the share of a frame walker's steps may take at "Max" speed
+STEP_TIME_BUDGET = 0.5 / DEFAULT_FPS
+# max number of cells a background walker updates per frame
+SOLVER_EVENTS_PER_FRAME = 2000
 
 DEFAULT_SQ_SIZE = 20 # default cell (square) size on the grid
+# cell sizes (in pixels) the grid can be zoomed to, fractions
+# show several cells per pixel and must be 1/2, 1/4, etc.
+ZOOM_LEVELS = [0.125, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 40]
+MIN_BORDER_SQ_SIZE = 5 # smaller cells are drawn without borders
+PAN_SHARE = 0.25 # the share of the view arrow keys pan it by
+MIN_POINT_RADIUS = 3 # source and destination stay visible when zoomed out
+# when more cells than this share of the grid change in a frame,
+# the grid's image is recoloured at once instead of cell by cell
+IMAGE_REBUILD_SHARE = 1.0 / 64
+# grids of at least this many cells drawn from scratch
+# are kept in tiles, see ChunkedGridGraph()
+CHUNKED_GRAPH_MIN_CELLS = 1 << 24
 
 GRID_BG_COLOR = 'white' # grid foreground
 GRID_FG_COLOR = 'black' # grid background
@@ -10,10 +26,16 @@ VISITED_CELL_COLOR = 'yellow'
 BLOCKED_CELL_COLOR = 'gray'
 NOTVISITED_CELL_COLOR = 'white'
 WEIGHTED_CELL_COLOR = 'magenta'
+HEAT_NEAR_COLOR = 'lightyellow' # flow field heat map: the destination
+HEAT_FAR_COLOR = 'steelblue' # the farthest cells
+HEAT_LEVELS = 32
 
 SOURCE_POINT_COLOR = 'green'
 DESTINATION_POINT_COLOR = 'red'
 
+REPLAY_BAR_COLOR = 'blue' # progress of the search being replayed
+REPLAY_BAR_HEIGHT = 4
+
 PATH_LINE_COLOR = 'white'
 PATH_CELL_COLOR = 'orange'
 CELL_WEIGHT_COLOR = 'black'
@@ -33,6 +55,11 @@ REPORT_BG_COLOR = 'gray'
 DEFAULT_WALKER = 'A*'
 DEFAULT_BRUSH = 'Wall'
 DEFAULT_USE_DIAGS = True
+DEFAULT_SPEED = '1'
+DEFAULT_MAP_FILE = 'spdemo.spmap' # where maps drawn from scratch are saved
+DEFAULT_TRACE_FILE = 'spdemo-trace.json'
+DEFAULT_RECORDING_FILE = 'spdemo.sprec' # where searches are saved for replays
 
 DEFAULT_CELL_WEIGHT = 10
 DEFAULT_FONT = 'Arial'
+TEXT_CACHE_SIZE = 256 # max number of rendered strings kept
@@ -1,24 +1,79 @@
-from core.cell import Cell
+import zlib
+from array import array
+from core.cell import Cell, CellStatus
+from core.config import DEFAULT_CELL_WEIGHT
 
+# Search state of a cell is valid only if the cell's stamp equals the
+# current epoch of the graph. Stamps are unsigned 32 bit integers, the
+# stamps array is reset when the epoch would overflow.
+MAX_EPOCH = 0xFFFFFFFF
+
+# (row, col) offsets of neighbours, straight ones go first.
+# Bit "k" of a cell's neighbour mask is set if the cell has
+# a non-blocked neighbour at NEIGHBOUR_OFFSETS[k].
+NEIGHBOUR_OFFSETS = ((1, 0), (0, 1), (0, -1), (-1, 0),
+                     (1, 1), (1, -1), (-1, 1), (-1, -1))
+STRAIGHT_NEIGHBOURS_MASK = 0x0F
+_OPPOSITE_NEIGHBOUR = [NEIGHBOUR_OFFSETS.index((-dr, -dc))
+                       for dr, dc in NEIGHBOUR_OFFSETS]
+
+
+class BaseGridGraph(object):
+    """
+    The interface of grid graphs walkers work with. Cells are
+    identified by indices "row * cols + col", Cell() objects are
+    created on demand as views over the graph.
+
+    Every cell has a mask of its non-blocked neighbours. Together
+    with neighbour_deltas() it lets walkers iterate over neighbours'
+    indices without allocating anything:
+
+        deltas = graph.neighbour_deltas(diagonals)
+        for d in deltas[graph.neighbour_mask(idx)]:
+            nidx = idx + d
+
+    Anyone interested in edits of the map (i.e. walls and weights)
+    can subscribe to them with add_listener().
+
+    The graph can also record which cells changed their status or
+    weight (see track_dirty_cells()), so the visualisation redraws
+    only the cells a walker touched, and pass changes of the search
+    state to a recorder (see set_recorder()).
+
+    Subclasses keep the cells: GridGraph() in flat arrays,
+    ChunkedGridGraph() in tiles made only where they're needed.
+    """
 
-class GridGraph(object):
     def __init__(self, rows, cols):
-        """
-        Make a grid graph of "rows" rows and
-        "cols" columns
-        """
         self._rows = rows
         self._cols = cols
-        self._grid = []
-        for row in xrange(0, rows):
-            line = []
-            for col in xrange(0, cols):
-                line.append(Cell(self, row, col))
 
-            self._grid.append(line)
+        # For every possible neighbour mask, a tuple of index
+        # differences between the cell and its neighbours
+        deltas = [dr * cols + dc for dr, dc in NEIGHBOUR_OFFSETS]
+        self._deltas = [tuple(deltas[k] for k in xrange(0, 8)
+                              if mask & (1 << k))
+                        for mask in xrange(0, 256)]
+        self._straight_deltas = [self._deltas[mask & STRAIGHT_NEIGHBOURS_MASK]
+                                 for mask in xrange(0, 256)]
+
+        # Numbers of cells of every status, kept up to date by subclasses
+        self._counts = [rows * cols, 0, 0, 0]
+        self._listeners = []
+
+        # A set of changed cells' indices, None if changes aren't tracked
+        self._dirty = None
+        self._all_dirty = False
+        self._recorder = None
 
     def get_cell(self, row, col):
-        return self._grid[row][col]
+        return Cell(self, row, col)
+
+    def get_cell_by_index(self, idx):
+        return Cell(self, idx // self._cols, idx % self._cols)
+
+    def get_index(self, row, col):
+        return row * self._cols + col
 
     def get_size(self):
         return self._rows * self._cols
@@ -29,7 +84,359 @@ class GridGraph(object):
     def get_cols(self):
         return self._cols
 
+    def neighbour_deltas(self, diagonals=False):
+        """
+        Get a table mapping neighbour masks to tuples of index
+        differences between a cell and its neighbours.
+        """
+        return self._deltas if diagonals else self._straight_deltas
+
+    def add_listener(self, callback):
+        """
+        Call "callback(idx)" every time a cell at index "idx"
+        becomes blocked or unblocked or changes its weight,
+        and "callback(None)" when clear() resets all of them.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+    def track_dirty_cells(self, enabled=True):
+        """Start or stop recording cells that change"""
+        self._dirty = set() if enabled else None
+        self._all_dirty = False
+
+    def set_recorder(self, recorder):
+        """
+        Report changes of the search state to "recorder" (None stops
+        it): "recorder.set_status(idx, status)" when a cell changes
+        its status (but not when it becomes blocked or not blocked),
+        "recorder.set_parent(idx, pidx)" when its parent is set and
+        "recorder.reset()" when clear() resets all of them.
+        """
+        self._recorder = recorder
+
+    def mark_dirty(self, idx):
+        """Record the cell as changed, e.g. when it must be redrawn"""
+        if self._dirty is not None:
+            self._dirty.add(idx)
+
+    def pop_dirty_cells(self):
+        """
+        Get a set of indices of the cells that changed their status or
+        weight since the last call and forget about them. None means
+        the whole graph has been cleared and every cell may differ.
+        """
+        dirty = None if self._all_dirty else self._dirty
+        if self._dirty is not None:
+            self._dirty = set()
+        self._all_dirty = False
+        return dirty
+
+    def count_status(self, status):
+        """Get the number of cells having given status"""
+        return self._counts[status]
+
     def cells(self):
         for row in xrange(0, self._rows):
             for col in xrange(0, self._cols):
                 yield self.get_cell(row, col)
+
+    def get_status(self, idx):
+        raise NotImplementedError
+
+    def set_status(self, idx, status):
+        raise NotImplementedError
+
+    def get_weight(self, idx):
+        raise NotImplementedError
+
+    def set_weight(self, idx, weight):
+        raise NotImplementedError
+
+    def min_weight(self):
+        """Get the lowest weight of the graph's cells"""
+        raise NotImplementedError
+
+    def max_weight(self):
+        """Get the highest weight of the graph's cells"""
+        raise NotImplementedError
+
+    def get_parent(self, idx):
+        raise NotImplementedError
+
+    def set_parent(self, idx, pidx):
+        raise NotImplementedError
+
+    def neighbour_mask(self, idx):
+        """Get a mask of non-blocked neighbours of the cell"""
+        raise NotImplementedError
+
+    def checksum(self):
+        """
+        Get a checksum of walls and weights of the graph
+        (statuses and parents left by searches don't count)
+        """
+        raise NotImplementedError
+
+    def get_arrays(self):
+        """
+        Get (weights, walls, masks) arrays, the ones GridGraph()
+        can be made of. They must not be modified.
+        """
+        raise NotImplementedError
+
+    def clear(self, clear_walls=True):
+        """
+        Reset statuses and parents left by a search.
+        If "clear_walls" is True, walls and weights are reset too.
+        """
+        raise NotImplementedError
+
+    def _notify_listeners(self, idx):
+        for callback in self._listeners:
+            callback(idx)
+
+
+class GridGraph(BaseGridGraph):
+    """
+    A grid graph. Weights, statuses and parent links of all cells
+    are kept in flat typed arrays indexed by "row * cols + col",
+    Cell() objects are created on demand as views over them.
+
+    The graph also keeps a byte per cell with a mask of its non-blocked
+    neighbours, which is patched whenever a wall is drawn or removed.
+
+    Walls are kept apart from the search state (statuses set by walkers
+    and parent links), which is stamped with the epoch it was set in.
+    Resetting the search just starts a new epoch, so setting a search up
+    and clearing after it cost as much as the cells it touched rather
+    than the size of the graph.
+    """
+
+    def __init__(self, rows, cols, weights=None, walls=None, masks=None):
+        """
+        Make a grid graph of "rows" rows and "cols" columns.
+        All the cells have default weight and there are no walls unless
+        "weights" ('H' array) and "walls" (a 'b' array of statuses with
+        nothing but walls) are given. Loaders that keep neighbour masks
+        (see get_arrays()) can pass them as "masks" to save rebuilding.
+        """
+        super(GridGraph, self).__init__(rows, cols)
+        size = rows * cols
+        if weights is None:
+            weights = array('H', [DEFAULT_CELL_WEIGHT]) * size
+        if walls is None:
+            walls = array('b', [CellStatus.NotVisited]) * size
+        if not len(weights) == len(walls) == size:
+            raise ValueError("Arrays don't match %dx%d graph" % (rows, cols))
+
+        self._weights = weights
+        # Lowest and highest weights, None until asked for
+        self._min_weight = None
+        self._max_weight = None
+        # NotVisited or Blocked statuses of all the cells
+        self._walls = walls
+        # Numbers of cells of every status
+        self._counts = [0, 0, 0,
+                        walls.tostring().count(chr(CellStatus.Blocked))]
+        self._reset_search_state()
+
+        if masks is None:
+            self._build_adjacency()
+        else:
+            self._masks = masks
+
+    def get_status(self, idx):
+        if self._stamps[idx] == self._epoch:
+            return self._statuses[idx]
+
+        return self._walls[idx]
+
+    def set_status(self, idx, status):
+        old_status = self.get_status(idx)
+        self._touch(idx)
+        self._statuses[idx] = status
+        if old_status == status:
+            return
+
+        counts = self._counts
+        counts[old_status] -= 1
+        counts[status] += 1
+        if self._dirty is not None:
+            self._dirty.add(idx)
+        if ((old_status == CellStatus.Blocked) !=
+                (status == CellStatus.Blocked)):
+            blocked = (status == CellStatus.Blocked)
+            self._walls[idx] = (CellStatus.Blocked if blocked
+                                else CellStatus.NotVisited)
+            self._patch_adjacency(idx, blocked)
+            self._notify_listeners(idx)
+        elif self._recorder is not None:
+            self._recorder.set_status(idx, status)
+
+    def get_weight(self, idx):
+        return self._weights[idx]
+
+    def set_weight(self, idx, weight):
+        old_weight = self._weights[idx]
+        self._weights[idx] = weight
+        if old_weight != weight:
+            if self._min_weight is not None:
+                if weight < self._min_weight:
+                    self._min_weight = weight
+                elif old_weight == self._min_weight:
+                    self._min_weight = None
+            if self._max_weight is not None:
+                if weight > self._max_weight:
+                    self._max_weight = weight
+                elif old_weight == self._max_weight:
+                    self._max_weight = None
+            if self._dirty is not None:
+                self._dirty.add(idx)
+            self._notify_listeners(idx)
+
+    def min_weight(self):
+        """Get the lowest weight of the graph's cells"""
+        if self._min_weight is None:
+            self._min_weight = min(self._weights)
+
+        return self._min_weight
+
+    def max_weight(self):
+        """Get the highest weight of the graph's cells"""
+        if self._max_weight is None:
+            self._max_weight = max(self._weights)
+
+        return self._max_weight
+
+    def get_parent(self, idx):
+        if self._stamps[idx] == self._epoch:
+            return self._parents[idx]
+
+        return -1
+
+    def set_parent(self, idx, pidx):
+        self._touch(idx)
+        self._parents[idx] = pidx
+        if self._recorder is not None:
+            self._recorder.set_parent(idx, pidx)
+
+    def neighbour_mask(self, idx):
+        """Get a mask of non-blocked neighbours of the cell"""
+        return self._masks[idx]
+
+    def checksum(self):
+        """
+        Get a checksum of walls and weights of the graph
+        (statuses and parents left by searches don't count)
+        """
+        return zlib.crc32(self._weights.tostring(),
+                          zlib.crc32(self._walls.tostring())) & 0xFFFFFFFF
+
+    def get_arrays(self):
+        """
+        Get (weights, walls, masks) arrays, the ones GridGraph()
+        can be made of. They must not be modified.
+        """
+        return self._weights, self._walls, self._masks
+
+    def get_search_arrays(self):
+        """
+        Get (statuses, stamps, epoch): the status of a cell is
+        "statuses[idx]" if "stamps[idx] == epoch", otherwise it's
+        the cell's item of walls (see get_arrays()). The arrays
+        change when the epoch overflows and must not be modified.
+        """
+        return self._statuses, self._stamps, self._epoch
+
+    def clear(self, clear_walls=True):
+        """
+        Reset statuses and parents left by a search.
+        If "clear_walls" is True, walls and weights are reset too.
+        """
+        if self._dirty is not None:
+            self._all_dirty = True
+        if self._recorder is not None:
+            self._recorder.reset()
+        if clear_walls:
+            size = self.get_size()
+            self._weights = array('H', [DEFAULT_CELL_WEIGHT]) * size
+            self._min_weight = self._max_weight = DEFAULT_CELL_WEIGHT
+            self._walls = array('b', [CellStatus.NotVisited]) * size
+            self._counts[CellStatus.Blocked] = 0
+            self._build_adjacency()
+            self._reset_search_state()
+            self._notify_listeners(None)
+        else:
+            self._new_epoch()
+
+    def _reset_search_state(self):
+        size = self.get_size()
+        self._statuses = array('b', [CellStatus.NotVisited]) * size
+        # -1 denotes the cell doesn't have a parent
+        self._parents = array('i', [-1]) * size
+        self._stamps = array('I', [0]) * size
+        self._epoch = 0
+        self._new_epoch()
+
+    def _new_epoch(self):
+        """Forget search statuses and parents of all the cells"""
+        if self._epoch == MAX_EPOCH:
+            self._reset_search_state()
+            return
+
+        self._epoch += 1
+        # Walls stay
+        blocked = self._counts[CellStatus.Blocked]
+        self._counts = [self.get_size() - blocked, 0, 0, blocked]
+
+    def _touch(self, idx):
+        """Make the cell's search state valid in the current epoch"""
+        if self._stamps[idx] != self._epoch:
+            self._stamps[idx] = self._epoch
+            self._statuses[idx] = self._walls[idx]
+            self._parents[idx] = -1
+
+    def _build_adjacency(self):
+        rows, cols = self._rows, self._cols
+        self._masks = array('B', [0xFF]) * (rows * cols)
+
+        # Cells on the borders lack some neighbours
+        for k, (dr, dc) in enumerate(NEIGHBOUR_OFFSETS):
+            bit = ~(1 << k) & 0xFF
+            if dr:
+                row = 0 if dr < 0 else rows - 1
+                for col in xrange(0, cols):
+                    self._masks[row * cols + col] &= bit
+            if dc:
+                col = 0 if dc < 0 else cols - 1
+                for row in xrange(0, rows):
+                    self._masks[row * cols + col] &= bit
+
+        # Walls are not neighbours either
+        raw_walls = self._walls.tostring()
+        blocked = chr(CellStatus.Blocked)
+        idx = raw_walls.find(blocked)
+        while idx >= 0:
+            self._patch_adjacency(idx, True)
+            idx = raw_walls.find(blocked, idx + 1)
+
+    def _patch_adjacency(self, idx, blocked):
+        """
+        Update masks of neighbours of the cell that
+        became blocked or not blocked.
+        """
+        row, col = divmod(idx, self._cols)
+        for k, (dr, dc) in enumerate(NEIGHBOUR_OFFSETS):
+            nrow, ncol = row + dr, col + dc
+            if not (0 <= nrow < self._rows and 0 <= ncol < self._cols):
+                continue
+
+            nidx = nrow * self._cols + ncol
+            bit = 1 << _OPPOSITE_NEIGHBOUR[k]
+            if blocked:
+                self._masks[nidx] &= ~bit & 0xFF
+            else:
+                self._masks[nidx] |= bit
@@ -0,0 +1,284 @@
+import sys
+import zlib
+import struct
+from array import array
+from core.cell import CellStatus
+from core.config import DEFAULT_CELL_WEIGHT
+from core.gridgraph import GridGraph
+
+# Text map format: one line per row, one character per cell.
+# Lines starting with TEXT_MAP_COMMENT are ignored.
+TEXT_MAP_WALL = '#'
+TEXT_MAP_EMPTY = '.'
+TEXT_MAP_COMMENT = ';'
+
+# Binary map format: BINARY_MAP_HEADER (magic, rows, cols, CRC-32 of
+# the arrays) followed by raw little endian arrays of weights (16 bit),
+# statuses (a byte per cell, nothing but walls) and neighbour masks (a
+# byte per cell). The arrays are read as they are, without any parsing
+# or rebuilding the masks. Maps of the first version of the format
+# have no checksum, their masks are rebuilt.
+BINARY_MAP_MAGIC = 'SPMAP\x02\x00\x00'
+BINARY_MAP_HEADER = struct.Struct('<8sIII')
+_BINARY_MAP_MAGIC_V1 = 'SPMAP\x01\x00\x00'
+_BINARY_MAP_HEADER_V1 = struct.Struct('<8sII')
+
+# Moving AI benchmark maps (http://movingai.com/benchmarks/):
+# passable terrain, everything else is a wall.
+MOVING_AI_FREE = '.GS'
+_MOVING_AI_STATUSES = ''.join(
+    chr(CellStatus.NotVisited if chr(c) in MOVING_AI_FREE
+        else CellStatus.Blocked) for c in xrange(0, 256))
+
+
+def load_text_map(fobj):
+    """
+    Load a GridGraph() from a text map. "fobj" is either a file
+    name or a file object. "." denotes a cell with default weight,
+    "#" denotes a wall and digits 1-9 denote weighted cells.
+    """
+    if isinstance(fobj, basestring):
+        with open(fobj) as f:
+            return load_text_map(f)
+
+    lines = [l.rstrip('\r\n') for l in fobj
+             if not l.startswith(TEXT_MAP_COMMENT)]
+    while lines and not lines[-1]:
+        lines.pop()
+    if not lines:
+        raise ValueError("Empty map")
+
+    cols = len(lines[0])
+    if any(len(l) != cols for l in lines):
+        raise ValueError("All map rows must be of the same length")
+
+    graph = GridGraph(len(lines), cols)
+    for row, line in enumerate(lines):
+        for col, sym in enumerate(line):
+            if sym == TEXT_MAP_EMPTY:
+                continue
+
+            idx = graph.get_index(row, col)
+            if sym == TEXT_MAP_WALL:
+                graph.set_status(idx, CellStatus.Blocked)
+            elif sym.isdigit() and sym != '0':
+                graph.set_weight(idx, int(sym))
+            else:
+                raise ValueError("Unexpected symbol %r at [%d, %d]" %
+                                 (sym, row, col))
+
+    return graph
+
+
+def save_text_map(graph, fobj):
+    """
+    Save walls and weights of the "graph" as a text map.
+    Weights that can't be written as a single digit are lost.
+    """
+    if isinstance(fobj, basestring):
+        with open(fobj, 'w') as f:
+            return save_text_map(graph, f)
+
+    for row in xrange(0, graph.get_rows()):
+        line = []
+        for col in xrange(0, graph.get_cols()):
+            idx = graph.get_index(row, col)
+            weight = graph.get_weight(idx)
+            if graph.get_status(idx) == CellStatus.Blocked:
+                line.append(TEXT_MAP_WALL)
+            elif weight != DEFAULT_CELL_WEIGHT and 0 < weight < 10:
+                line.append(str(weight))
+            else:
+                line.append(TEXT_MAP_EMPTY)
+
+        fobj.write(''.join(line) + '\n')
+
+
+def save_binary_map(graph, fobj):
+    """
+    Save walls and weights of the "graph" in the binary format.
+    "fobj" is either a file name or a file object.
+    """
+    if isinstance(fobj, basestring):
+        with open(fobj, 'wb') as f:
+            return save_binary_map(graph, f)
+
+    arrays = []
+    crc = 0
+    for arr in graph.get_arrays():
+        if sys.byteorder == 'big' and arr.itemsize > 1:
+            arr = array(arr.typecode, arr)
+            arr.byteswap()
+        crc = zlib.crc32(buffer(arr), crc)
+        arrays.append(arr)
+
+    fobj.write(BINARY_MAP_HEADER.pack(BINARY_MAP_MAGIC, graph.get_rows(),
+                                      graph.get_cols(), crc & 0xFFFFFFFF))
+    for arr in arrays:
+        fobj.write(arr.tostring())
+
+
+def load_binary_map(fobj):
+    """
+    Load a GridGraph() saved by save_binary_map(). The arrays are
+    checked against the checksum and for walls and weights that can't
+    be there, then taken as they are, neighbour masks included. Masks
+    of maps saved before they were checksummed are rebuilt.
+    """
+    if isinstance(fobj, basestring):
+        with open(fobj, 'rb') as f:
+            return load_binary_map(f)
+
+    rows, cols, crc = _read_binary_header(fobj)
+    raws = []
+    for itemsize in (2, 1, 1):
+        raw = fobj.read(rows * cols * itemsize)
+        if len(raw) != rows * cols * itemsize:
+            raise ValueError("Truncated binary map")
+        raws.append(raw)
+
+    if crc is not None:
+        actual = 0
+        for raw in raws:
+            actual = zlib.crc32(raw, actual)
+        if actual & 0xFFFFFFFF != crc:
+            raise ValueError("Broken binary map: checksum mismatch")
+
+    raw_weights, raw_walls, raw_masks = raws
+    if raw_walls.translate(None, chr(CellStatus.NotVisited) +
+                           chr(CellStatus.Blocked)):
+        raise ValueError("Broken binary map: bad walls")
+    if _has_zero_weight(raw_weights):
+        raise ValueError("Broken binary map: zero weights")
+
+    weights = array('H', raw_weights)
+    if sys.byteorder == 'big':
+        weights.byteswap()
+    walls = array('b', raw_walls)
+    masks = array('B', raw_masks) if crc is not None else None
+    return GridGraph(rows, cols, weights, walls, masks)
+
+
+def _has_zero_weight(raw):
+    """Check if little endian 16 bit weights have a zero"""
+    idx = raw.find('\x00\x00')
+    while idx >= 0:
+        # Ignore zero bytes of two neighbouring weights
+        if idx % 2 == 0:
+            return True
+        idx = raw.find('\x00\x00', idx + 1)
+
+    return False
+
+
+def _read_binary_header(fobj):
+    """Get (rows, cols, checksum), the checksum is None for old maps"""
+    magic = fobj.read(len(BINARY_MAP_MAGIC))
+    if magic == BINARY_MAP_MAGIC:
+        header = BINARY_MAP_HEADER
+    elif magic == _BINARY_MAP_MAGIC_V1:
+        header = _BINARY_MAP_HEADER_V1
+    else:
+        raise ValueError("Not a binary map")
+
+    raw = magic + fobj.read(header.size - len(magic))
+    if len(raw) != header.size:
+        raise ValueError("Truncated binary map")
+
+    fields = header.unpack(raw)[1:]
+    if header is _BINARY_MAP_HEADER_V1:
+        fields += (None,)
+    return fields
+
+
+def load_moving_ai_map(fobj):
+    """
+    Load a GridGraph() from a Moving AI benchmark ".map" file.
+    NOTE: the benchmarks' octile costs and corner cutting rules
+    differ from the demo's ones, so optimal costs from ".scen"
+    files are not comparable with the walkers' ones.
+    """
+    if isinstance(fobj, basestring):
+        with open(fobj) as f:
+            return load_moving_ai_map(f)
+
+    header = {}
+    line = fobj.readline()
+    while line.strip() != 'map':
+        if not line:
+            raise ValueError("Not a Moving AI map")
+
+        key, _, val = line.strip().partition(' ')
+        header[key] = val
+        line = fobj.readline()
+
+    try:
+        rows, cols = int(header['height']), int(header['width'])
+    except (KeyError, ValueError):
+        raise ValueError("Bad Moving AI map header")
+
+    lines = []
+    for row in xrange(0, rows):
+        line = fobj.readline().rstrip('\r\n')
+        if len(line) != cols:
+            raise ValueError("Row %d of the map is %d cells long, not %d" %
+                             (row, len(line), cols))
+        lines.append(line)
+
+    # Turn terrain symbols into statuses all at once
+    walls = array('b', ''.join(lines).translate(_MOVING_AI_STATUSES))
+    return GridGraph(rows, cols, walls=walls)
+
+
+def load_moving_ai_scen(fobj):
+    """
+    Load queries from a Moving AI ".scen" file as a list of
+    dictionaries in batch.py format (plus "bucket" and
+    "optimal" values of the scenario).
+    """
+    if isinstance(fobj, basestring):
+        with open(fobj) as f:
+            return load_moving_ai_scen(f)
+
+    queries = []
+    for num, line in enumerate(fobj):
+        fields = line.split()
+        if not fields or fields[0] == 'version':
+            continue
+        if len(fields) != 9:
+            raise ValueError("Bad scenario at line %d" % (num + 1))
+
+        bucket = int(fields[0])
+        scol, srow, dcol, drow = [int(i) for i in fields[4:8]]
+        queries.append({'id': len(queries), 'src': [srow, scol],
+                        'dst': [drow, dcol], 'diagonals': True,
+                        'bucket': bucket, 'optimal': float(fields[8])})
+
+    return queries
+
+
+def load_map(path):
+    """
+    Load a GridGraph() from a file in any of the supported formats:
+    binary, Moving AI ".map" or text map.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(len(BINARY_MAP_MAGIC))
+
+    if head in (BINARY_MAP_MAGIC, _BINARY_MAP_MAGIC_V1):
+        return load_binary_map(path)
+    elif head.startswith('type '):
+        return load_moving_ai_map(path)
+
+    return load_text_map(path)
+
+
+def save_map(graph, path):
+    """
+    Save the graph to a file, as a text map if the file
+    name ends with ".txt" or in the binary format otherwise.
+    """
+    if path.endswith('.txt'):
+        save_text_map(graph, path)
+    else:
+        save_binary_map(graph, path)
@@ -1,18 +1,35 @@
 #!/usr/bin/python
 
+import os
 import sys
-import pygame
+import time
 from math import ceil
 from core import *
 from walkers import *
-
-WALKERS = {
-    'A*': AStarWalker,
-    'Dijkstra': DijkstraWalker,
-    'BFS': BFSWalker
-}
+from walkers.heuristics import HEURISTICS, DEFAULT_HEURISTIC
+from walkers.alt import UNREACHABLE
+from walkers.background import BackgroundWalker
+from walkers.flowfield import get_flow_field
+from walkers.probe import SearchProbe
+from walkers.recorder import Replay, load_recording, start_recording
+
+# The batch mode runs without pygame
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+try:
+    import numpy
+    import pygame.surfarray
+except ImportError:
+    numpy = None
 
 BRUSHES = ['Wall', 'Weight-1', 'Weight-2', 'Weight-3']
+# Walker steps per frame. "Max" makes as many steps as fit
+# into STEP_TIME_BUDGET, "Instant" finishes the search at once,
+# "Background" runs it in another thread (see BackgroundWalker()).
+SPEEDS = ['1', '10', '100', '1000', 'Max', 'Instant', 'Background']
 
 
 class Ring(object):
@@ -48,6 +65,47 @@ class Ring(object):
             self._idx = len(self._items) - 1
 
 
+class TextCache(object):
+    """
+    A cache of fonts and text rendered with them.
+    Rendering text is expensive, while the demo draws
+    the same few strings (menu buttons, weights) all the time.
+    """
+
+    def __init__(self, max_size=TEXT_CACHE_SIZE):
+        self._fonts = {}
+        self._images = {}
+        self._max_size = max_size
+
+    def font(self, size, bold=False):
+        """Get DEFAULT_FONT font of given size"""
+        key = (size, bold)
+        font = self._fonts.get(key)
+        if font is None:
+            font = pygame.font.SysFont(DEFAULT_FONT, size, bold=bold)
+            self._fonts[key] = font
+
+        return font
+
+    def render(self, font, text, fg, bg):
+        """
+        Get a surface with antialiased "text" rendered by "font"
+        in "fg" color on "bg" background (colors are names).
+        """
+        key = (font, text, fg, bg)
+        img = self._images.get(key)
+        if img is None:
+            if len(self._images) >= self._max_size:
+                # Never used strings (e.g. old path reports)
+                # shouldn't pile up forever.
+                self._images.clear()
+
+            img = font.render(text, True, pygame.Color(fg), pygame.Color(bg))
+            self._images[key] = img
+
+        return img
+
+
 class Menu(object):
     """
     Simple pygame configuration menu.
@@ -66,8 +124,8 @@ class Menu(object):
            }
         """
         self._surf = surf
-        self._font = pygame.font.SysFont(DEFAULT_FONT, MENU_FONT_SIZE,
-                                         bold=True)
+        self._text = TextCache()
+        self._font = self._text.font(MENU_FONT_SIZE, bold=True)
         self._mdict = {}
         for k, v in menu_dict.iteritems():
             self._mdict[k] = Ring(v)
@@ -116,7 +174,9 @@ class Menu(object):
                 button['fg'] = MENU_SEL_FG_COLOR
                 button['bg'] = MENU_SEL_BG_COLOR
 
-            buttons_width += self._font.size(button['text'])[0]
+            button['img'] = self._text.render(self._font, button['text'],
+                                              button['fg'], button['bg'])
+            buttons_width += button['img'].get_width()
             buttons.append(button)
 
         # fspace - a width of space not occupied by buttons text
@@ -125,9 +185,7 @@ class Menu(object):
         for i in xrange(0, len(buttons)):
             button = buttons[i]
             is_last = (i == len(buttons) - 1)
-            img = self._font.render(button['text'], True,
-                                    pygame.Color(button['fg']),
-                                    pygame.Color(button['bg']))
+            img = button['img']
             if is_last:
                 fspace = self._surf.get_width() - (offset + img.get_width())
 
@@ -207,33 +265,150 @@ class Point(object):
                 self.col == other.col)
 
 
+class GridImage(object):
+    """
+    Colours of all the cells of a graph kept as an array of indices
+    of a palette, which is drawn with pygame.surfarray: the part of
+    the array in view is mapped through the palette to pixels and
+    scaled to the cell size in one go, grid lines are blitted over it
+    from a cached overlay. This way drawing costs a few NumPy and
+    pygame calls instead of several per cell.
+    """
+
+    def __init__(self, graph, colors):
+        """"colors" - a list of names of all the colours cells can have"""
+        self._graph = graph
+        self._names = list(colors)
+        self._index = dict((name, i) for i, name in enumerate(colors))
+        self._palette = numpy.array([tuple(pygame.Color(name))[:3]
+                                     for name in colors], dtype=numpy.uint8)
+        self.colors = numpy.zeros((graph.get_rows(), graph.get_cols()),
+                                  dtype=numpy.uint8)
+        # The grid line overlay of the last (cell size, surface size)
+        self._overlays = {}
+
+    def get_color(self, row, col):
+        return self._names[self.colors[row, col]]
+
+    def set_color(self, idx, color):
+        self.colors.flat[idx] = self._index[color]
+
+    def rebuild(self, field=None, field_max=1, heat_colors=()):
+        """
+        Recolour all the cells at once, the same way
+        SPDemoGrid._cell_to_color() does it for one cell.
+        """
+        graph = self._graph
+        weights, walls, masks = graph.get_arrays()
+        statuses, stamps, epoch = graph.get_search_arrays()
+        statuses = numpy.where(
+            numpy.frombuffer(stamps, dtype=numpy.uint32) == epoch,
+            numpy.frombuffer(statuses, dtype=numpy.int8),
+            numpy.frombuffer(walls, dtype=numpy.int8))
+
+        colors = self.colors.reshape(-1)
+        if field is not None:
+            costs = numpy.frombuffer(field.costs, dtype=numpy.uint32)
+            reachable = costs != UNREACHABLE
+            colors[:] = self._index[NOTVISITED_CELL_COLOR]
+            heat = numpy.array([self._index[c] for c in heat_colors],
+                               dtype=numpy.uint8)
+            levels = (costs[reachable].astype(numpy.uint64) *
+                      (len(heat_colors) - 1) // field_max)
+            colors[reachable] = heat[levels]
+        else:
+            colors[:] = self._index[NOTVISITED_CELL_COLOR]
+            colors[numpy.frombuffer(weights, dtype=numpy.uint16) !=
+                   DEFAULT_CELL_WEIGHT] = self._index[WEIGHTED_CELL_COLOR]
+
+        for status, color in ((CellStatus.Discovered, DISCOVERED_CELL_COLOR),
+                              (CellStatus.Visited, VISITED_CELL_COLOR),
+                              (CellStatus.Blocked, BLOCKED_CELL_COLOR)):
+            colors[statuses == status] = self._index[color]
+
+    def draw(self, surf, rows, cols, sq_size, offset):
+        """
+        Draw the cells of "rows" and "cols" (slices, possibly with
+        a step when cells are smaller than a pixel) on the surface,
+        the first one at "offset". "sq_size" is the size of the cells
+        drawn in pixels. Return the rectangle that's been drawn.
+        """
+        block = self.colors[rows, cols]
+        if block.size == 0:
+            return pygame.Rect(offset, (0, 0))
+
+        # surfarray arrays are indexed by x first
+        img = pygame.surfarray.make_surface(self._palette[block.T])
+        if sq_size > 1:
+            img = pygame.transform.scale(img, (img.get_width() * sq_size,
+                                               img.get_height() * sq_size))
+        rect = surf.blit(img, offset)
+        if sq_size >= MIN_BORDER_SQ_SIZE:
+            surf.blit(self._overlay(sq_size, surf.get_size()), offset,
+                      pygame.Rect(offset, rect.size))
+
+        return rect
+
+    def _overlay(self, sq_size, size):
+        """
+        Get a transparent surface of "size" with borders of cells
+        of "sq_size" on it (on the right and the bottom of a cell,
+        like SPDemoGrid._draw_square() draws them).
+        """
+        key = (sq_size, size)
+        overlay = self._overlays.get(key)
+        if overlay is None:
+            overlay = pygame.Surface(size, pygame.SRCALPHA)
+            overlay.fill((0, 0, 0, 0))
+            color = pygame.Color(GRID_FG_COLOR)
+            width, height = size
+            for x in xrange(sq_size - 1, width, sq_size):
+                pygame.draw.line(overlay, color, (x, 0), (x, height - 1))
+            for y in xrange(sq_size - 1, height, sq_size):
+                pygame.draw.line(overlay, color, (0, y), (width - 1, y))
+            self._overlays = {key: overlay}
+
+        return overlay
+
+
 class SPDemoGrid(object):
     """
     SPDemoGrid() does all the visualization and grid
     related event handling.
     """
 
-    def __init__(self, rows, cols, surface):
+    def __init__(self, rows, cols, surface, graph=None, map_file=None,
+                 recording=None):
         """
         Initialise the grid of size "rows" x "cols"
-        on the given surface.
+        on the given surface. "graph" is a loaded map of the same
+        size, the map is saved to "map_file" (see save_map()).
+        A SearchRecording() made on the map is replayed right away.
         """
         self._rows = rows
         self._cols = cols
-
-        if (surface.get_width() < (cols * DEFAULT_SQ_SIZE) or
-                surface.get_height() < (rows * DEFAULT_SQ_SIZE)):
-            raise ValueError("Surface is too small")
-
         self._surf = surface
 
-        # Source and destination points
-        self._srcp = Point(0, 0)
-        self._dstp = Point(self._rows - 1, self._cols - 1)
-
-        # The underneath graph
-        self._graph = GridGraph(self._rows, self._cols)
-        self._font = pygame.font.SysFont(DEFAULT_FONT, MENU_FONT_SIZE)
+        # The underneath graph, huge ones only keep
+        # the parts of the map that have been drawn on
+        if graph is None:
+            if rows * cols >= CHUNKED_GRAPH_MIN_CELLS:
+                graph = ChunkedGridGraph(rows, cols)
+            else:
+                graph = GridGraph(rows, cols)
+        self._graph = graph
+        self._map_file = map_file or DEFAULT_MAP_FILE
+
+        # Source and destination points, the corners
+        # unless a loaded map has walls there
+        self._srcp = self._free_point(0)
+        self._dstp = self._free_point(self._graph.get_size() - 1, -1)
+        # Let the graph record cells touched by walkers and the brush,
+        # so only they get redrawn.
+        self._graph.track_dirty_cells()
+        self._text = TextCache()
+        self._font = self._text.font(MENU_FONT_SIZE)
+        self._report_font = self._text.font(REPORT_FONT_SIZE, bold=True)
 
         # A name of current shortest path algorithm
         # (or "walker") the grid uses
@@ -245,20 +420,73 @@ class SPDemoGrid(object):
         # denotes whether diagonal movements are possible
         self._use_diags = DEFAULT_USE_DIAGS
 
+        # how many steps the walker makes per frame
+        self._speed = DEFAULT_SPEED
+
+        # a name of the heuristic for walkers that can use any
+        self._heuristic = DEFAULT_HEURISTIC
+
         self._spoint = None
         self._walker = None
-        self._grid_changed = True
+
+        # if True, the whole grid is redrawn on the next frame,
+        # otherwise only cells that changed are
+        self._redraw_all = True
 
         # a list of points forming shortest path
         self._path = None
+        # denotes whether the found path is on the screen
+        self._path_shown = False
 
         # denotes whether visualization is started
         self._started = False
 
+        # if True, cells are coloured by the cost of getting to
+        # the destination, see FlowField()
+        self._show_field = False
+        self._field = None
+        self._field_max = 1
+        self._heat_colors = heat_colors(HEAT_LEVELS)
+
+        # With NumPy cells are drawn from their colours kept in an
+        # image, see GridImage(). If True, all of them are recoloured
+        # on the next frame. Chunked graphs are too big for images.
+        self._image = None
+        self._recolor = True
+        if numpy is not None and isinstance(self._graph, GridGraph):
+            self._image = GridImage(self._graph, [
+                NOTVISITED_CELL_COLOR, WEIGHTED_CELL_COLOR,
+                DISCOVERED_CELL_COLOR, VISITED_CELL_COLOR,
+                BLOCKED_CELL_COLOR] + self._heat_colors)
+
         # if True, user can draw walls or set weights
         # on the grid
         self._brush_enabled = False
 
+        # The camera: an index of ZOOM_LEVELS and the top left
+        # cell in view. Only the cells in view are drawn.
+        self._zoom = self._fit_zoom()
+        self._view_row = 0
+        self._view_col = 0
+        # (mouse position, view row, view col) when panning started
+        self._pan_start = None
+        # the path on the screen, drawn again when the camera moves
+        self._shown_path = None
+        # rectangles and cells of the points drawn on the previous
+        # frame, the rectangles are redrawn when the points move
+        self._point_rects = []
+        self._point_cells = []
+
+        # The recording of the last search (see SearchRecording()),
+        # the Replay() of it in the replay mode and whether it plays
+        self._recording = recording
+        self._replay = None
+        self._playing = False
+        # denotes whether the mouse scrubs through the replay
+        self._scrubbing = False
+        if recording is not None:
+            self.start_replay()
+
     def set_walker(self, wname):
         assert wname in WALKERS.keys()
         self._walker_class = wname
@@ -271,44 +499,342 @@ class SPDemoGrid(object):
         assert dval in ['On', 'Off']
         self._use_diags = (dval == 'On')
 
+    def set_heuristic(self, hname):
+        assert hname in HEURISTICS
+        self._heuristic = hname
+
+    def set_speed(self, sname):
+        assert sname in SPEEDS
+        self._speed = sname
+
     def draw(self):
-        if self._started:
+        """
+        Draw what has changed since the previous frame.
+        Return a list of rectangles of the surface that must be updated.
+        """
+        if self._replay is not None:
+            self._step_replay()
+        elif self._started:
             if not self._walker.finished():
-                self._walker.step()
-                self._grid_changed = True
-            else:
+                if self._path_shown:
+                    # An incremental walker is repairing the path,
+                    # wipe the old one out.
+                    self._path_shown = False
+                    self._redraw_all = True
+
+                self._step_walker()
+
+            if (isinstance(self._walker, BackgroundWalker) and
+                    self._walker.error is not None):
+                sys.stderr.write("%s has failed: %s\n"
+                                 % (self._walker_class, self._walker.error))
+                self.clear(clear_walls=False)
+            elif self._walker.finished() and not self._path_shown:
                 self._path = self._walker.get_path()
-
-        self._draw_grid()
-        self._draw_path()
-        self._draw_points()
+                if self._recording is not None:
+                    self._recording.stop(self._path)
+
+        if self._path_shown and self._points_moved():
+            # Wiping the old points out would cut holes in the path
+            self._redraw_all = True
+        if self._redraw_all and self._path_shown:
+            # The camera has moved, the path must be drawn again
+            self._path = self._shown_path
+
+        rects = self._draw_grid()
+        if self._path is not None:
+            self._shown_path = self._path
+            self._draw_path()
+            self._path = None
+            self._path_shown = True
+            rects = [self._surf.get_rect()]
+
+        rects.extend(self._draw_points())
+        if self._replay is not None:
+            rects.append(self._draw_progress())
+        return rects
 
     def kbd_event(self, event):
         """
         Handle grid related keyboard events
         """
+        if self._replay is not None and self._replay_kbd_event(event):
+            return
+
         if event.key == pygame.K_SPACE:
             # Pause/Resume the visualization
             self._started = not self._started
+            if isinstance(self._walker, BackgroundWalker):
+                self._walker.pause(not self._started)
             if self._started and self._walker is None:
                 # Setup the walker if it hasn't been set up yet
                 src_cell = self._graph.get_cell(self._srcp.row, self._srcp.col)
                 dst_cell = self._graph.get_cell(self._dstp.row, self._dstp.col)
 
-                wclass = self._walker_class
-                self._walker = WALKERS[wclass](self._graph, src_cell,
-                                               dst_cell, self._use_diags)
+                wclass = WALKERS[self._walker_class]
+                kwargs = {}
+                if wclass.pluggable_heuristic:
+                    kwargs['heuristic'] = self._heuristic
+
+                # The probe stands in for the walker and
+                # collects counters for the report. Searches but
+                # background ones are recorded for replays.
+                self._recording = None
+                if self._speed == 'Background':
+                    probe_class = BackgroundWalker
+                else:
+                    probe_class = SearchProbe
+                    kwargs['hooks'] = self._start_recording(src_cell,
+                                                            dst_cell)
+                try:
+                    self._walker = probe_class(wclass, self._graph, src_cell,
+                                               dst_cell, self._use_diags,
+                                               **kwargs)
+                except MemoryError:
+                    # Walkers keeping arrays of the whole map
+                    # don't fit huge chunked graphs
+                    sys.stderr.write("Not enough memory for %s\n"
+                                     % self._walker_class)
+                    self._graph.set_recorder(None)
+                    self._recording = None
+                    self._started = False
         elif event.key == pygame.K_c:
             # Just clean everything from the grid
             self.clear()
+        elif event.key == pygame.K_s:
+            self.save_map()
+        elif event.key == pygame.K_t:
+            self.save_trace()
+        elif event.key == pygame.K_r:
+            self.start_replay()
+        elif event.key == pygame.K_w:
+            self.save_recording()
+        elif event.key == pygame.K_f:
+            # Show/hide the flow field heat map
+            self._show_field = not self._show_field
+            self._field = None
+            self._recolor = True
+            self._redraw_all = True
+        elif event.key in (pygame.K_EQUALS, pygame.K_PLUS,
+                           pygame.K_KP_PLUS):
+            self.zoom(1)
+        elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            self.zoom(-1)
+        elif event.key in (pygame.K_UP, pygame.K_DOWN,
+                           pygame.K_LEFT, pygame.K_RIGHT):
+            # Pan by a share of the view
+            sq_size = self._sq_size()
+            rows = int(self._surf.get_height() * PAN_SHARE / sq_size) or 1
+            cols = int(self._surf.get_width() * PAN_SHARE / sq_size) or 1
+            drow, dcol = {pygame.K_UP: (-rows, 0), pygame.K_DOWN: (rows, 0),
+                          pygame.K_LEFT: (0, -cols),
+                          pygame.K_RIGHT: (0, cols)}[event.key]
+            self.move_view(self._view_row + drow, self._view_col + dcol)
+
+    def zoom(self, levels, pos=None):
+        """
+        Zoom in (positive "levels") or out (negative) by the number of
+        ZOOM_LEVELS keeping the cell at "pos" (the center of the view
+        by default) under it.
+        """
+        zoom = max(0, min(self._zoom + levels, len(ZOOM_LEVELS) - 1))
+        if zoom == self._zoom:
+            return
+
+        if pos is None:
+            pos = (self._surf.get_width() / 2, self._surf.get_height() / 2)
+        old_size = self._sq_size()
+        self._zoom = zoom
+        new_size = self._sq_size()
+        self.move_view(
+            int(self._view_row + pos[1] / old_size - pos[1] / new_size),
+            int(self._view_col + pos[0] / old_size - pos[0] / new_size),
+            force=True)
+
+    def move_view(self, row, col, force=False):
+        """
+        Scroll the view so that cell ("row", "col") is in the top left
+        corner, or as close to it as the grid allows.
+        """
+        sq_size = self._sq_size()
+        max_row = self._rows - int(self._surf.get_height() / sq_size)
+        max_col = self._cols - int(self._surf.get_width() / sq_size)
+        row = max(0, min(row, max_row))
+        col = max(0, min(col, max_col))
+        if force or (row, col) != (self._view_row, self._view_col):
+            self._view_row = row
+            self._view_col = col
+            self._redraw_all = True
+
+    def save_map(self):
+        """Save walls and weights to the map file"""
+        try:
+            save_map(self._graph, self._map_file)
+            print "Saved the map to %s" % self._map_file
+        except IOError as err:
+            sys.stderr.write("Can't save the map: %s\n" % err)
+        except MemoryError:
+            sys.stderr.write("Can't save the map: it's too big\n")
+
+    def save_trace(self):
+        """Save a Chrome trace of the current search"""
+        if self._walker is None:
+            return
+
+        try:
+            self._walker.save(DEFAULT_TRACE_FILE, chrome=True)
+            print "Saved the search trace to %s" % DEFAULT_TRACE_FILE
+        except IOError as err:
+            sys.stderr.write("Can't save the trace: %s\n" % err)
+
+    def save_recording(self):
+        """Save the recording of the last search"""
+        if self._recording is None:
+            return
+
+        try:
+            self._recording.save(DEFAULT_RECORDING_FILE)
+            print "Saved the search recording to %s" % DEFAULT_RECORDING_FILE
+        except IOError as err:
+            sys.stderr.write("Can't save the recording: %s\n" % err)
+
+    def start_replay(self):
+        """Enter the replay mode, unless a search is in progress"""
+        if self._recording is None or (self._walker is not None and
+                                       not self._walker.finished()):
+            return
+
+        self._recording.stop()
+        try:
+            self._replay = Replay(self._recording, self._graph)
+        except ValueError as err:
+            sys.stderr.write("Can't replay the search: %s\n" % err)
+            return
+
+        # Show the points of the recorded search
+        for point, idx in ((self._srcp, self._recording.src),
+                           (self._dstp, self._recording.dst)):
+            if idx >= 0:
+                point.row, point.col = divmod(idx, self._cols)
+
+        self._playing = True
+        self._path_shown = False
+        self._redraw_all = True
+
+    def stop_replay(self):
+        """Leave the replay mode with the search finished"""
+        self._seek(self._replay.length())
+        self._replay = None
+        self._playing = False
+        self._scrubbing = False
+        self._path_shown = False
+        self._redraw_all = True
+        if self._walker is None:
+            # The recording has been loaded, nothing to show
+            self.clear(clear_walls=False)
+
+    def _replay_kbd_event(self, event):
+        """Handle keys of the replay mode, get False for other keys"""
+        replay = self._replay
+        if event.key == pygame.K_SPACE:
+            self._playing = not self._playing
+            if self._playing and replay.finished():
+                self._seek(0)
+        elif event.key == pygame.K_r:
+            self.stop_replay()
+        elif event.key in (pygame.K_COMMA, pygame.K_PERIOD):
+            # Step by step
+            self._playing = False
+            self._seek(replay.position +
+                       (1 if event.key == pygame.K_PERIOD else -1))
+        elif event.key == pygame.K_HOME:
+            self._seek(0)
+        elif event.key == pygame.K_END:
+            self._seek(replay.length())
+        elif pygame.K_0 <= event.key <= pygame.K_9:
+            self._seek(replay.length() * (event.key - pygame.K_0) // 10)
+        else:
+            return False
+
+        return True
+
+    def _step_replay(self):
+        replay = self._replay
+        if self._playing and not replay.finished():
+            if self._speed.isdigit():
+                self._seek(replay.position + int(self._speed))
+            else:
+                self._seek(replay.length())
+        if (replay.finished() and not self._path_shown and
+                self._recording.path):
+            self._path = [self._graph.get_cell_by_index(idx)
+                          for idx in self._recording.path]
+
+    def _seek(self, position):
+        if self._path_shown:
+            # Wipe the path out
+            self._path_shown = False
+            self._redraw_all = True
+        self._replay.seek(position)
+
+    def _start_recording(self, src_cell, dst_cell):
+        """Start recording a search, get the probe hooks it needs"""
+        try:
+            self._recording = start_recording(self._graph, self._walker_class,
+                                              src_cell.index, dst_cell.index)
+        except ValueError:
+            # Too big to record
+            return []
+
+        return [self._recording]
+
+    def _free_point(self, idx, step=1):
+        """Get a Point() of the first non-blocked cell from "idx" on"""
+        size = self._graph.get_size()
+        while (0 <= idx + step < size and
+               self._graph.get_status(idx) == CellStatus.Blocked):
+            idx += step
+
+        return Point(idx // self._cols, idx % self._cols)
 
     def mouse_event(self, event):
         """
         Handle grid related mouse event
         """
-        if self._started or self._path is not None:
+        # The wheel zooms and the right button pans the view at any time
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button in (4, 5):
+            self.zoom(1 if event.button == 4 else -1, event.pos)
+            return
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+            self._pan_start = (event.pos, self._view_row, self._view_col)
+            return
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+            self._pan_start = None
+            return
+        elif event.type == pygame.MOUSEMOTION and self._pan_start is not None:
+            (x, y), row, col = self._pan_start
+            sq_size = self._sq_size()
+            self.move_view(row + int((y - event.pos[1]) / sq_size),
+                           col + int((x - event.pos[0]) / sq_size))
+            return
+
+        if self._replay is not None:
+            # Dragging with the left button scrubs through the search
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                self._scrubbing = True
+            elif event.type == pygame.MOUSEBUTTONUP:
+                self._scrubbing = False
+            if self._scrubbing and event.type != pygame.MOUSEBUTTONUP:
+                self._playing = False
+                self._seek(self._replay.length() * event.pos[0] //
+                           max(self._surf.get_width() - 1, 1))
+            return
+
+        if ((self._started or self._path is not None) and
+                not (self._walker is not None and self._walker.incremental)):
             # Ignore events if visualization is in progress
-            # or has been finished.
+            # or has been finished. Incremental walkers are
+            # the exception: they repair the path on the fly.
             return
 
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -340,89 +866,271 @@ class SPDemoGrid(object):
         cleaned up except walls and weights.
         """
         self._spoint = None
+        if self._walker is not None:
+            self._walker.close()
+        if self._recording is not None:
+            self._recording.stop()
         self._walker = None
+        self._replay = None
+        self._playing = False
+        self._scrubbing = False
         self._path = None
+        self._path_shown = False
+        self._shown_path = None
         self._started = False
         self._brush_enabled = False
-
-        for cell in self._graph.cells():
-            cell.parent = None
-            if clear_walls:
-                cell.status = CellStatus.NotVisited
-                cell.weight = DEFAULT_CELL_WEIGHT
-            elif cell.status != CellStatus.Blocked:
-                cell.status = CellStatus.NotVisited
-
-        self._grid_changed = True
+        self._graph.clear(clear_walls)
+        self._redraw_all = True
+
+    def _step_walker(self):
+        if self._speed == 'Instant':
+            self._walker.advance()
+            # Most of the cells have probably changed anyway
+            self._redraw_all = True
+        elif self._speed == 'Max':
+            self._walker.advance(deadline=time.time() + STEP_TIME_BUDGET)
+        elif self._speed == 'Background':
+            # The walker is running in another thread,
+            # just show what it has done so far.
+            self._walker.drain(SOLVER_EVENTS_PER_FRAME)
+        else:
+            self._walker.advance(max_expansions=int(self._speed))
 
     def _draw_grid(self):
-        if not self._grid_changed:
+        """Redraw changed cells and return a list of their rectangles"""
+        if self._show_field:
+            # Fields are cached, a new one means the map
+            # or the destination has changed.
+            dst_cell = self._graph.get_cell(self._dstp.row, self._dstp.col)
+            try:
+                field = get_flow_field(self._graph, dst_cell, self._use_diags)
+            except MemoryError:
+                sys.stderr.write("Not enough memory for the heat map\n")
+                self._show_field = False
+            else:
+                if field is not self._field:
+                    self._field = field
+                    self._field_max = field.max_cost() or 1
+                    self._recolor = True
+                    self._redraw_all = True
+
+        dirty = self._graph.pop_dirty_cells()
+        if self._image is not None:
+            if (dirty is None or self._recolor or len(dirty) >
+                    self._graph.get_size() * IMAGE_REBUILD_SHARE):
+                self._image.rebuild(self._field, self._field_max,
+                                    self._heat_colors)
+                self._recolor = False
+                self._redraw_all = True
+            else:
+                for idx in dirty:
+                    self._image.set_color(idx, self._cell_to_color(
+                        self._graph.get_cell_by_index(idx)))
+
+        if dirty is None or self._redraw_all:
+            self._draw_area(self._surf.get_rect())
+            self._redraw_all = False
+            return [self._surf.get_rect()]
+
+        # Wipe the points out if they have moved
+        rects = []
+        if self._points_moved():
+            rects = list(self._point_rects)
+            for rect in rects:
+                self._draw_area(rect)
+
+        if self._image is not None:
+            # Blit the changed cells in view as one rectangle
+            points = [self._get_square_xy(*divmod(idx, self._cols))
+                      for idx in dirty]
+            points = [(x, y) for x, y in points
+                      if self._surf.get_rect().collidepoint(x, y)]
+            if points:
+                xs, ys = zip(*points)
+                size = max(int(self._sq_size()), 1)
+                rect = pygame.Rect(min(xs), min(ys), max(xs) - min(xs) + size,
+                                   max(ys) - min(ys) + size)
+                self._draw_area(rect)
+                rects.append(rect)
+            return rects
+
+        # When zoomed out, a pixel shows the top left cell of
+        # the cells it covers, so those are the ones to redraw.
+        step = self._view_step()
+        drawn = set()
+        cols = self._cols
+        for idx in dirty:
+            row, col = divmod(idx, cols)
+            row -= (row - self._view_row) % step
+            col -= (col - self._view_col) % step
+            if (row, col) not in drawn and self._in_view(row, col):
+                drawn.add((row, col))
+                rects.append(self._draw_square(self._graph.get_cell(row,
+                                                                    col)))
+
+        return rects
+
+    def _draw_area(self, rect):
+        """Redraw the cells in view a rectangle of the surface covers"""
+        rect = rect.clip(self._surf.get_rect())
+        self._surf.fill(pygame.Color(GRID_BG_COLOR), rect)
+        sq_size = self._sq_size()
+        step = self._view_step()
+        rows = xrange(self._view_row + int(rect.top / sq_size),
+                      min(self._rows, self._view_row +
+                          int(ceil(rect.bottom / sq_size))), step)
+        cols = xrange(self._view_col + int(rect.left / sq_size),
+                      min(self._cols, self._view_col +
+                          int(ceil(rect.right / sq_size))), step)
+        if not rows or not cols:
+            return
+        if self._image is None:
+            areas = [(rows, cols)]
+            if (isinstance(self._graph, ChunkedGridGraph) and
+                    not self._show_field and sq_size < MIN_BORDER_SQ_SIZE):
+                # Cells of missing tiles look like the background
+                areas = [(_sub_range(rows, top, bottom, step),
+                          _sub_range(cols, left, right, step))
+                         for top, left, bottom, right in
+                         self._graph.tile_areas(rows[0], cols[0],
+                                                rows[-1] + 1, cols[-1] + 1)]
+            for area_rows, area_cols in areas:
+                for row in area_rows:
+                    for col in area_cols:
+                        self._draw_square(self._graph.get_cell(row, col))
             return
 
-        self._surf.fill(pygame.Color(GRID_BG_COLOR))
-        for c in self._graph.cells():
-            self._draw_square(c)
+        size = max(int(sq_size), 1)
+        self._image.draw(self._surf, slice(rows[0], rows[-1] + 1, step),
+                         slice(cols[0], cols[-1] + 1, step), size,
+                         self._get_square_xy(rows[0], cols[0]))
+        if size < DEFAULT_SQ_SIZE:
+            return
 
-        self._grid_changed = False
+        # Weights are big enough to be written down
+        weights = numpy.frombuffer(self._graph.get_arrays()[0],
+                                   dtype=numpy.uint16)
+        weights = weights.reshape(self._rows, self._cols)
+        weighted = numpy.nonzero(weights[rows[0]:rows[-1] + 1,
+                                         cols[0]:cols[-1] + 1] !=
+                                 DEFAULT_CELL_WEIGHT)
+        for row, col in zip(weighted[0].tolist(), weighted[1].tolist()):
+            row += rows[0]
+            col += cols[0]
+            x, y = self._get_square_xy(row, col)
+            img = self._text.render(self._font, str(weights[row, col]),
+                                    CELL_WEIGHT_COLOR,
+                                    self._image.get_color(row, col))
+            self._surf.blit(img, (x + (size - img.get_width()) / 2,
+                                  y + (size - img.get_height()) / 2))
+
+    def _draw_progress(self):
+        """Draw the progress bar of the replay at the bottom"""
+        rect = pygame.Rect(0, self._surf.get_height() - REPLAY_BAR_HEIGHT,
+                           self._surf.get_width(), REPLAY_BAR_HEIGHT)
+        self._draw_area(rect)
+        done = rect.width * self._replay.position // max(
+            self._replay.length(), 1)
+        self._surf.fill(pygame.Color(REPLAY_BAR_COLOR),
+                        (rect.left, rect.top, done, rect.height))
+        return rect
 
     def _draw_points(self):
         def draw_point(point, color):
-            x, y = self._get_square_xy(point.row, point.col)
-            radius = DEFAULT_SQ_SIZE / 2
-            pygame.draw.circle(self._surf, pygame.Color(color),
-                               (x + radius, y + radius),
-                               radius - 2)
+            rect = self._point_rect(point)
+            if rect is not None:
+                pygame.draw.circle(self._surf, pygame.Color(color),
+                                   rect.center, rect.width / 2)
+            return rect
+
+        rects = [draw_point(self._srcp, SOURCE_POINT_COLOR),
+                 draw_point(self._dstp, DESTINATION_POINT_COLOR)]
+        self._point_rects = [r for r in rects if r is not None]
+        self._point_cells = self._point_positions()
+        return list(self._point_rects)
+
+    def _point_positions(self):
+        return [(p.row, p.col) for p in (self._srcp, self._dstp)]
+
+    def _points_moved(self):
+        """Check if the points have moved since they were drawn"""
+        return self._point_cells != self._point_positions()
+
+    def _point_rect(self, point):
+        """Get a rectangle of the point's circle, None if it's not in view"""
+        if not self._in_view(point.row, point.col):
+            return None
 
-        draw_point(self._srcp, SOURCE_POINT_COLOR)
-        draw_point(self._dstp, DESTINATION_POINT_COLOR)
+        x, y = self._get_square_xy(point.row, point.col)
+        sq_size = self._sq_size()
+        radius = max(int(sq_size) / 2 - 2, MIN_POINT_RADIUS)
+        center = (x + int(sq_size / 2), y + int(sq_size / 2))
+        return pygame.Rect(center[0] - radius, center[1] - radius,
+                           radius * 2, radius * 2)
 
     def _draw_path(self):
         if self._path is None:
             return
         if len(self._path) == 1:
             # Shortest path does not exist, no luck...
-            font = pygame.font.SysFont(DEFAULT_FONT, REPORT_FONT_SIZE,
-                                       bold=True)
-            img = font.render('Path not found', True,
-                              pygame.Color(REPORT_FAIL_FONT_COLOR),
-                              pygame.Color(REPORT_BG_COLOR))
-            # center the text
-            self._surf.blit(img, ((self._surf.get_width() - img.get_width())/2,
-                            (self._surf.get_height() - img.get_height())/2))
+            self._draw_report(['Path not found'] + self._stats_report(),
+                              REPORT_FAIL_FONT_COLOR)
             return
 
         # Draw a line connecting source and destination points
         # through the points included to "shortest path" array.
         pointlist = []
         total_weight = 0
+        half = int(self._sq_size() / 2)
         for c in self._path:
-            left = c.col * DEFAULT_SQ_SIZE
-            top = c.row * DEFAULT_SQ_SIZE
+            left, top = self._get_square_xy(c.row, c.col)
             total_weight += c.weight
-            self._surf.fill(pygame.Color(PATH_CELL_COLOR),
-                            (left, top, DEFAULT_SQ_SIZE - 1,
-                             DEFAULT_SQ_SIZE - 1))
-            pointlist.append((left + DEFAULT_SQ_SIZE / 2,
-                             top + DEFAULT_SQ_SIZE / 2))
+            if self._in_view(c.row, c.col):
+                self._surf.fill(pygame.Color(PATH_CELL_COLOR),
+                                self._square_rect(c.row, c.col))
+            # Lines are clipped by the surface
+            pointlist.append((left + half, top + half))
 
         pygame.draw.lines(self._surf, pygame.Color(PATH_LINE_COLOR),
-                          False, pointlist, 3)
+                          False, pointlist, 3 if half > 2 else 1)
 
         # and write down some numbers
-        font = pygame.font.SysFont(DEFAULT_FONT, REPORT_FONT_SIZE,
-                                   bold=True)
         msg = ("Shortest path length: %s, weight %s"
                % (len(self._path), total_weight))
-
-        img = font.render(msg, True, pygame.Color(REPORT_SUCCESS_FONT_COLOR),
-                          # unfortunaly font looks very ugly if it doesn't
-                          # have background :(
-                          pygame.Color(REPORT_BG_COLOR))
-
-        self._surf.blit(img, ((self._surf.get_width() - img.get_width())/2,
-                              (self._surf.get_height() - img.get_height())/2))
+        self._draw_report([msg] + self._stats_report(),
+                          REPORT_SUCCESS_FONT_COLOR)
         self._path = None
 
+    def _stats_report(self):
+        """Get lines with the walker's counters"""
+        if self._replay is not None:
+            return ["Replay of %s, %d steps" % (self._recording.name,
+                                                self._replay.length())]
+
+        stats = self._walker.stats()
+        stats['ms'] = sum(stats['time_ms'].values())
+        for name, value in stats.iteritems():
+            if value is None:
+                # The walker doesn't keep the counter
+                stats[name] = '-'
+        return ["Expanded %(expansions)s, reopened %(reopens)s, "
+                "peak open %(peak_size)s, %(ms).1f ms" % stats,
+                "Pushes %(pushes)s, pops %(pops)s, "
+                "decrease-keys %(decrease_keys)s" % stats]
+
+    def _draw_report(self, lines, color):
+        """Write the lines down in the middle of the grid"""
+        # unfortunaly font looks very ugly if it
+        # doesn't have background :(
+        imgs = [self._text.render(self._report_font, line, color,
+                                  REPORT_BG_COLOR) for line in lines]
+        top = (self._surf.get_height() -
+               sum(img.get_height() for img in imgs)) / 2
+        for img in imgs:
+            self._surf.blit(img, ((self._surf.get_width() -
+                                   img.get_width()) / 2, top))
+            top += img.get_height()
+
     def _do_brush(self, pos, click=False):
         if self._point_on_mouse(pos) is not None:
             return
@@ -445,24 +1153,32 @@ class SPDemoGrid(object):
 
             cell.status = CellStatus.NotVisited
 
-        self._grid_changed = True
-
     def _draw_square(self, cell):
         color = self._cell_to_color(cell)
-        rect = pygame.Rect((cell.col * DEFAULT_SQ_SIZE,
-                            cell.row * DEFAULT_SQ_SIZE,
-                            DEFAULT_SQ_SIZE, DEFAULT_SQ_SIZE))
-        pygame.draw.rect(self._surf, pygame.Color(GRID_FG_COLOR), rect, 1)
-        self._surf.fill(pygame.Color(color), (rect.left, rect.top,
-                                              rect.width - 1, rect.height - 1))
-        if cell.weight != DEFAULT_CELL_WEIGHT:
-            img = self._font.render(str(cell.weight), True,
-                                    pygame.Color(CELL_WEIGHT_COLOR),
-                                    pygame.Color(color))
+        x, y = self._get_square_xy(cell.row, cell.col)
+        size = max(int(self._sq_size()), 1)
+        rect = pygame.Rect(x, y, size, size)
+        if size >= MIN_BORDER_SQ_SIZE:
+            pygame.draw.rect(self._surf, pygame.Color(GRID_FG_COLOR), rect, 1)
+        self._surf.fill(pygame.Color(color),
+                        self._square_rect(cell.row, cell.col))
+        if cell.weight != DEFAULT_CELL_WEIGHT and size >= DEFAULT_SQ_SIZE:
+            img = self._text.render(self._font, str(cell.weight),
+                                    CELL_WEIGHT_COLOR, color)
             self._surf.blit(img, (rect.left +
                             (rect.width - img.get_width())/2,
                             rect.top + (rect.height - img.get_height())/2))
 
+        return rect
+
+    def _square_rect(self, row, col):
+        """Get the rectangle of the cell inside its border"""
+        x, y = self._get_square_xy(row, col)
+        size = max(int(self._sq_size()), 1)
+        if size >= MIN_BORDER_SQ_SIZE:
+            size -= 1
+        return (x, y, size, size)
+
     def _move_spoint_to_cell(self, cell):
         assert self._spoint is not None
         if (cell.status == CellStatus.Blocked or
@@ -471,27 +1187,60 @@ class SPDemoGrid(object):
 
         self._spoint.row = cell.row
         self._spoint.col = cell.col
-        self._grid_changed = True
+        if self._walker is not None and self._walker.incremental:
+            self._walker.move_endpoints(
+                self._graph.get_cell(self._srcp.row, self._srcp.col),
+                self._graph.get_cell(self._dstp.row, self._dstp.col))
 
     def _point_on_mouse(self, pos):
-        rc = self._pos_to_rowcol(pos)
-        point = Point(rc[0], rc[1])
-        if point == self._srcp:
-            return self._srcp
-        elif point == self._dstp:
-            return self._dstp
-        else:
-            return None
+        # Points may be bigger than cells when zoomed out
+        for point in (self._srcp, self._dstp):
+            rect = self._point_rect(point)
+            if rect is not None and rect.collidepoint(pos):
+                return point
+
+        return None
 
     def _pos_to_rowcol(self, pos):
-        def divide_coord(coord, lim):
-            return min(coord / DEFAULT_SQ_SIZE, lim - 1)
+        sq_size = self._sq_size()
 
-        return (divide_coord(pos[1], self._graph.get_rows()),
-                divide_coord(pos[0], self._graph.get_cols()))
+        def divide_coord(coord, first, lim):
+            return min(first + int(coord / sq_size), lim - 1)
+
+        return (divide_coord(pos[1], self._view_row, self._rows),
+                divide_coord(pos[0], self._view_col, self._cols))
 
     def _get_square_xy(self, row, col):
-        return (col * DEFAULT_SQ_SIZE, row * DEFAULT_SQ_SIZE)
+        sq_size = self._sq_size()
+        return (int((col - self._view_col) * sq_size),
+                int((row - self._view_row) * sq_size))
+
+    def _sq_size(self):
+        """Get the current size of cells in pixels, may be a fraction"""
+        return float(ZOOM_LEVELS[self._zoom])
+
+    def _view_step(self):
+        """Get the number of cells a pixel covers in each direction"""
+        sq_size = self._sq_size()
+        return 1 if sq_size >= 1 else int(round(1 / sq_size))
+
+    def _in_view(self, row, col):
+        sq_size = self._sq_size()
+        return (0 <= (row - self._view_row) * sq_size <
+                self._surf.get_height() and
+                0 <= (col - self._view_col) * sq_size <
+                self._surf.get_width())
+
+    def _fit_zoom(self):
+        """
+        Get the index of the biggest zoom level (but not bigger than
+        DEFAULT_SQ_SIZE) showing the whole grid, or the smallest one.
+        """
+        fitting = [i for i, size in enumerate(ZOOM_LEVELS)
+                   if size <= DEFAULT_SQ_SIZE and
+                   self._cols * size <= self._surf.get_width() and
+                   self._rows * size <= self._surf.get_height()]
+        return fitting[-1] if fitting else 0
 
     def _cell_to_color(self, cell):
         status = cell.status
@@ -501,6 +1250,13 @@ class SPDemoGrid(object):
             return VISITED_CELL_COLOR
         elif status == CellStatus.Blocked:
             return BLOCKED_CELL_COLOR
+        elif self._field is not None:
+            cost = self._field.cost(cell.index)
+            if cost is None:
+                return NOTVISITED_CELL_COLOR
+
+            level = cost * (len(self._heat_colors) - 1) // self._field_max
+            return self._heat_colors[level]
         else:
             if cell.weight != DEFAULT_CELL_WEIGHT:
                 return WEIGHTED_CELL_COLOR
@@ -508,29 +1264,42 @@ class SPDemoGrid(object):
             return NOTVISITED_CELL_COLOR
 
 
+def _sub_range(rng, start, stop, step):
+    """Get items of "rng", an xrange of the step, in [start, stop)"""
+    first = max(start, rng[0])
+    first += (rng[0] - first) % step
+    return xrange(first, min(stop, rng[-1] + 1), step)
+
+
+def heat_colors(levels):
+    """
+    Get a list of "levels" colours (as "#rrggbb" strings)
+    going from HEAT_NEAR_COLOR to HEAT_FAR_COLOR.
+    """
+    near, far = pygame.Color(HEAT_NEAR_COLOR), pygame.Color(HEAT_FAR_COLOR)
+    colors = []
+    for i in xrange(0, levels):
+        frac = float(i) / max(levels - 1, 1)
+        colors.append('#%02x%02x%02x' % tuple(
+            int(a + (b - a) * frac) for a, b in ((near.r, far.r),
+                                                 (near.g, far.g),
+                                                 (near.b, far.b))))
+
+    return colors
+
+
 class SPDemo(object):
-    def __init__(self, rows, cols):
+    def __init__(self, rows, cols, graph=None, map_file=None,
+                 recording=None):
         if any([i <= 0 for i in (rows, cols)]):
             raise ValueError("rows and cols must be positive")
 
         pygame.init()
-        self._width = cols * DEFAULT_SQ_SIZE
-        self._height = rows * DEFAULT_SQ_SIZE
-
+        # Grids that don't fit the screen are zoomed out and panned
         sysinfo = pygame.display.Info()
-        orig_rows = rows
-        orig_cols = cols
-        if self._width > sysinfo.current_w:
-            self._width = sysinfo.current_w
-            cols = self._width / DEFAULT_SQ_SIZE
-        if (self._height + MENU_HEIGHT) > sysinfo.current_h:
-            self._height = sysinfo.current_h - MENU_HEIGHT
-            rows = self._height / DEFAULT_SQ_SIZE
-
-        if orig_rows != rows or orig_cols != cols:
-            sys.stderr.write(("[WARNING] %sx%s doesn't fit your screen, "
-                             "reducing to %sx%s\n" %
-                            (orig_rows, orig_cols, rows, cols)))
+        self._width = min(cols * DEFAULT_SQ_SIZE, sysinfo.current_w)
+        self._height = min(rows * DEFAULT_SQ_SIZE,
+                           sysinfo.current_h - MENU_HEIGHT)
 
         self._surf = pygame.display.set_mode((self._width,
                                              self._height + MENU_HEIGHT))
@@ -539,15 +1308,22 @@ class SPDemo(object):
                                           self._width, MENU_HEIGHT))
         menu_dict = {"Algorithm": WALKERS.keys(),
                      "Brush": BRUSHES,
-                     "Diagonals": ["Off", "On"]}
+                     "Diagonals": ["Off", "On"],
+                     "Heuristic": sorted(HEURISTICS),
+                     "Speed": SPEEDS}
         self._menu = Menu(menu_surf, menu_dict)
+        self._menu_rect = pygame.Rect(0, self._height,
+                                      self._width, MENU_HEIGHT)
 
         self._menu.select('Algorithm', DEFAULT_WALKER)
         self._menu.select('Brush', DEFAULT_BRUSH)
         self._menu.select('Diagonals', 'On')
+        self._menu.select('Heuristic', DEFAULT_HEURISTIC)
+        self._menu.select('Speed', DEFAULT_SPEED)
 
         grid_surf = self._surf.subsurface((0, 0, self._width, self._height))
-        self._grid = SPDemoGrid(rows, cols, grid_surf)
+        self._grid = SPDemoGrid(rows, cols, grid_surf, graph, map_file,
+                                recording)
 
     def run(self):
         clock = pygame.time.Clock()
@@ -566,6 +1342,8 @@ class SPDemo(object):
                             self._grid.set_walker(cfg['Algorithm'])
                             self._grid.set_brush(cfg['Brush'])
                             self._grid.set_diagonals(cfg['Diagonals'])
+                            self._grid.set_heuristic(cfg['Heuristic'])
+                            self._grid.set_speed(cfg['Speed'])
                     else:
                         self._grid.kbd_event(event)
                 elif (not self._menu.is_active() and
@@ -574,14 +1352,19 @@ class SPDemo(object):
                                         pygame.MOUSEMOTION)):
                     self._grid.mouse_event(event)
 
-            self._grid.draw()
+            rects = self._grid.draw()
             self._menu.draw()
+            rects.append(self._menu_rect)
             clock.tick(DEFAULT_FPS)
-            pygame.display.flip()
+            # Update only the parts of the screen that changed
+            pygame.display.update(rects)
 
 
 def usage():
     sys.stderr.write("USAGE: %s: ROWSxCOLUNMS\n" % sys.argv[0])
+    sys.stderr.write("       %s: MAP [RECORDING]\n" % sys.argv[0])
+    sys.stderr.write("       %s: batch MAP [QUERIES] [-o OUTPUT] [-j JOBS]\n"
+                     % sys.argv[0])
     sys.exit(1)
 
 
@@ -593,36 +1376,96 @@ def show_help():
     print "Kyes:"
     print "   Space      - start,resume/pause the visualization"
     print "   c          - clean everything from the grid"
+    print "   s          - save walls and weights to the map file"
+    print ("   t          - save a Chrome trace of the search to %s"
+           % DEFAULT_TRACE_FILE)
+    print "   f          - show/hide the heat map of costs of getting"
+    print "                to the destination (its flow field)"
+    print "   r          - replay the last search or leave the replay"
+    print ("   w          - save the last search to %s"
+           % DEFAULT_RECORDING_FILE)
+    print "   +/-        - zoom in/out"
+    print "   Arrows     - scroll the grid"
     print "   Esc        - enter to the menu mode, clean everything"
     print "                from the grid except walls and weights"
     print "   Up/Down    - (in menu mode) swtich the value of selected option"
     print "   Left/Right - (in menu mode) switch current menu option"
     print ""
+    print "Replay:"
+    print "   Space      - play/pause"
+    print "   ,/.        - a step back/forward"
+    print "   Home/End   - go to the start/end of the search"
+    print "   0-9        - go to 0%-90% of the search"
+    print "   Dragging with the left button scrubs through the search,"
+    print "   steps are played at the selected speed."
+    print ""
     print "Mouse:"
     print ("   You can move source (%s) and destination (%s) points withing the grid"
            % (SOURCE_POINT_COLOR, DESTINATION_POINT_COLOR))
     print "   using mouse. You can also draw walls and set weights to any"
     print "   non-busy cell on the grid. (note: default weight of \"white\""
     print "   cells is %d)" % DEFAULT_CELL_WEIGHT
+    print "   The wheel zooms in and out, dragging with the right button"
+    print "   scrolls the grid."
+    print "   With LPA* walls, weights and points can be changed while"
+    print "   the path is being searched or after it has been found."
     print ""
     print "Menu:"
     print "  -> Algorithm: select shortest path finding algorithm"
     print "  -> Brush: switch between drawing walls and setting weights facilities"
     print "  -> Diagonals: enable/disable diagonal moves"
+    print "  -> Heuristic: distance estimate of A* and JPS, \"Auto\" is the"
+    print "                tightest one that still gives the shortest paths"
+    print "  -> Speed: walker steps per frame, \"Max\" for as many as fit"
+    print "            into a frame, \"Instant\" to show just the result,"
+    print "            \"Background\" to search in another thread without"
+    print "            blocking the window"
 
 
 def main():
-    if len(sys.argv) != 2:
-        usage()
-
-    try:
-        rows, cols = [int(i) for i in sys.argv[1].split('x')]
-    except ValueError:
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        # Headless mode, see batch.py
+        import batch
+        batch.main(sys.argv[2:])
+        return
+    if len(sys.argv) not in (2, 3):
         usage()
+    if pygame is None:
+        sys.stderr.write("Error: pygame is required, see README.md\n")
+        sys.exit(1)
+
+    graph = map_file = None
+    if os.path.exists(sys.argv[1]):
+        # Edit a map file, Moving AI maps are saved in the binary format
+        # next to the original
+        map_file = sys.argv[1]
+        try:
+            graph = load_map(map_file)
+        except (IOError, ValueError) as err:
+            sys.stderr.write("Error: " + str(err) + "\n")
+            sys.exit(1)
+
+        rows, cols = graph.get_rows(), graph.get_cols()
+        if map_file.endswith('.map'):
+            map_file = os.path.splitext(map_file)[0] + '.spmap'
+    else:
+        try:
+            rows, cols = [int(i) for i in sys.argv[1].split('x')]
+        except ValueError:
+            usage()
+
+    recording = None
+    if len(sys.argv) == 3:
+        # Replay a search saved with "w"
+        try:
+            recording = load_recording(sys.argv[2])
+        except (IOError, ValueError) as err:
+            sys.stderr.write("Error: " + str(err) + "\n")
+            sys.exit(1)
 
     show_help()
     try:
-        spd = SPDemo(rows, cols)
+        spd = SPDemo(rows, cols, graph, map_file, recording)
         spd.run()
     except ValueError as err:
         sys.stderr.write("Error: " + str(err) + "\n")
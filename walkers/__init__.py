@@ -1,3 +1,30 @@
 from astar import AStarWalker
 from dijkstra import DijkstraWalker
 from bfs import BFSWalker
+from dial import DialWalker
+from bidirectional import BidirectionalWalker, BidirectionalDijkstraWalker
+from jps import JPSWalker
+from lpastar import LPAStarWalker
+from hpastar import HPAStarWalker
+from alt import ALTWalker
+from flowfield import FlowFieldWalker
+from wavefront import WavefrontWalker, numpy as _numpy
+
+# Walkers by their names, as seen by users
+WALKERS = {
+    'A*': AStarWalker,
+    'Dijkstra': DijkstraWalker,
+    'Dial': DialWalker,
+    'Bi-A*': BidirectionalWalker,
+    'Bi-Dijkstra': BidirectionalDijkstraWalker,
+    'JPS': JPSWalker,
+    'LPA*': LPAStarWalker,
+    'HPA*': HPAStarWalker,
+    'ALT': ALTWalker,
+    'Flow field': FlowFieldWalker,
+    'BFS': BFSWalker
+}
+
+# Needs numpy
+if _numpy is not None:
+    WALKERS['Wavefront'] = WavefrontWalker
@@ -0,0 +1,259 @@
+import sys
+import heapq
+import struct
+import weakref
+from array import array
+from core.cell import CellStatus
+from walkers.astar import AStarWalker
+
+DEFAULT_LANDMARKS = 8
+
+# Distance of cells that can't be reached, tables keep
+# distances as unsigned 32 bit integers.
+UNREACHABLE = 0xFFFFFFFF
+
+# Landmarks file: LANDMARKS_MAGIC, the number of tables and the tables.
+# Every table is a LANDMARKS_HEADER followed by landmarks' indices and
+# distances to and from all the cells, little endian.
+LANDMARKS_MAGIC = 'SPALT\x01'
+LANDMARKS_HEADER = struct.Struct('<IIIIB')  # rows, cols, checksum,
+                                            # landmarks, diagonals
+
+# graph -> {use_diags: LandmarkTable()}
+_tables = weakref.WeakKeyDictionary()
+
+
+def distances(graph, start, use_diags, reverse=False):
+    """
+    Dijkstra from "start" over the whole graph. Get an array of costs
+    of getting from "start" to every cell (or from every cell to
+    "start" if "reverse" is True), UNREACHABLE for unreachable cells.
+    """
+    deltas = graph.neighbour_deltas(use_diags)
+    dist = array('I', [UNREACHABLE]) * graph.get_size()
+    dist[start] = 0
+    heap = [(0, start)]
+    while heap:
+        cost, idx = heapq.heappop(heap)
+        if cost > dist[idx]:
+            continue
+
+        out_weight = graph.get_weight(idx)
+        for d in deltas[graph.neighbour_mask(idx)]:
+            nidx = idx + d
+            # Entering a cell costs its weight
+            ncost = cost + (out_weight if reverse
+                            else graph.get_weight(nidx))
+            if ncost < dist[nidx]:
+                dist[nidx] = ncost
+                heapq.heappush(heap, (ncost, nidx))
+
+    return dist
+
+
+class LandmarkTable(object):
+    """
+    Distances from a few landmark cells to all the cells of a graph
+    and back. By the triangle inequality, for any landmark L
+
+        d(v, t) >= d(L, t) - d(L, v)
+        d(v, t) >= d(v, L) - d(t, L)
+
+    which gives an admissible and consistent estimate of the
+    cost of getting from v to t that, unlike geometric distances,
+    accounts for walls and weights.
+    """
+
+    def __init__(self, rows, cols, checksum, use_diags, landmarks,
+                 forward, backward):
+        """
+        checksum - GridGraph.checksum() of the map the table is for
+        landmarks - a list of landmark cells' indices
+        forward - a list of arrays of costs from every landmark
+        backward - a list of arrays of costs to every landmark
+        """
+        self.rows = rows
+        self.cols = cols
+        self.checksum = checksum
+        self.use_diags = use_diags
+        self.landmarks = landmarks
+        self._forward = forward
+        self._backward = backward
+
+    @classmethod
+    def build(cls, graph, use_diags, count=DEFAULT_LANDMARKS):
+        """
+        Pick "count" landmarks on the graph and compute the tables.
+        Every next landmark is the cell farthest from the ones
+        already picked, which puts landmarks on the map's outskirts,
+        where they give the best estimates.
+        """
+        free = [idx for idx in xrange(0, graph.get_size())
+                if graph.get_status(idx) != CellStatus.Blocked]
+        landmarks, forward, backward = [], [], []
+        # Distances from the nearest picked landmark
+        nearest = None
+        start = free[0] if free else None
+        while start is not None and len(landmarks) < count:
+            landmarks.append(start)
+            forward.append(distances(graph, start, use_diags))
+            backward.append(distances(graph, start, use_diags,
+                                      reverse=True))
+            if nearest is None:
+                nearest = array('I', forward[-1])
+            else:
+                nearest = array('I', map(min, nearest, forward[-1]))
+
+            start = None
+            farthest = 0
+            for idx in free:
+                if farthest < nearest[idx] < UNREACHABLE:
+                    start, farthest = idx, nearest[idx]
+
+        return cls(graph.get_rows(), graph.get_cols(), graph.checksum(),
+                   use_diags, landmarks, forward, backward)
+
+    def matches(self, graph):
+        """Check if the table has been built for the graph's map"""
+        return (self.rows == graph.get_rows() and
+                self.cols == graph.get_cols() and
+                self.checksum == graph.checksum())
+
+    def estimate(self, idx, target):
+        """Get a lower bound of the cost from "idx" to "target" """
+        best = 0
+        for fwd, bwd in zip(self._forward, self._backward):
+            from_l, to_l = fwd[idx], bwd[idx]
+            target_from_l, target_to_l = fwd[target], bwd[target]
+            if from_l != UNREACHABLE and target_from_l != UNREACHABLE:
+                best = max(best, int(target_from_l) - from_l)
+            if to_l != UNREACHABLE and target_to_l != UNREACHABLE:
+                best = max(best, int(to_l) - target_to_l)
+
+        return best
+
+    def write(self, fobj):
+        fobj.write(LANDMARKS_HEADER.pack(self.rows, self.cols, self.checksum,
+                                         len(self.landmarks),
+                                         self.use_diags))
+        fobj.write(_le_bytes(array('I', self.landmarks)))
+        for table in self._forward + self._backward:
+            fobj.write(_le_bytes(table))
+
+    @classmethod
+    def read(cls, fobj):
+        raw = fobj.read(LANDMARKS_HEADER.size)
+        if len(raw) != LANDMARKS_HEADER.size:
+            raise ValueError("Truncated landmarks file")
+
+        rows, cols, checksum, count, use_diags = \
+            LANDMARKS_HEADER.unpack(raw)
+        landmarks = list(_read_array(fobj, count))
+        tables = [_read_array(fobj, rows * cols)
+                  for _ in xrange(0, 2 * count)]
+        return cls(rows, cols, checksum, bool(use_diags), landmarks,
+                   tables[:count], tables[count:])
+
+
+def _le_bytes(arr):
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+
+    return arr.tostring()
+
+
+def _read_array(fobj, size):
+    arr = array('I')
+    raw = fobj.read(size * arr.itemsize)
+    if len(raw) != size * arr.itemsize:
+        raise ValueError("Truncated landmarks file")
+
+    arr.fromstring(raw)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+
+    return arr
+
+
+def save_landmarks(tables, fobj):
+    """
+    Save a list of LandmarkTable()s. "fobj" is
+    either a file name or a file object.
+    """
+    if isinstance(fobj, basestring):
+        with open(fobj, 'wb') as f:
+            return save_landmarks(tables, f)
+
+    fobj.write(LANDMARKS_MAGIC)
+    fobj.write(struct.pack('<I', len(tables)))
+    for table in tables:
+        table.write(fobj)
+
+
+def load_landmarks(fobj):
+    """Load a list of LandmarkTable()s saved by save_landmarks()"""
+    if isinstance(fobj, basestring):
+        with open(fobj, 'rb') as f:
+            return load_landmarks(f)
+
+    if fobj.read(len(LANDMARKS_MAGIC)) != LANDMARKS_MAGIC:
+        raise ValueError("Not a landmarks file")
+
+    count, = struct.unpack('<I', fobj.read(4))
+    return [LandmarkTable.read(fobj) for _ in xrange(0, count)]
+
+
+def get_landmarks(graph, use_diags):
+    """
+    Get the LandmarkTable() of the graph, building it if the graph
+    doesn't have one yet. Tables are shared by all walkers on the
+    graph and dropped as soon as a wall or a weight changes.
+    """
+    tables = _graph_tables(graph)
+    table = tables.get(use_diags)
+    if table is None:
+        table = LandmarkTable.build(graph, use_diags)
+        tables[use_diags] = table
+
+    return table
+
+
+def set_landmarks(graph, table):
+    """Make ALTWalker()s use a (loaded) table on the graph"""
+    if not table.matches(graph):
+        raise ValueError("Landmarks are built for another map")
+
+    _graph_tables(graph)[table.use_diags] = table
+
+
+def _graph_tables(graph):
+    tables = _tables.get(graph)
+    if tables is None:
+        tables = {}
+        # The callback must not reference the graph,
+        # or the graph would never leave the cache.
+        graph.add_listener(lambda idx: tables.clear())
+        _tables[graph] = tables
+
+    return tables
+
+
+class ALTWalker(AStarWalker):
+    """
+    A* with the landmark (ALT: A*, Landmarks, Triangle inequality)
+    heuristic, see LandmarkTable(). The table is built on the first
+    search on a map (or loaded with set_landmarks()) and reused by
+    all the following searches until the map changes.
+    """
+
+    pluggable_heuristic = False
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags,
+                 queue_type='indexed'):
+        super(ALTWalker, self).__init__(graph, src_cell, dst_cell,
+                                        use_diags, queue_type=queue_type)
+        self._landmarks = get_landmarks(graph, use_diags)
+
+    def _heuristic(self, idx):
+        return self._landmarks.estimate(idx, self._dst_cell.index)
@@ -1,85 +1,108 @@
-import heapq
 from core.cell import CellStatus
-from core.config import DEFAULT_CELL_WEIGHT
 from walkers.basic import BasicWalker
+from walkers.heuristics import DEFAULT_HEURISTIC, make_heuristic
+from walkers.pqueue import PRIORITY_QUEUES
 
 
 class AStarNode(object):
-    def __init__(self, cell):
-        self.cell = cell
+    __slots__ = ('idx', 'est_cost', 'exact_cost')
+
+    def __init__(self, idx):
+        self.idx = idx  # index of the cell in the graph
         self.est_cost = 0
         self.exact_cost = 0
 
     def __str__(self):
-        return "(%s, %s [%s, %s])" % (self.est_cost, self.exact_cost,
-                                      self.cell.row, self.cell.col)
+        return "(%s, %s [%s])" % (self.est_cost, self.exact_cost, self.idx)
 
-    def __cmp__(self, node):
-        # For priority queue
-        return cmp(self.est_cost + self.exact_cost,
-                   node.est_cost + node.exact_cost)
+    def priority(self):
+        return self.est_cost + self.exact_cost
 
 
 class AStarWalker(BasicWalker):
     """
-    A* shortest path finding algorithm with optional
-    manhattan distance heuristic.
+    A* shortest path finding algorithm with optional heuristic.
     """
 
+    pluggable_heuristic = True
+
     def __init__(self, graph, src_cell, dst_cell,
-                 use_diags, use_heuristic=True):
+                 use_diags, use_heuristic=True, queue_type='indexed',
+                 heuristic=DEFAULT_HEURISTIC):
+        """
+        queue_type - a kind of priority queue for the open set,
+                     one of PRIORITY_QUEUES keys
+        heuristic - a name of the heuristic, one of HEURISTICS keys
+        """
         super(AStarWalker, self).__init__(graph, src_cell,
                                           dst_cell, use_diags)
+        assert queue_type in PRIORITY_QUEUES.keys()
         self._finished = False
         self._use_heuristic = use_heuristic
-
-        self._nodes = []
-        for c in self._graph.cells():
-            self._nodes.append(AStarNode(c))
-
-        start_node = self._cell_to_node(self._src_cell)
-        start_node.exact_cost = 0
-        self._to_visit = [start_node]
+        if use_heuristic:
+            self._estimate = make_heuristic(heuristic, graph, dst_cell,
+                                            use_diags)
+
+        self._deltas = graph.neighbour_deltas(use_diags)
+        # Nodes are made when cells get discovered, so
+        # the setup doesn't depend on the size of the graph.
+        start_node = AStarNode(src_cell.index)
+        self._nodes = {src_cell.index: start_node}
+        self._to_visit = PRIORITY_QUEUES[queue_type]()
+        self._to_visit.push(start_node, start_node.priority())
 
     def finished(self):
         return self._finished
 
+    def queue_stats(self):
+        return self._to_visit.stats()
+
     def step(self):
         if len(self._to_visit) == 0:
             self._finished = True
         if self._finished:
             return
 
+        graph = self._graph
         while len(self._to_visit) > 0:
-            cnode = heapq.heappop(self._to_visit)
-            cnode.cell.status = CellStatus.Visited
-            if cnode.cell == self._dst_cell:
+            cnode = self._to_visit.pop()
+            cidx = cnode.idx
+            graph.set_status(cidx, CellStatus.Visited)
+            if cidx == self._dst_cell.index:
                 self._finished = True
                 return
 
-            for c in cnode.cell.neighbours(diagonals=self._use_diags):
-                n = self._cell_to_node(c)
-                ex_c = c.weight + cnode.exact_cost
-                if n.cell.status == CellStatus.Discovered:
+            for nidx, cost in self._successors(cidx):
+                ex_c = cost + cnode.exact_cost
+                status = graph.get_status(nidx)
+                if status == CellStatus.Discovered:
+                    n = self._nodes[nidx]
                     if ex_c < n.exact_cost:
-                        n.cell.parent = cnode.cell
+                        graph.set_parent(nidx, cidx)
                         n.exact_cost = ex_c
-                        heapq.heapify(self._to_visit)
-                elif n.cell.status == CellStatus.NotVisited:
+                        self._to_visit.decrease_key(n, n.priority())
+                elif status == CellStatus.NotVisited:
+                    n = AStarNode(nidx)
+                    self._nodes[nidx] = n
                     n.exact_cost = ex_c
-                    n.est_cost = self._heuristic(n.cell, self._dst_cell)
-                    n.cell.status = CellStatus.Discovered
-                    n.cell.parent = cnode.cell
-                    heapq.heappush(self._to_visit, n)
+                    n.est_cost = self._heuristic(nidx)
+                    graph.set_status(nidx, CellStatus.Discovered)
+                    graph.set_parent(nidx, cidx)
+                    self._to_visit.push(n, n.priority())
             break
 
-    def _cell_to_node(self, cell):
-        return self._nodes[cell.row * self._graph.get_cols() + cell.col]
-
-    def _heuristic(self, start, end):
+    def _successors(self, idx):
+        """
+        Generate (successor index, cost of getting there from "idx")
+        pairs for the cell being expanded.
+        """
+        graph = self._graph
+        for d in self._deltas[graph.neighbour_mask(idx)]:
+            yield idx + d, graph.get_weight(idx + d)
+
+    def _heuristic(self, idx):
+        """Estimate the cost of getting from "idx" to the destination"""
         if not self._use_heuristic:
             return 0
 
-        # manhattan distance
-        return (DEFAULT_CELL_WEIGHT * 0.9 *
-                (abs(end.row - start.row) + abs(end.col - start.col)))
+        return self._estimate(idx)
@@ -0,0 +1,246 @@
+import Queue
+import threading
+from array import array
+from core.cell import CellStatus
+from core.gridgraph import GridGraph
+from walkers.probe import SearchProbe
+
+# Max number of cell events waiting for the consumer,
+# the solver blocks when the queue is full.
+SOLVER_QUEUE_SIZE = 4096
+
+# Walker steps between publishing changed cells
+SOLVER_BATCH = 64
+
+# How often (in seconds) a blocked solver checks if it's cancelled
+SOLVER_POLL_TIME = 0.05
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class BackgroundWalker(object):
+    """
+    Runs a walker in a background thread, so that expensive steps
+    don't block the thread that draws and handles input.
+
+    The walker searches its own copy of the graph, changed cells are
+    published as compact (cell index, new status) events through a
+    bounded queue and applied to the original graph by drain(), which
+    the consumer calls as often as it wants and which handles a
+    bounded number of events per call. Edits of walls and weights
+    of the original graph (and move_endpoints()) are forwarded to the
+    copy, so incremental walkers keep repairing the path.
+
+    pause() and close() are cooperative: the solver checks them
+    between batches of SOLVER_BATCH steps and while it waits for
+    room in the queue. If the walker raises, the search is over:
+    finished() becomes True with the exception in "error".
+
+    Otherwise it looks like a walker wrapped in SearchProbe().
+    """
+
+    def __init__(self, wclass, graph, src_cell, dst_cell, use_diags,
+                 **kwargs):
+        self._graph = graph
+        self.incremental = wclass.incremental
+        # The solver's copy is made here rather than in its thread, so
+        # the caller gets MemoryError if the map doesn't fit, and the
+        # graph isn't read while the caller changes it.
+        weights, walls, masks = graph.get_arrays()
+        self._copy = GridGraph(graph.get_rows(), graph.get_cols(),
+                               array('H', weights), array('b', walls),
+                               array('B', masks))
+        self._events = Queue.Queue(SOLVER_QUEUE_SIZE)
+        # Edits for the solver, (method name, arguments) pairs
+        self._commands = Queue.Queue()
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = False
+
+        self._done = False
+        self._path = []
+        self._probe = None
+        # The exception the solver has failed with, if any
+        self.error = None
+        # Set while drain() applies events, so that they
+        # aren't forwarded back to the solver as edits.
+        self._applying = False
+        graph.add_listener(self._cell_changed)
+
+        self._thread = threading.Thread(
+            target=self._solve,
+            args=(wclass, src_cell.index, dst_cell.index, use_diags, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def finished(self):
+        """Check if the solver is done and all its events are drained"""
+        return self._done
+
+    def drain(self, max_events):
+        """
+        Apply at most "max_events" cell events to the graph.
+        Return the number of applied events.
+        """
+        graph = self._graph
+        count = 0
+        self._applying = True
+        try:
+            while count < max_events:
+                try:
+                    idx, status = self._events.get_nowait()
+                except Queue.Empty:
+                    break
+
+                if idx is None:
+                    # The search is over, "status" is the path
+                    # or the exception the solver has failed with
+                    if isinstance(status, Exception):
+                        self.error = status
+                    else:
+                        self._path = status
+                    self._done = True
+                    continue
+
+                self._done = False
+                graph.set_status(idx, status)
+                count += 1
+        finally:
+            self._applying = False
+
+        return count
+
+    def pause(self, paused=True):
+        if paused:
+            self._running.clear()
+        else:
+            self._running.set()
+
+    def close(self):
+        """Cancel the search and wait for the solver to quit"""
+        self._graph.remove_listener(self._cell_changed)
+        self._cancelled = True
+        self._running.set()
+        self._thread.join()
+
+    def move_endpoints(self, src_cell, dst_cell):
+        self._send('move_endpoints', src_cell.index, dst_cell.index)
+
+    def get_path(self):
+        graph = self._graph
+        return [graph.get_cell_by_index(idx) for idx in self._path]
+
+    def stats(self):
+        return self._probe.stats()
+
+    def save(self, fobj, chrome=False):
+        if self._probe is not None:
+            self._probe.save(fobj, chrome)
+
+    def _send(self, *command):
+        self._done = False
+        self._commands.put(command)
+
+    def _cell_changed(self, idx):
+        # Graph listener: forward edits of walls and weights
+        if not self._applying and idx is not None:
+            graph = self._graph
+            self._send('set_cell', idx,
+                       graph.get_status(idx) == CellStatus.Blocked,
+                       graph.get_weight(idx))
+
+    def _solve(self, wclass, src, dst, use_diags, kwargs):
+        graph = self._copy
+        graph.track_dirty_cells()
+        try:
+            probe = SearchProbe(wclass, graph, graph.get_cell_by_index(src),
+                                graph.get_cell_by_index(dst), use_diags,
+                                **kwargs)
+            self._probe = probe
+            reported = False
+            while True:
+                self._check_running()
+                if self._apply_commands(graph, probe,
+                                        block=probe.finished()):
+                    reported = False
+                if not probe.finished():
+                    probe.advance(max_expansions=SOLVER_BATCH)
+                    self._publish(graph)
+                elif not reported:
+                    self._publish(graph)
+                    path = [c.index for c in probe.get_path()]
+                    self._put((None, path))
+                    reported = True
+                    if not probe.incremental:
+                        break
+        except _Cancelled:
+            pass
+        except Exception as err:
+            try:
+                self._put((None, err))
+            except _Cancelled:
+                pass
+        finally:
+            if self._probe is not None:
+                self._probe.close()
+
+    def _check_running(self):
+        while not self._running.wait(SOLVER_POLL_TIME):
+            if self._cancelled:
+                raise _Cancelled()
+        if self._cancelled:
+            raise _Cancelled()
+
+    def _apply_commands(self, graph, probe, block):
+        """
+        Apply edits sent by the consumer, waiting for them if "block"
+        is True. Return True if there were any.
+        """
+        try:
+            if block:
+                command = self._commands.get(timeout=SOLVER_POLL_TIME)
+            else:
+                command = self._commands.get_nowait()
+        except Queue.Empty:
+            return False
+
+        while True:
+            name, args = command[0], command[1:]
+            if name == 'set_cell':
+                idx, blocked, weight = args
+                graph.set_weight(idx, weight)
+                if blocked != (graph.get_status(idx) == CellStatus.Blocked):
+                    graph.set_status(idx, CellStatus.Blocked if blocked
+                                     else CellStatus.NotVisited)
+            elif name == 'move_endpoints':
+                src, dst = args
+                probe.move_endpoints(graph.get_cell_by_index(src),
+                                     graph.get_cell_by_index(dst))
+
+            try:
+                command = self._commands.get_nowait()
+            except Queue.Empty:
+                return True
+
+    def _publish(self, graph):
+        dirty = graph.pop_dirty_cells()
+        if dirty is None:
+            # The copy has been cleared, e.g. by moving the
+            # source of an incremental walker: send everything.
+            dirty = xrange(0, graph.get_size())
+
+        for idx in dirty:
+            self._put((idx, graph.get_status(idx)))
+
+    def _put(self, event):
+        """Queue an event, waiting for room while not cancelled"""
+        while True:
+            if self._cancelled:
+                raise _Cancelled()
+            try:
+                self._events.put(event, timeout=SOLVER_POLL_TIME)
+                return
+            except Queue.Full:
+                pass
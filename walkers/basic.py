@@ -1,8 +1,21 @@
+import time
+
+
 class BasicWalker(object):
     """
     Basic abstract class for all "walkers"
     (i.e. shortest path finding algorithms).
     """
+
+    # Incremental walkers keep their state when walls and weights
+    # of the graph change and repair the path instead of starting
+    # from scratch. They must also implement move_endpoints().
+    incremental = False
+
+    # Walkers that take a "heuristic" argument,
+    # a name of one of walkers.heuristics.HEURISTICS.
+    pluggable_heuristic = False
+
     def __init__(self, graph, src_cell, dst_cell, use_diags):
         """
         graph - GridGraph()
@@ -25,6 +38,45 @@ class BasicWalker(object):
         """Signle step of the algorithm"""
         raise NotImplementedError
 
+    def advance(self, max_expansions=None, deadline=None):
+        """
+        Make steps until the search is finished, "max_expansions"
+        steps are made or time.time() reaches "deadline" (either
+        limit is ignored if it's None). Return the number of steps.
+        """
+        steps = 0
+        while not self.finished():
+            if max_expansions is not None and steps >= max_expansions:
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
+
+            self.step()
+            steps += 1
+
+        return steps
+
+    def move_endpoints(self, src_cell, dst_cell):
+        """
+        Continue the search with new source and/or
+        destination cells (for incremental walkers only)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release everything the walker holds,
+        called when the walker isn't needed anymore
+        """
+        pass
+
+    def queue_stats(self):
+        """
+        Get operation counters of the walker's priority queue
+        (empty if the walker doesn't use one)
+        """
+        return {}
+
     def get_path(self):
         """
         Get shortest path
@@ -1,3 +1,4 @@
+from collections import deque
 from core.cell import CellStatus
 from walkers.basic import BasicWalker
 
@@ -9,28 +10,43 @@ class BFSWalker(BasicWalker):
 
     def __init__(self, graph, src_cell, dst_cell, use_diags):
         super(BFSWalker, self).__init__(graph, src_cell, dst_cell, use_diags)
-        self._queue = [self._src_cell]
+        self._queue = deque([src_cell.index])
+        self._deltas = graph.neighbour_deltas(use_diags)
+        self._pushes = 1
+        self._pops = 0
+        self._peak_size = 1
         self._finished = False
 
     def finished(self):
         return self._finished
 
+    def queue_stats(self):
+        return {'pushes': self._pushes,
+                'pops': self._pops,
+                'peak_size': self._peak_size}
+
     def step(self):
         if len(self._queue) == 0:
             self._finished = True
         if self._finished:
             return
 
+        graph = self._graph
         while len(self._queue) > 0:
-            cur_cell = self._queue.pop(0)
-            cur_cell.status = CellStatus.Visited
-            if cur_cell == self._dst_cell:
+            cidx = self._queue.popleft()
+            self._pops += 1
+            graph.set_status(cidx, CellStatus.Visited)
+            if cidx == self._dst_cell.index:
                 self._finished = True
                 return
 
-            for c in cur_cell.neighbours(diagonals=self._use_diags):
-                if c.status == CellStatus.NotVisited:
-                    c.status = CellStatus.Discovered
-                    c.parent = cur_cell
-                    self._queue.append(c)
+            for d in self._deltas[graph.neighbour_mask(cidx)]:
+                nidx = cidx + d
+                if graph.get_status(nidx) == CellStatus.NotVisited:
+                    graph.set_status(nidx, CellStatus.Discovered)
+                    graph.set_parent(nidx, cidx)
+                    self._queue.append(nidx)
+                    self._pushes += 1
+
+            self._peak_size = max(self._peak_size, len(self._queue))
             break
@@ -0,0 +1,170 @@
+from core.cell import CellStatus
+from walkers.basic import BasicWalker
+from walkers.heuristics import make_heuristic
+from walkers.pqueue import PRIORITY_QUEUES
+
+
+class SearchFrontier(object):
+    """
+    State of one direction of the bidirectional search.
+    Nodes are identified by cell indices.
+    """
+
+    def __init__(self, start_idx, queue_type):
+        self.costs = {start_idx: 0}  # idx -> best known cost
+        self.parents = {}            # idx -> previous idx in this direction
+        self.closed = set()
+        self.queue = PRIORITY_QUEUES[queue_type]()
+
+
+class BidirectionalWalker(BasicWalker):
+    """
+    Bidirectional A* (or Dijkstra if "use_heuristic" is False)
+    shortest path finding algorithm. One search grows from the source,
+    another one from the destination, every step expands a node of the
+    direction with the smaller open set.
+
+    Both directions use the average of the forward and backward
+    heuristics as a potential, which keeps the termination criterion
+    as simple as for bidirectional Dijkstra: stop once the sum of the
+    lowest keys in both open sets reaches the best path found so far.
+    """
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags,
+                 use_heuristic=True, queue_type='indexed'):
+        super(BidirectionalWalker, self).__init__(graph, src_cell,
+                                                  dst_cell, use_diags)
+        assert queue_type in PRIORITY_QUEUES.keys()
+        self._finished = False
+        self._use_heuristic = use_heuristic
+        self._to_dst = make_heuristic('Auto', graph, dst_cell, use_diags)
+        self._to_src = make_heuristic('Auto', graph, src_cell, use_diags)
+
+        # The forward search measures the cost of getting to
+        # a cell from the source, the backward one measures the cost
+        # of getting from a cell to the destination.
+        self._fwd = SearchFrontier(src_cell.index, queue_type)
+        self._bwd = SearchFrontier(dst_cell.index, queue_type)
+        self._fwd.queue.push(src_cell.index, self._potential(src_cell.index))
+        self._bwd.queue.push(dst_cell.index,
+                             -self._potential(dst_cell.index))
+        self._deltas = graph.neighbour_deltas(use_diags)
+
+        # The cost of the best path found so far and a cell
+        # where its forward and backward halves meet.
+        self._best_cost = None
+        self._meeting_idx = None
+        if src_cell == dst_cell:
+            self._best_cost = 0
+            self._meeting_idx = src_cell.index
+
+    def finished(self):
+        return self._finished
+
+    def queue_stats(self):
+        fstats = self._fwd.queue.stats()
+        bstats = self._bwd.queue.stats()
+        return {k: fstats[k] + bstats[k] for k in fstats.keys()}
+
+    def step(self):
+        if self._finished:
+            return
+        if self._can_stop():
+            self._finish()
+            return
+
+        if len(self._fwd.queue) <= len(self._bwd.queue):
+            self._expand(self._fwd, self._bwd, True)
+        else:
+            self._expand(self._bwd, self._fwd, False)
+
+    def _can_stop(self):
+        if len(self._fwd.queue) == 0 or len(self._bwd.queue) == 0:
+            return True
+        if self._best_cost is None:
+            return False
+
+        return (self._fwd.queue.top_priority() +
+                self._bwd.queue.top_priority() >= self._best_cost)
+
+    def _expand(self, front, other, forward):
+        graph = self._graph
+        idx = front.queue.pop()
+        front.closed.add(idx)
+        graph.set_status(idx, CellStatus.Visited)
+
+        cost = front.costs[idx]
+        weight = graph.get_weight(idx)
+        for d in self._deltas[graph.neighbour_mask(idx)]:
+            nidx = idx + d
+            if nidx in front.closed:
+                continue
+
+            # Entering a cell costs its weight, so going forward
+            # we pay for the neighbour and going backward for
+            # the cell being expanded.
+            ncost = cost + (graph.get_weight(nidx) if forward else weight)
+            old_cost = front.costs.get(nidx)
+            if old_cost is not None and ncost >= old_cost:
+                continue
+
+            front.costs[nidx] = ncost
+            front.parents[nidx] = idx
+            if forward:
+                priority = ncost + self._potential(nidx)
+            else:
+                priority = ncost - self._potential(nidx)
+
+            if old_cost is None:
+                front.queue.push(nidx, priority)
+            else:
+                front.queue.decrease_key(nidx, priority)
+
+            if graph.get_status(nidx) == CellStatus.NotVisited:
+                graph.set_status(nidx, CellStatus.Discovered)
+
+            if nidx in other.costs:
+                total = ncost + other.costs[nidx]
+                if self._best_cost is None or total < self._best_cost:
+                    self._best_cost = total
+                    self._meeting_idx = nidx
+
+    def _finish(self):
+        self._finished = True
+        if self._meeting_idx is None:
+            return
+
+        # Link both halves of the path through parents of the cells,
+        # so that get_path() can follow them from the destination.
+        graph = self._graph
+        idx = self._meeting_idx
+        while idx in self._fwd.parents:
+            graph.set_parent(idx, self._fwd.parents[idx])
+            idx = self._fwd.parents[idx]
+
+        idx = self._meeting_idx
+        while idx in self._bwd.parents:
+            nidx = self._bwd.parents[idx]
+            graph.set_parent(nidx, idx)
+            idx = nidx
+
+    def _potential(self, idx):
+        """
+        Potential of the forward search, the backward search uses
+        the same one with the opposite sign.
+        """
+        if not self._use_heuristic:
+            return 0
+
+        return (self._to_dst(idx) - self._to_src(idx)) / 2.0
+
+
+class BidirectionalDijkstraWalker(BidirectionalWalker):
+    """
+    Bidirectional Dijkstra: BidirectionalWalker without heuristic.
+    """
+    def __init__(self, graph, src_cell, dst_cell, use_diags,
+                 queue_type='indexed'):
+        super(BidirectionalDijkstraWalker, self).__init__(
+            graph, src_cell, dst_cell, use_diags,
+            use_heuristic=False, queue_type=queue_type)
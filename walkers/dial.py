@@ -0,0 +1,127 @@
+import time
+from array import array
+from core.cell import CellStatus
+from walkers.alt import UNREACHABLE
+from walkers.basic import BasicWalker
+
+
+class DialWalker(BasicWalker):
+    """
+    Dijkstra shortest path finding algorithm with Dial's bucket
+    queue instead of a binary heap. Cell weights are small integers,
+    so the open set can be kept as a circular array of buckets, one
+    per distance, and no comparison heap is needed at all.
+
+    Unlike AStarWalker it doesn't make nodes: distances are kept in
+    a flat array of 32 bit integers indexed by cells (4 bytes per cell
+    of the graph, like FlowField) and buckets are lists of cell indices.
+    A cell is queued again when its distance gets lower, the entry left
+    behind is skipped when it's popped (a stale pop).
+    """
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags):
+        super(DialWalker, self).__init__(graph, src_cell,
+                                         dst_cell, use_diags)
+        self._finished = False
+        self._deltas = graph.neighbour_deltas(use_diags)
+        self._costs = array('I', [UNREACHABLE]) * graph.get_size()
+        self._costs[src_cell.index] = 0
+        # Queued distances are never further than the highest
+        # weight from the distance of the current bucket.
+        self._buckets = [[] for _ in xrange(graph.max_weight() + 1)]
+        self._buckets[0].append(src_cell.index)
+        self._cur = 0      # distance of the current bucket
+        self._entries = 1  # number of queued entries including stale ones
+        self.pushes = 1
+        self.pops = 0
+        self.decrease_keys = 0
+        self.stale_pops = 0
+        self.peak_size = 1
+
+    def finished(self):
+        return self._finished
+
+    def queue_stats(self):
+        return {'pushes': self.pushes,
+                'pops': self.pops,
+                'decrease_keys': self.decrease_keys,
+                'stale_pops': self.stale_pops,
+                'peak_size': self.peak_size}
+
+    def step(self):
+        self.advance(1)
+
+    def advance(self, max_expansions=None, deadline=None):
+        # The whole search loop lives here rather than in step(),
+        # so the state is kept in locals between expansions.
+        if self._finished:
+            return 0
+
+        graph = self._graph
+        get_weight = graph.get_weight
+        set_status = graph.set_status
+        set_parent = graph.set_parent
+        neighbour_mask = graph.neighbour_mask
+        deltas = self._deltas
+        costs = self._costs
+        buckets = self._buckets
+        nbuckets = len(buckets)
+        dst = self._dst_cell.index
+        cur = self._cur
+        entries = self._entries
+        peak_size = self.peak_size
+        pushes = pops = decrease_keys = stale_pops = steps = 0
+        while True:
+            if entries == 0:
+                self._finished = True
+                break
+            if max_expansions is not None and steps >= max_expansions:
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
+
+            bucket = buckets[cur % nbuckets]
+            while not bucket:
+                cur += 1
+                bucket = buckets[cur % nbuckets]
+
+            cidx = bucket.pop()
+            entries -= 1
+            pops += 1
+            if costs[cidx] != cur:
+                # The cell has been queued again with a lower distance
+                stale_pops += 1
+                continue
+
+            set_status(cidx, CellStatus.Visited)
+            steps += 1
+            if cidx == dst:
+                self._finished = True
+                break
+
+            for d in deltas[neighbour_mask(cidx)]:
+                nidx = cidx + d
+                ncost = cur + get_weight(nidx)
+                old_cost = costs[nidx]
+                if ncost < old_cost:
+                    if old_cost == UNREACHABLE:
+                        set_status(nidx, CellStatus.Discovered)
+                    else:
+                        decrease_keys += 1
+                    set_parent(nidx, cidx)
+                    costs[nidx] = ncost
+                    buckets[ncost % nbuckets].append(nidx)
+                    entries += 1
+                    pushes += 1
+
+            if entries > peak_size:
+                peak_size = entries
+
+        self._cur = cur
+        self._entries = entries
+        self.peak_size = peak_size
+        self.pushes += pushes
+        self.pops += pops
+        self.decrease_keys += decrease_keys
+        self.stale_pops += stale_pops
+        return steps
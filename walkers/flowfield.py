@@ -0,0 +1,188 @@
+import heapq
+import weakref
+from array import array
+from collections import deque, OrderedDict
+from core.gridgraph import NEIGHBOUR_OFFSETS, STRAIGHT_NEIGHBOURS_MASK
+from walkers.alt import UNREACHABLE
+from walkers.basic import BasicWalker
+
+# Direction of cells without the next step: the destination
+# itself and cells it can't be reached from.
+NO_DIRECTION = -1
+
+# Max number of fields (i.e. destinations) kept per graph
+FLOW_FIELD_CACHE_SIZE = 16
+
+# graph -> OrderedDict({(dst, use_diags): FlowField()})
+_fields = weakref.WeakKeyDictionary()
+
+
+class FlowField(object):
+    """
+    Costs of getting from every cell of a graph to one destination
+    and the first move of a shortest path from every cell, computed
+    by a single search from the destination over the whole graph:
+    BFS if all the weights are the same, Dijkstra otherwise.
+
+    Any number of agents heading to the destination then read their
+    paths off the field in O(path length) without searching:
+
+        idx = agent_idx
+        while idx != -1:
+            ...
+            idx = field.next_index(idx)
+
+    Both arrays take 5 bytes per cell: costs are 32 bit integers
+    (UNREACHABLE for cells the destination can't be reached from),
+    directions are bytes indexing NEIGHBOUR_OFFSETS.
+    """
+
+    def __init__(self, graph, dst, use_diags):
+        """dst - index of the destination cell"""
+        self.dst = dst
+        self.use_diags = use_diags
+        size = graph.get_size()
+        self.costs = array('I', [UNREACHABLE]) * size
+        self.directions = array('b', [NO_DIRECTION]) * size
+
+        cols = graph.get_cols()
+        self._offsets = [dr * cols + dc for dr, dc in NEIGHBOUR_OFFSETS]
+        if graph.min_weight() == graph.max_weight():
+            self._bfs(graph)
+        else:
+            self._dijkstra(graph)
+
+    def cost(self, idx):
+        """Get the cost of getting from "idx" to the destination or None"""
+        cost = self.costs[idx]
+        return None if cost == UNREACHABLE else cost
+
+    def next_index(self, idx):
+        """Get the index of the next cell on the way from "idx" or -1"""
+        direction = self.directions[idx]
+        if direction == NO_DIRECTION:
+            return -1
+
+        return idx + self._offsets[direction]
+
+    def path(self, idx):
+        """
+        Get a list of indices of the path cells from "idx" to the
+        destination (both included), empty if there's no path.
+        """
+        if self.costs[idx] == UNREACHABLE:
+            return []
+
+        path = [idx]
+        while idx != self.dst:
+            idx = self.next_index(idx)
+            path.append(idx)
+
+        return path
+
+    def max_cost(self):
+        """Get the highest cost of reachable cells"""
+        return max(c for c in self.costs if c != UNREACHABLE)
+
+    def _reverse_moves(self):
+        """
+        For every neighbour mask, get (index difference, direction)
+        pairs of moves from the neighbours back to the cell.
+        """
+        diag_mask = 0xFF if self.use_diags else STRAIGHT_NEIGHBOURS_MASK
+        back = [NEIGHBOUR_OFFSETS.index((-dr, -dc))
+                for dr, dc in NEIGHBOUR_OFFSETS]
+        return [tuple((self._offsets[k], back[k]) for k in xrange(0, 8)
+                      if mask & diag_mask & (1 << k))
+                for mask in xrange(0, 256)]
+
+    def _bfs(self, graph):
+        moves = self._reverse_moves()
+        costs, directions = self.costs, self.directions
+        weight = graph.get_weight(self.dst)
+        costs[self.dst] = 0
+        queue = deque([self.dst])
+        while queue:
+            idx = queue.popleft()
+            ncost = costs[idx] + weight
+            for d, direction in moves[graph.neighbour_mask(idx)]:
+                nidx = idx + d
+                if costs[nidx] == UNREACHABLE:
+                    costs[nidx] = ncost
+                    directions[nidx] = direction
+                    queue.append(nidx)
+
+    def _dijkstra(self, graph):
+        moves = self._reverse_moves()
+        costs, directions = self.costs, self.directions
+        costs[self.dst] = 0
+        heap = [(0, self.dst)]
+        while heap:
+            cost, idx = heapq.heappop(heap)
+            if cost > costs[idx]:
+                continue
+
+            # Neighbours pay for entering the cell
+            ncost = cost + graph.get_weight(idx)
+            for d, direction in moves[graph.neighbour_mask(idx)]:
+                nidx = idx + d
+                if ncost < costs[nidx]:
+                    costs[nidx] = ncost
+                    directions[nidx] = direction
+                    heapq.heappush(heap, (ncost, nidx))
+
+
+def get_flow_field(graph, dst_cell, use_diags):
+    """
+    Get the FlowField() of the graph leading to "dst_cell", computing
+    it unless it's cached. The last FLOW_FIELD_CACHE_SIZE fields of
+    every graph are cached until a wall or a weight changes.
+    """
+    fields = _fields.get(graph)
+    if fields is None:
+        fields = OrderedDict()
+        # The callback must not reference the graph,
+        # or the graph would never leave the cache.
+        graph.add_listener(lambda idx: fields.clear())
+        _fields[graph] = fields
+
+    key = (dst_cell.index, use_diags)
+    field = fields.pop(key, None)
+    if field is None:
+        field = FlowField(graph, dst_cell.index, use_diags)
+        if len(fields) >= FLOW_FIELD_CACHE_SIZE:
+            fields.popitem(last=False)
+
+    # The most recently used field goes last
+    fields[key] = field
+    return field
+
+
+class FlowFieldWalker(BasicWalker):
+    """
+    Reads the path off the (cached) FlowField() of the destination,
+    which makes every next search for the same destination from
+    anywhere on the map as cheap as following the path.
+    """
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags):
+        super(FlowFieldWalker, self).__init__(graph, src_cell,
+                                              dst_cell, use_diags)
+        self._field = get_flow_field(graph, dst_cell, use_diags)
+        self._finished = False
+
+    def finished(self):
+        return self._finished
+
+    def step(self):
+        if self._finished:
+            return
+
+        # Parents lead back to the source
+        graph = self._graph
+        path = self._field.path(self._src_cell.index)
+        graph.set_parent(self._src_cell.index, -1)
+        for idx, next_idx in zip(path, path[1:]):
+            graph.set_parent(next_idx, idx)
+
+        self._finished = True
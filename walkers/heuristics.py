@@ -0,0 +1,61 @@
+from math import hypot
+
+# A diagonal move costs as much as a straight one (the weight of the
+# cell it enters), so with diagonal moves the number of moves between
+# two cells is their chebyshev distance. Octile and euclidean distances
+# are larger than that, i.e. with diagonals they overestimate and trade
+# optimality for fewer expansions, just like the inflated variants.
+SQRT2_MINUS_1 = 2 ** 0.5 - 1
+
+
+def manhattan(drow, dcol):
+    return drow + dcol
+
+
+def chebyshev(drow, dcol):
+    return max(drow, dcol)
+
+
+def octile(drow, dcol):
+    return max(drow, dcol) + SQRT2_MINUS_1 * min(drow, dcol)
+
+
+def euclidean(drow, dcol):
+    return hypot(drow, dcol)
+
+
+# Heuristics by their names, as seen by users: (distance function,
+# inflation factor) pairs. None stands for the tightest admissible
+# distance: chebyshev with diagonal moves, manhattan otherwise.
+HEURISTICS = {
+    'Auto': (None, 1),
+    'Manhattan': (manhattan, 1),
+    'Octile': (octile, 1),
+    'Chebyshev': (chebyshev, 1),
+    'Euclidean': (euclidean, 1),
+    'Auto x1.5': (None, 1.5),
+    'Auto x3': (None, 3)
+}
+DEFAULT_HEURISTIC = 'Auto'
+
+
+def make_heuristic(name, graph, target_cell, use_diags):
+    """
+    Get a function estimating the cost of getting from a cell
+    (given by its index) to "target_cell". Distances are multiplied
+    by the minimum weight of the graph's cells, so "Auto" estimates
+    never exceed the real cost however cheap some cells are.
+    """
+    distance, inflation = HEURISTICS[name]
+    if distance is None:
+        distance = chebyshev if use_diags else manhattan
+
+    scale = graph.min_weight() * inflation
+    cols = graph.get_cols()
+    trow, tcol = target_cell.row, target_cell.col
+
+    def estimate(idx):
+        row, col = divmod(idx, cols)
+        return scale * distance(abs(trow - row), abs(tcol - col))
+
+    return estimate
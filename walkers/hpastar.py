@@ -0,0 +1,471 @@
+import heapq
+import weakref
+from core.cell import CellStatus
+from core.config import DEFAULT_CELL_WEIGHT
+from walkers.basic import BasicWalker
+from walkers.pqueue import IndexedHeap
+
+DEFAULT_CLUSTER_SIZE = 16
+
+# Runs of free cells along a cluster border shorter than that
+# get one transition in the middle, longer ones two at the ends.
+MAX_SINGLE_ENTRANCE = 6
+
+# Sides of a cluster its border transitions are kept for, the other
+# ones are the opposite sides of the neighbours. Clusters touching
+# with corners are linked only if diagonal moves are allowed.
+EAST = 0
+SOUTH = 1
+SOUTH_EAST = 2
+SOUTH_WEST = 3
+
+# graph -> {(cluster size, use_diags): ClusterAbstraction()}
+_abstractions = weakref.WeakKeyDictionary()
+
+
+def cluster_search(graph, start, bounds, deltas, targets=(), reverse=False):
+    """
+    Dijkstra from "start" over the cells within "bounds" (a
+    (top, bottom, left, right) tuple, bottom and right excluded).
+    Return a dictionary of costs of getting from "start" to the
+    reached cells (or to "start" from them if "reverse" is True)
+    and a dictionary of their predecessors. Stop as soon as all
+    the "targets" are reached.
+    """
+    top, bottom, left, right = bounds
+    cols = graph.get_cols()
+    costs = {start: 0}
+    parents = {}
+    left_targets = set(targets)
+    left_targets.discard(start)
+    done = set()
+    heap = [(0, start)]
+    while heap and (left_targets or not targets):
+        cost, idx = heapq.heappop(heap)
+        if idx in done:
+            continue
+
+        done.add(idx)
+        left_targets.discard(idx)
+        out_weight = graph.get_weight(idx)
+        for d in deltas[graph.neighbour_mask(idx)]:
+            nidx = idx + d
+            row, col = divmod(nidx, cols)
+            if not (top <= row < bottom and left <= col < right):
+                continue
+
+            # Entering a cell costs its weight
+            ncost = cost + (out_weight if reverse
+                            else graph.get_weight(nidx))
+            if ncost < costs.get(nidx, ncost + 1):
+                costs[nidx] = ncost
+                parents[nidx] = idx
+                heapq.heappush(heap, (ncost, nidx))
+
+    return costs, parents
+
+
+def get_abstraction(graph, cluster_size, use_diags):
+    """
+    Get the ClusterAbstraction() of the graph, the same one
+    is shared by all walkers searching the graph.
+    """
+    per_graph = _abstractions.setdefault(graph, {})
+    key = (cluster_size, use_diags)
+    abstraction = per_graph.get(key)
+    if abstraction is None:
+        abstraction = ClusterAbstraction(graph.get_rows(), graph.get_cols(),
+                                         cluster_size, use_diags)
+        graph.add_listener(abstraction.invalidate)
+        per_graph[key] = abstraction
+
+    return abstraction
+
+
+class ClusterAbstraction(object):
+    """
+    An abstract graph of a grid split into square clusters.
+    Its nodes are cells on both sides of cluster borders
+    ("transitions"). Nodes of neighbouring clusters are linked
+    with a single move, nodes of the same cluster are linked
+    with the cost of the cheapest path within the cluster.
+
+    Clusters are built lazily, when a search gets to them, and
+    cached until a wall or a weight in the cluster changes.
+    The abstraction doesn't reference its graph (which gets passed
+    to its methods), so it doesn't keep the graph alive in the cache.
+    """
+
+    def __init__(self, rows, cols, cluster_size, use_diags):
+        self._rows = rows
+        self._cols = cols
+        self._size = cluster_size
+        self._use_diags = use_diags
+        self._crows = (rows + cluster_size - 1) // cluster_size
+        self._ccols = (cols + cluster_size - 1) // cluster_size
+
+        # side -> offset of the cluster on that side
+        self._sides = {EAST: 1, SOUTH: self._ccols}
+        if use_diags:
+            self._sides[SOUTH_EAST] = self._ccols + 1
+            self._sides[SOUTH_WEST] = self._ccols - 1
+
+        # (cluster, side) -> [(cell in the cluster,
+        #                     cell in the neighbour), ...]
+        self._borders = {}
+        # cluster -> {node: [(node, cost), ...]}
+        self._edges = {}
+        # cluster -> {(from, to): [cells of the path from "to" back
+        #                          to "from", "from" excluded]}
+        self._paths = {}
+
+    def cluster_of(self, idx):
+        row, col = divmod(idx, self._cols)
+        return (row // self._size) * self._ccols + col // self._size
+
+    def bounds(self, cluster):
+        """Get (top, bottom, left, right) bounds of the cluster"""
+        crow, ccol = divmod(cluster, self._ccols)
+        top, left = crow * self._size, ccol * self._size
+        return (top, min(top + self._size, self._rows),
+                left, min(left + self._size, self._cols))
+
+    def nodes(self, graph, cluster):
+        """Get abstract nodes of the cluster"""
+        return self._cluster_edges(graph, cluster).keys()
+
+    def edges(self, graph, idx):
+        """
+        Get a list of (node, cost) edges of the abstract node
+        (empty if "idx" is not a node)
+        """
+        return self._cluster_edges(graph, self.cluster_of(idx)).get(idx, [])
+
+    def invalidate(self, idx):
+        """
+        Graph listener: forget everything that depends
+        on the cell at "idx" (or on all cells if it's None).
+        """
+        if idx is None:
+            self._borders.clear()
+            self._edges.clear()
+            self._paths.clear()
+            return
+
+        row, col = divmod(idx, self._cols)
+        crow, ccol = row // self._size, col // self._size
+        self._drop_cluster(crow * self._ccols + ccol)
+
+        # Cells along cluster borders may also change transitions
+        # and, thus, nodes of the neighbouring clusters.
+        for nrow in xrange(max(crow - 1, 0), min(crow + 2, self._crows)):
+            for ncol in xrange(max(ccol - 1, 0),
+                               min(ccol + 2, self._ccols)):
+                cluster = nrow * self._ccols + ncol
+                for side in self._sides:
+                    top, bottom, left, right = self._border_area(cluster,
+                                                                 side)
+                    if top <= row < bottom and left <= col < right:
+                        self._borders.pop((cluster, side), None)
+                        self._drop_cluster(cluster)
+                        self._drop_cluster(cluster + self._sides[side])
+
+    def path(self, graph, src, dst):
+        """
+        Get the cheapest path from "src" to "dst" of the same cluster
+        within the cluster, as a list of cells' indices from "dst"
+        back to "src" ("src" excluded).
+        """
+        cluster = self.cluster_of(src)
+        paths = self._paths.setdefault(cluster, {})
+        path = paths.get((src, dst))
+        if path is None:
+            _, parents = cluster_search(graph, src, self.bounds(cluster),
+                                        graph.neighbour_deltas(
+                                            self._use_diags),
+                                        targets=[dst])
+            path = []
+            idx = dst
+            while idx != src:
+                path.append(idx)
+                idx = parents[idx]
+
+            # Don't let temporary sources and destinations
+            # of queries pile up in the cache.
+            nodes = self._cluster_edges(graph, cluster)
+            if src in nodes and dst in nodes:
+                paths[(src, dst)] = path
+
+        return path
+
+    def _drop_cluster(self, cluster):
+        self._edges.pop(cluster, None)
+        self._paths.pop(cluster, None)
+
+    def _has_border(self, cluster, side):
+        crow, ccol = divmod(cluster, self._ccols)
+        if crow == self._crows - 1 and side != EAST:
+            return False
+        if ccol == self._ccols - 1 and side in (EAST, SOUTH_EAST):
+            return False
+
+        return not (ccol == 0 and side == SOUTH_WEST)
+
+    def _border_area(self, cluster, side):
+        """
+        Get (top, bottom, left, right) bounds of
+        the cells transitions of the border depend on.
+        """
+        top, bottom, left, right = self.bounds(cluster)
+        if side == EAST:
+            return top, bottom, right - 1, right + 1
+        elif side == SOUTH:
+            return bottom - 1, bottom + 1, left, right
+        elif side == SOUTH_EAST:
+            return bottom - 1, bottom + 1, right - 1, right + 1
+        else:
+            return bottom - 1, bottom + 1, left - 1, left + 1
+
+    def _border(self, graph, cluster, side):
+        key = (cluster, side)
+        transitions = self._borders.get(key)
+        if transitions is None:
+            transitions = self._build_border(graph, cluster, side)
+            self._borders[key] = transitions
+
+        return transitions
+
+    def _build_border(self, graph, cluster, side):
+        def free(row, col):
+            return (graph.get_status(graph.get_index(row, col)) !=
+                    CellStatus.Blocked)
+
+        def diagonal(row, col, drow, dcol):
+            # A diagonal move is the only way to cross
+            # the border here if both straight ones are blocked.
+            if (free(row, col) and free(row + drow, col + dcol) and
+                    not free(row + drow, col) and
+                    not free(row, col + dcol)):
+                return [(graph.get_index(row, col),
+                         graph.get_index(row + drow, col + dcol))]
+
+            return []
+
+        top, bottom, left, right = self.bounds(cluster)
+        if side == SOUTH_EAST:
+            return diagonal(bottom - 1, right - 1, 1, 1)
+        elif side == SOUTH_WEST:
+            return diagonal(bottom - 1, left, 1, -1)
+        elif side == EAST:
+            cells = [(row, right - 1) for row in xrange(top, bottom)]
+            drow, dcol = 0, 1
+        else:
+            cells = [(bottom - 1, col) for col in xrange(left, right)]
+            drow, dcol = 1, 0
+
+        # Split the border into runs of pairs of free cells
+        runs = [[]]
+        for row, col in cells:
+            if free(row, col) and free(row + drow, col + dcol):
+                runs[-1].append((graph.get_index(row, col),
+                                 graph.get_index(row + drow, col + dcol)))
+            elif runs[-1]:
+                runs.append([])
+
+        transitions = []
+        for run in runs:
+            if not run:
+                continue
+            if len(run) < MAX_SINGLE_ENTRANCE:
+                transitions.append(run[len(run) // 2])
+            else:
+                transitions += [run[0], run[-1]]
+
+        if self._use_diags:
+            # Diagonal moves between neighbouring cells of the border
+            for (row, col), (nrow, ncol) in zip(cells, cells[1:]):
+                transitions += diagonal(row, col, nrow - row + drow,
+                                        ncol - col + dcol)
+                transitions += diagonal(nrow, ncol, row - nrow + drow,
+                                        col - ncol + dcol)
+
+        return transitions
+
+    def _cluster_edges(self, graph, cluster):
+        edges = self._edges.get(cluster)
+        if edges is None:
+            edges = self._build_cluster(graph, cluster)
+            self._edges[cluster] = edges
+
+        return edges
+
+    def _build_cluster(self, graph, cluster):
+        transitions = []  # (cell in the cluster, cell outside)
+        for side, offset in self._sides.iteritems():
+            if self._has_border(cluster, side):
+                transitions += self._border(graph, cluster, side)
+
+            # Borders of the neighbours on the other side
+            other = cluster - offset
+            if other >= 0 and self._has_border(other, side):
+                other_border = self._border(graph, other, side)
+                transitions += [(b, a) for a, b in other_border]
+
+        edges = {}
+        for mine, other in transitions:
+            edges.setdefault(mine, []).append((other,
+                                               graph.get_weight(other)))
+
+        bounds = self.bounds(cluster)
+        deltas = graph.neighbour_deltas(self._use_diags)
+        for node in edges:
+            costs, _ = cluster_search(graph, node, bounds, deltas,
+                                      targets=edges)
+            edges[node] += [(n, costs[n]) for n in edges
+                            if n != node and n in costs]
+
+        return edges
+
+
+class HPAStarWalker(BasicWalker):
+    """
+    Hierarchical Path-finding A* (HPA*).
+
+    The search runs on the cached ClusterAbstraction() of the graph
+    rather than on cells: the source and destination are linked to
+    nodes of their clusters, A* finds the path between them through
+    the abstract graph and then every abstract edge is refined into
+    cells by a search within its cluster. Only abstract nodes get
+    "Visited" status.
+
+    Paths are close to optimal, but not always optimal:
+    they cross cluster borders at transitions only.
+    """
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags,
+                 cluster_size=DEFAULT_CLUSTER_SIZE):
+        super(HPAStarWalker, self).__init__(graph, src_cell,
+                                            dst_cell, use_diags)
+        self._abstraction = get_abstraction(graph, cluster_size, use_diags)
+        self._deltas = graph.neighbour_deltas(use_diags)
+        self._finished = False
+
+        src, dst = src_cell.index, dst_cell.index
+        abstraction = self._abstraction
+
+        # Temporary edges linking the source and the
+        # destination to nodes of their clusters.
+        bounds = abstraction.bounds(abstraction.cluster_of(src))
+        nodes = abstraction.nodes(graph, abstraction.cluster_of(src))
+        costs, _ = cluster_search(graph, src, bounds, self._deltas,
+                                  targets=nodes + [dst])
+        self._src_edges = [(n, costs[n]) for n in nodes + [dst]
+                           if n in costs and n != src]
+
+        bounds = abstraction.bounds(abstraction.cluster_of(dst))
+        nodes = abstraction.nodes(graph, abstraction.cluster_of(dst))
+        costs, _ = cluster_search(graph, dst, bounds, self._deltas,
+                                  targets=nodes, reverse=True)
+        self._dst_costs = dict((n, costs[n]) for n in nodes
+                               if n in costs and n != dst)
+
+        self._costs = {src: 0}
+        self._parents = {}
+        self._queue = IndexedHeap()
+        self._queue.push(src, self._priority(src, 0))
+        self._reopens = 0
+        graph.set_status(src, CellStatus.Discovered)
+
+    def finished(self):
+        return self._finished
+
+    def queue_stats(self):
+        ret = self._queue.stats()
+        ret['reopens'] = self._reopens
+        return ret
+
+    def step(self):
+        if self._finished:
+            return
+        if len(self._queue) == 0:
+            self._finished = True
+            return
+
+        graph = self._graph
+        dst = self._dst_cell.index
+        idx = self._queue.pop()
+        graph.set_status(idx, CellStatus.Visited)
+        if idx == dst:
+            self._refine()
+            self._finished = True
+            return
+
+        cost = self._costs[idx]
+        for nidx, ecost in self._abstract_edges(idx):
+            ncost = cost + ecost
+            old_cost = self._costs.get(nidx)
+            if old_cost is not None and old_cost <= ncost:
+                continue
+
+            self._costs[nidx] = ncost
+            self._parents[nidx] = idx
+            priority = self._priority(nidx, ncost)
+            if nidx in self._queue:
+                self._queue.decrease_key(nidx, priority)
+            else:
+                # The heuristic isn't consistent on abstract edges,
+                # so closed nodes may have to be reopened.
+                self._queue.push(nidx, priority)
+                if old_cost is None:
+                    graph.set_status(nidx, CellStatus.Discovered)
+                else:
+                    self._reopens += 1
+
+    def _abstract_edges(self, idx):
+        for edge in self._abstraction.edges(self._graph, idx):
+            yield edge
+        if idx == self._src_cell.index:
+            for edge in self._src_edges:
+                yield edge
+
+        cost = self._dst_costs.get(idx)
+        if cost is not None:
+            yield self._dst_cell.index, cost
+
+    def _refine(self):
+        """Turn the abstract path into cells linked through parents"""
+        graph = self._graph
+        abstraction = self._abstraction
+        idx = self._dst_cell.index
+        graph.set_parent(self._src_cell.index, -1)
+        while idx in self._parents:
+            pidx = self._parents[idx]
+            cluster = abstraction.cluster_of(idx)
+            if cluster != abstraction.cluster_of(pidx):
+                # A move across the border
+                graph.set_parent(idx, pidx)
+            else:
+                path = abstraction.path(graph, pidx, idx)
+                for cidx, next_idx in zip(path, path[1:] + [pidx]):
+                    graph.set_parent(cidx, next_idx)
+
+            idx = pidx
+
+    def _priority(self, idx, cost):
+        # Abstract graphs of open areas have lots of equally good
+        # paths, prefer nodes closer to the destination among them.
+        estimate = self._heuristic(idx)
+        return (cost + estimate, estimate)
+
+    def _heuristic(self, idx):
+        # Paths are approximate anyway, so unlike flat walkers the
+        # estimate isn't lowered to stay (mostly) admissible. On
+        # maps of default weight it's exact, which keeps the
+        # abstract search in a narrow band along the path.
+        row, col = divmod(idx, self._graph.get_cols())
+        drow = abs(self._dst_cell.row - row)
+        dcol = abs(self._dst_cell.col - col)
+        if self._use_diags:
+            return DEFAULT_CELL_WEIGHT * max(drow, dcol)
+
+        return DEFAULT_CELL_WEIGHT * (drow + dcol)
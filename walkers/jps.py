@@ -0,0 +1,187 @@
+from core.cell import CellStatus
+from core.config import DEFAULT_CELL_WEIGHT
+from walkers.astar import AStarWalker
+from walkers.heuristics import DEFAULT_HEURISTIC
+
+
+def _sign(val):
+    return (val > 0) - (val < 0)
+
+
+class JPSWalker(AStarWalker):
+    """
+    Jump Point Search: A* that prunes symmetric paths on regions
+    of cells with default weight and jumps over them in straight
+    (and diagonal, if diagonal moves are allowed) lines.
+
+    A cell is "regular" if both the cell and all its neighbours have
+    default weight. Pruning is valid only around regular cells, so
+    jumps stop at the first irregular cell and irregular cells are
+    expanded in all directions. That keeps paths optimal on maps
+    with weighted cells.
+    """
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags,
+                 queue_type='indexed', heuristic=DEFAULT_HEURISTIC):
+        super(JPSWalker, self).__init__(graph, src_cell, dst_cell,
+                                        use_diags, queue_type=queue_type,
+                                        heuristic=heuristic)
+        self._rows = graph.get_rows()
+        self._cols = graph.get_cols()
+        self._regular_cache = {}
+        if use_diags:
+            self._dirs = [(dr, dc) for dr in (-1, 0, 1)
+                          for dc in (-1, 0, 1) if dr or dc]
+        else:
+            self._dirs = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+    def get_path(self):
+        """
+        Get shortest path. Parents of jump points are other jump
+        points, so cells jumped over are filled in here.
+        """
+        path = []
+        n = self._dst_cell
+        while n:
+            path.append(n)
+            p = n.parent
+            if p is None:
+                break
+
+            drow = _sign(p.row - n.row)
+            dcol = _sign(p.col - n.col)
+            row, col = n.row + drow, n.col + dcol
+            while (row, col) != (p.row, p.col):
+                path.append(self._graph.get_cell(row, col))
+                row += drow
+                col += dcol
+
+            n = p
+
+        return path
+
+    def _successors(self, idx):
+        row, col = divmod(idx, self._cols)
+        pidx = self._graph.get_parent(idx)
+        if pidx < 0 or not self._is_regular(row, col):
+            dirs = self._dirs
+        else:
+            prow, pcol = divmod(pidx, self._cols)
+            dirs = self._pruned_dirs(row, col, _sign(row - prow),
+                                     _sign(col - pcol))
+
+        for drow, dcol in dirs:
+            jp = self._jump(row, col, drow, dcol)
+            if jp is not None:
+                yield self._graph.get_index(jp[0], jp[1]), jp[2]
+
+    def _pruned_dirs(self, row, col, drow, dcol):
+        """
+        Directions of natural and forced neighbours of a regular
+        cell entered with (drow, dcol) move.
+        """
+        walkable = self._walkable
+        dirs = []
+        if self._use_diags:
+            if drow and dcol:
+                dirs += [(drow, 0), (0, dcol), (drow, dcol)]
+                if (not walkable(row - drow, col) and
+                        walkable(row - drow, col + dcol)):
+                    dirs.append((-drow, dcol))
+                if (not walkable(row, col - dcol) and
+                        walkable(row + drow, col - dcol)):
+                    dirs.append((drow, -dcol))
+            elif dcol:
+                dirs.append((0, dcol))
+                for side in (-1, 1):
+                    if (not walkable(row + side, col) and
+                            walkable(row + side, col + dcol)):
+                        dirs.append((side, dcol))
+            else:
+                dirs.append((drow, 0))
+                for side in (-1, 1):
+                    if (not walkable(row, col + side) and
+                            walkable(row + drow, col + side)):
+                        dirs.append((drow, side))
+        else:
+            # Canonical 4-connected paths go horizontally first and
+            # turn back from vertical to horizontal only at obstacles.
+            if dcol:
+                dirs += [(0, dcol), (-1, 0), (1, 0)]
+            else:
+                dirs.append((drow, 0))
+                for side in (-1, 1):
+                    if (not walkable(row - drow, col + side) and
+                            walkable(row, col + side)):
+                        dirs.append((0, side))
+
+        return dirs
+
+    def _jump(self, row, col, drow, dcol):
+        """
+        Move from (row, col) in (drow, dcol) direction until
+        a jump point is found. Return (row, col, cost) of the
+        jump point or None if there isn't one.
+        """
+        walkable = self._walkable
+        dst = self._dst_cell
+        cost = 0
+        while True:
+            row += drow
+            col += dcol
+            if not walkable(row, col):
+                return None
+
+            cost += self._graph.get_weight(self._graph.get_index(row, col))
+            if ((row == dst.row and col == dst.col) or
+                    not self._is_regular(row, col)):
+                return row, col, cost
+
+            if drow and dcol:
+                if ((not walkable(row - drow, col) and
+                     walkable(row - drow, col + dcol)) or
+                        (not walkable(row, col - dcol) and
+                         walkable(row + drow, col - dcol))):
+                    return row, col, cost
+                if (self._jump(row, col, drow, 0) is not None or
+                        self._jump(row, col, 0, dcol) is not None):
+                    return row, col, cost
+            elif self._use_diags:
+                if dcol:
+                    forced = any(not walkable(row + side, col) and
+                                 walkable(row + side, col + dcol)
+                                 for side in (-1, 1))
+                else:
+                    forced = any(not walkable(row, col + side) and
+                                 walkable(row + drow, col + side)
+                                 for side in (-1, 1))
+                if forced:
+                    return row, col, cost
+            elif dcol:
+                if (self._jump(row, col, -1, 0) is not None or
+                        self._jump(row, col, 1, 0) is not None):
+                    return row, col, cost
+            else:
+                if any(not walkable(row - drow, col + side) and
+                       walkable(row, col + side) for side in (-1, 1)):
+                    return row, col, cost
+
+    def _walkable(self, row, col):
+        return (0 <= row < self._rows and 0 <= col < self._cols and
+                self._graph.get_status(self._graph.get_index(row, col)) !=
+                CellStatus.Blocked)
+
+    def _is_regular(self, row, col):
+        idx = self._graph.get_index(row, col)
+        regular = self._regular_cache.get(idx)
+        if regular is None:
+            regular = all(self._graph.get_weight(
+                              self._graph.get_index(r, c)) ==
+                          DEFAULT_CELL_WEIGHT
+                          for r in xrange(max(row - 1, 0),
+                                          min(row + 2, self._rows))
+                          for c in xrange(max(col - 1, 0),
+                                          min(col + 2, self._cols)))
+            self._regular_cache[idx] = regular
+
+        return regular
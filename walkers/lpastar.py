@@ -0,0 +1,187 @@
+from core.cell import CellStatus
+from walkers.basic import BasicWalker
+from walkers.heuristics import make_heuristic
+from walkers.pqueue import IndexedHeap
+
+INFINITY = float('inf')
+
+
+class LPAStarWalker(BasicWalker):
+    """
+    Lifelong Planning A*: an incremental version of A*.
+
+    Every cell has "g", the cost of getting to it found so far, and
+    "rhs", a one step lookahead value based on g values of its
+    neighbours. Only cells where they differ ("inconsistent" cells)
+    are queued and expanded. When a wall is drawn or removed or a
+    weight changes, the walker gets notified by the graph, recomputes
+    rhs of the changed cell and its neighbours, and the next steps
+    repair just the affected part of the search tree.
+
+    The source is fixed, so moving it restarts the search. Moving the
+    destination only re-keys the open set.
+    """
+
+    incremental = True
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags):
+        super(LPAStarWalker, self).__init__(graph, src_cell,
+                                            dst_cell, use_diags)
+        self._deltas = graph.neighbour_deltas(use_diags)
+        # Expanded cells queued again, e.g. after an edit
+        self._reopens = 0
+        graph.add_listener(self.cell_changed)
+        self._restart()
+
+    def finished(self):
+        return self._finished
+
+    def close(self):
+        self._graph.remove_listener(self.cell_changed)
+
+    def queue_stats(self):
+        ret = self._queue.stats()
+        ret['reopens'] = self._reopens
+        return ret
+
+    def step(self):
+        if self._finished:
+            return
+
+        goal = self._dst_cell.index
+        if (len(self._queue) == 0 or
+                (self._queue.top_priority() >= self._key(goal) and
+                 self._rhs.get(goal, INFINITY) ==
+                 self._g.get(goal, INFINITY))):
+            self._finish()
+            return
+
+        graph = self._graph
+        idx = self._queue.pop()
+        if graph.get_status(idx) != CellStatus.Blocked:
+            graph.set_status(idx, CellStatus.Visited)
+        rhs = self._rhs.get(idx, INFINITY)
+        if self._g.get(idx, INFINITY) > rhs:
+            # Overconsistent cell: the lookahead found a cheaper way
+            self._g[idx] = rhs
+        else:
+            # Underconsistent cell: its old cost isn't valid anymore
+            self._g.pop(idx, None)
+            self._update_cell(idx)
+
+        for d in self._deltas[graph.neighbour_mask(idx)]:
+            self._update_cell(idx + d)
+
+    def cell_changed(self, idx):
+        """
+        Graph listener: the cell at "idx" became blocked or
+        unblocked or changed its weight.
+        """
+        if idx is None:
+            # The whole map has been reset
+            self._restart()
+            return
+        if self._graph.get_weight(idx) < self._min_weight:
+            # The estimate is scaled by the lowest weight
+            # and must stay a lower bound.
+            self._rekey()
+
+        self._update_cell(idx)
+        for d in self._deltas[self._graph.neighbour_mask(idx)]:
+            self._update_cell(idx + d)
+
+        self._finished = False
+
+    def move_endpoints(self, src_cell, dst_cell):
+        if src_cell != self._src_cell:
+            # g values are costs from the source,
+            # nothing is reusable if it moves.
+            self._src_cell = src_cell
+            self._dst_cell = dst_cell
+            self._graph.clear(clear_walls=False)
+            self._restart()
+        elif dst_cell != self._dst_cell:
+            # Keys depend on the heuristic, i.e. on the destination
+            self._dst_cell = dst_cell
+            self._rekey()
+
+    def _set_heuristic(self):
+        self._min_weight = self._graph.min_weight()
+        self._heuristic = make_heuristic('Auto', self._graph,
+                                         self._dst_cell, self._use_diags)
+
+    def _rekey(self):
+        """Recompute keys of all the queued cells with a new heuristic"""
+        self._set_heuristic()
+        queue = IndexedHeap()
+        for idx in self._queue.items():
+            queue.push(idx, self._key(idx))
+
+        self._queue = queue
+        self._finished = False
+
+    def _restart(self):
+        self._set_heuristic()
+        src = self._src_cell.index
+        self._g = {}
+        self._rhs = {src: 0}
+        self._queue = IndexedHeap()
+        self._queue.push(src, self._key(src))
+        self._finished = False
+
+    def _update_cell(self, idx):
+        """Recompute rhs of the cell and (re)queue it if necessary"""
+        graph = self._graph
+        if idx != self._src_cell.index:
+            rhs = INFINITY
+            if graph.get_status(idx) != CellStatus.Blocked:
+                weight = graph.get_weight(idx)
+                g = self._g
+                for d in self._deltas[graph.neighbour_mask(idx)]:
+                    rhs = min(rhs, g.get(idx + d, INFINITY) + weight)
+
+            if rhs == INFINITY:
+                self._rhs.pop(idx, None)
+            else:
+                self._rhs[idx] = rhs
+
+        queued = idx in self._queue
+        if queued:
+            self._queue.remove(idx)
+        if self._g.get(idx, INFINITY) != self._rhs.get(idx, INFINITY):
+            self._queue.push(idx, self._key(idx))
+            status = graph.get_status(idx)
+            if status == CellStatus.NotVisited:
+                graph.set_status(idx, CellStatus.Discovered)
+            elif status == CellStatus.Visited and not queued:
+                # Requeuing a cell that is already queued isn't a reopen
+                self._reopens += 1
+
+    def _key(self, idx):
+        cost = min(self._g.get(idx, INFINITY), self._rhs.get(idx, INFINITY))
+        return (cost + self._heuristic(idx), cost)
+
+    def _finish(self):
+        """Link the path cells through their parents"""
+        self._finished = True
+        graph = self._graph
+        src = self._src_cell.index
+        idx = self._dst_cell.index
+        graph.set_parent(src, -1)
+        if self._g.get(idx, INFINITY) == INFINITY:
+            graph.set_parent(idx, -1)
+            return
+
+        g = self._g
+        while idx != src:
+            pidx = min((idx + d for d in
+                        self._deltas[graph.neighbour_mask(idx)]),
+                       key=lambda n: g.get(n, INFINITY))
+            if g.get(pidx, INFINITY) >= g[idx]:
+                # Can't happen unless the search state is broken,
+                # but never loop forever because of it.
+                graph.set_parent(idx, -1)
+                return
+
+            graph.set_parent(idx, pidx)
+            idx = pidx
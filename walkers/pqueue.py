@@ -0,0 +1,314 @@
+import heapq
+from core.config import DEFAULT_CELL_WEIGHT
+
+
+class PriorityQueue(object):
+    """
+    Basic abstract class for priority queues used by walkers.
+    Items must be hashable, the item with the lowest priority
+    is popped first.
+    """
+
+    def __init__(self):
+        self.pushes = 0
+        self.pops = 0
+        self.decrease_keys = 0
+        self.peak_size = 0
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def push(self, item, priority):
+        """Insert a new item with given priority"""
+        raise NotImplementedError
+
+    def pop(self):
+        """Remove and return the item with the lowest priority"""
+        raise NotImplementedError
+
+    def decrease_key(self, item, priority):
+        """Lower the priority of an item that is already queued"""
+        raise NotImplementedError
+
+    def top_priority(self):
+        """Get the lowest priority in the (non-empty) queue"""
+        raise NotImplementedError
+
+    def stats(self):
+        """Get a dictionary of heap operation counters"""
+        return {'pushes': self.pushes,
+                'pops': self.pops,
+                'decrease_keys': self.decrease_keys,
+                'peak_size': self.peak_size}
+
+
+class IndexedHeap(PriorityQueue):
+    """
+    Binary heap keeping track of positions of its items,
+    which gives O(log n) decrease_key().
+    """
+
+    def __init__(self):
+        super(IndexedHeap, self).__init__()
+        self._heap = []  # [priority, item] pairs
+        self._pos = {}   # item -> index in self._heap
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def push(self, item, priority):
+        assert item not in self._pos
+        self.pushes += 1
+        self._heap.append([priority, item])
+        self._pos[item] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+        if len(self._heap) > self.peak_size:
+            self.peak_size = len(self._heap)
+
+    def pop(self):
+        self.pops += 1
+        heap = self._heap
+        last = heap.pop()
+        if not heap:
+            del self._pos[last[1]]
+            return last[1]
+
+        top = heap[0]
+        heap[0] = last
+        self._pos[last[1]] = 0
+        del self._pos[top[1]]
+        self._sift_down(0)
+        return top[1]
+
+    def decrease_key(self, item, priority):
+        self.decrease_keys += 1
+        idx = self._pos[item]
+        assert priority <= self._heap[idx][0]
+        self._heap[idx][0] = priority
+        self._sift_up(idx)
+
+    def top_priority(self):
+        return self._heap[0][0]
+
+    def remove(self, item):
+        """Remove a queued item regardless of its priority"""
+        idx = self._pos.pop(item)
+        last = self._heap.pop()
+        if idx < len(self._heap):
+            self._heap[idx] = last
+            self._pos[last[1]] = idx
+            self._sift_up(idx)
+            self._sift_down(self._pos[last[1]])
+
+    def items(self):
+        for _, item in self._heap:
+            yield item
+
+    def _sift_up(self, idx):
+        heap = self._heap
+        pos = self._pos
+        entry = heap[idx]
+        while idx > 0:
+            pidx = (idx - 1) >> 1
+            parent = heap[pidx]
+            if entry[0] >= parent[0]:
+                break
+
+            heap[idx] = parent
+            pos[parent[1]] = idx
+            idx = pidx
+
+        heap[idx] = entry
+        pos[entry[1]] = idx
+
+    def _sift_down(self, idx):
+        heap = self._heap
+        pos = self._pos
+        size = len(heap)
+        entry = heap[idx]
+        while True:
+            child = 2 * idx + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if heap[child][0] >= entry[0]:
+                break
+
+            heap[idx] = heap[child]
+            pos[heap[idx][1]] = idx
+            idx = child
+
+        heap[idx] = entry
+        pos[entry[1]] = idx
+
+
+class LazyHeap(PriorityQueue):
+    """
+    heapq based queue with lazy deletion: decrease_key() pushes
+    a duplicate entry and stale entries are skipped by pop().
+    """
+
+    def __init__(self):
+        super(LazyHeap, self).__init__()
+        self._heap = []        # (priority, counter, item) tuples
+        self._priorities = {}  # item -> its actual priority
+        self._counter = 0      # makes entries with equal priority comparable
+        self.stale_pops = 0
+
+    def __len__(self):
+        return len(self._priorities)
+
+    def __contains__(self, item):
+        return item in self._priorities
+
+    def push(self, item, priority):
+        assert item not in self._priorities
+        self.pushes += 1
+        self._priorities[item] = priority
+        self._push_entry(item, priority)
+
+    def pop(self):
+        self.pops += 1
+        while True:
+            priority, _, item = heapq.heappop(self._heap)
+            if self._priorities.get(item) == priority:
+                del self._priorities[item]
+                return item
+
+            self.stale_pops += 1
+
+    def decrease_key(self, item, priority):
+        self.decrease_keys += 1
+        assert priority <= self._priorities[item]
+        self._priorities[item] = priority
+        self._push_entry(item, priority)
+
+    def top_priority(self):
+        while True:
+            priority, _, item = self._heap[0]
+            if self._priorities.get(item) == priority:
+                return priority
+
+            heapq.heappop(self._heap)
+            self.stale_pops += 1
+
+    def stats(self):
+        ret = super(LazyHeap, self).stats()
+        ret['stale_pops'] = self.stale_pops
+        return ret
+
+    def _push_entry(self, item, priority):
+        self._counter += 1
+        heapq.heappush(self._heap, (priority, self._counter, item))
+        if len(self._heap) > self.peak_size:
+            self.peak_size = len(self._heap)
+
+
+class BucketQueue(PriorityQueue):
+    """
+    Dial's bucket queue: a circular array of buckets, one per
+    integer priority. Works only for integer priorities that never
+    go below the priority of the last popped item (which is the case
+    for Dijkstra with integer weights), but push() and pop() are O(1)
+    amortized. decrease_key() is lazy, like in LazyHeap.
+    """
+
+    def __init__(self, span=DEFAULT_CELL_WEIGHT + 1):
+        """
+        span - initial number of buckets, i.e. max difference between
+               queued priorities plus one. Grows when necessary.
+        """
+        super(BucketQueue, self).__init__()
+        self._buckets = [[] for _ in xrange(span)]
+        self._priorities = {}  # item -> its actual priority
+        self._cur = None       # priority of the current bucket
+        self._entries = 0      # number of entries including stale ones
+        self.stale_pops = 0
+
+    def __len__(self):
+        return len(self._priorities)
+
+    def __contains__(self, item):
+        return item in self._priorities
+
+    def push(self, item, priority):
+        assert item not in self._priorities
+        self.pushes += 1
+        if self._cur is None:
+            self._cur = priority
+
+        self._priorities[item] = priority
+        self._push_entry(item, priority)
+
+    def pop(self):
+        self.pops += 1
+        nbuckets = len(self._buckets)
+        while True:
+            bucket = self._buckets[self._cur % nbuckets]
+            while bucket:
+                item = bucket.pop()
+                self._entries -= 1
+                if self._priorities.get(item) == self._cur:
+                    del self._priorities[item]
+                    return item
+
+                self.stale_pops += 1
+
+            self._cur += 1
+
+    def decrease_key(self, item, priority):
+        self.decrease_keys += 1
+        assert priority <= self._priorities[item]
+        self._priorities[item] = priority
+        self._push_entry(item, priority)
+
+    def top_priority(self):
+        nbuckets = len(self._buckets)
+        while True:
+            bucket = self._buckets[self._cur % nbuckets]
+            while bucket:
+                if self._priorities.get(bucket[-1]) == self._cur:
+                    return self._cur
+
+                bucket.pop()
+                self._entries -= 1
+                self.stale_pops += 1
+
+            self._cur += 1
+
+    def stats(self):
+        ret = super(BucketQueue, self).stats()
+        ret['stale_pops'] = self.stale_pops
+        return ret
+
+    def _push_entry(self, item, priority):
+        assert priority == int(priority) and priority >= self._cur
+        if priority - self._cur >= len(self._buckets):
+            # _grow() re-buckets all the live items including this one
+            self._grow(priority - self._cur + 1)
+        else:
+            self._buckets[priority % len(self._buckets)].append(item)
+            self._entries += 1
+
+        if self._entries > self.peak_size:
+            self.peak_size = self._entries
+
+    def _grow(self, span):
+        nbuckets = max(span, 2 * len(self._buckets))
+        buckets = [[] for _ in xrange(nbuckets)]
+        for item, priority in self._priorities.iteritems():
+            buckets[priority % nbuckets].append(item)
+
+        self._buckets = buckets
+        self._entries = len(self._priorities)
+
+
+PRIORITY_QUEUES = {
+    'indexed': IndexedHeap,
+    'lazy': LazyHeap,
+    'bucket': BucketQueue
+}
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+from collections import deque
+from core.cell import CellStatus
+
+# Counters every probe reports, walkers' queue_stats()
+# may have only some of them (or more).
+COUNTERS = ('expansions', 'pushes', 'pops', 'decrease_keys', 'reopens',
+            'peak_size', 'steps')
+
+# Max number of spans and of counter samples a probe keeps for its
+# trace, older ones are dropped so long searches take bounded memory
+TRACE_MAX_EVENTS = 10000
+
+
+class SearchProbe(object):
+    """
+    Instrumentation of a search: makes a walker and stands in for it,
+    timing the phases of the search ("setup", i.e. making the walker,
+    "search" steps and getting the "path"), collecting counters and
+    calling hooks. Walkers know nothing about probes, so searches
+    that aren't probed don't pay anything for it.
+
+    Hooks are called as "hook(event, probe)" after the setup ("setup"),
+    every step ("step") and getting the path ("path"). Without hooks
+    advance() is left to the walker and costs just a couple of
+    time.time() calls and a sample of counters. Only the last
+    TRACE_MAX_EVENTS spans and samples are kept for trace_events().
+    """
+
+    def __init__(self, wclass, graph, src_cell, dst_cell, use_diags,
+                 hooks=(), **kwargs):
+        """
+        Make a "wclass" walker, the rest of the
+        arguments are the walker's ones.
+        """
+        self._graph = graph
+        self._hooks = list(hooks)
+        self.name = wclass.__name__
+        self.steps = 0
+        self.phases = {'setup': 0.0, 'search': 0.0, 'path': 0.0}
+        # (name, phase, start, duration, args) of timed spans
+        self._spans = deque(maxlen=TRACE_MAX_EVENTS)
+        # (timestamp, counters) samples
+        self._samples = deque(maxlen=TRACE_MAX_EVENTS)
+
+        start = time.time()
+        self.walker = wclass(graph, src_cell, dst_cell, use_diags, **kwargs)
+        self._record('setup', 'setup', start)
+        self._call_hooks('setup')
+
+    def __getattr__(self, name):
+        # Everything else (finished(), close(), etc.) is the walker's
+        if name == 'walker':
+            raise AttributeError(name)
+
+        return getattr(self.walker, name)
+
+    def add_hook(self, callback):
+        self._hooks.append(callback)
+
+    def remove_hook(self, callback):
+        self._hooks.remove(callback)
+
+    def step(self):
+        start = time.time()
+        self.walker.step()
+        self.steps += 1
+        self._record('step', 'search', start)
+        self._call_hooks('step')
+
+    def advance(self, max_expansions=None, deadline=None):
+        start = time.time()
+        if self._hooks:
+            # Hooks want to see every step
+            steps = 0
+            while not self.walker.finished():
+                if max_expansions is not None and steps >= max_expansions:
+                    break
+                if deadline is not None and time.time() >= deadline:
+                    break
+
+                self.walker.step()
+                steps += 1
+                self._call_hooks('step')
+        else:
+            steps = self.walker.advance(max_expansions, deadline)
+
+        self.steps += steps
+        self._record('advance', 'search', start, steps=steps)
+        self._samples.append((time.time(), self.counters()))
+        return steps
+
+    def get_path(self):
+        start = time.time()
+        path = self.walker.get_path()
+        self._record('get_path', 'path', start, length=len(path))
+        self._call_hooks('path')
+        return path
+
+    def counters(self):
+        """
+        Get a dictionary of COUNTERS. Expansions are cells
+        visited by the walker, the rest comes from its queue.
+        Counters the walker doesn't keep are None.
+        """
+        ret = dict.fromkeys(COUNTERS)
+        ret.update(self.walker.queue_stats())
+        ret['expansions'] = self._graph.count_status(CellStatus.Visited)
+        ret['steps'] = self.steps
+        return ret
+
+    def stats(self):
+        """Get counters along with time spent in every phase (in ms)"""
+        ret = self.counters()
+        ret['algorithm'] = self.name
+        ret['time_ms'] = dict((phase, round(secs * 1000, 3))
+                              for phase, secs in self.phases.iteritems())
+        return ret
+
+    def trace_events(self):
+        """
+        Get the probe's spans and counter samples as a list of Chrome
+        trace events. Timestamps are absolute, so events of several
+        probes (or processes) can be put into the same trace.
+        """
+        pid = os.getpid()
+        events = []
+        for name, phase, start, duration, args in self._spans:
+            events.append({'name': name, 'cat': phase, 'ph': 'X',
+                           'ts': int(start * 1e6),
+                           'dur': int(duration * 1e6),
+                           'pid': pid, 'tid': 0,
+                           'args': dict(args, algorithm=self.name)})
+        for ts, counters in self._samples:
+            # Counter tracks take numbers only
+            events.append({'name': self.name, 'ph': 'C',
+                           'ts': int(ts * 1e6), 'pid': pid, 'tid': 0,
+                           'args': dict((name, value) for name, value
+                                        in counters.iteritems()
+                                        if value is not None)})
+
+        return events
+
+    def save(self, fobj, chrome=False):
+        """
+        Save stats() as JSON or, if "chrome" is True, a trace for
+        chrome://tracing (or Perfetto). "fobj" is either a file
+        name or a file object.
+        """
+        if chrome:
+            save_trace(self.trace_events(), fobj)
+        else:
+            _dump_json(self.stats(), fobj)
+
+    def _record(self, name, phase, start, **args):
+        duration = time.time() - start
+        self.phases[phase] += duration
+        self._spans.append((name, phase, start, duration, args))
+
+    def _call_hooks(self, event):
+        for callback in self._hooks:
+            callback(event, self)
+
+
+def save_trace(events, fobj):
+    """Save a list of Chrome trace events, see SearchProbe.trace_events()"""
+    _dump_json({'traceEvents': events, 'displayTimeUnit': 'ms'}, fobj)
+
+
+def _dump_json(obj, fobj):
+    if isinstance(fobj, basestring):
+        with open(fobj, 'w') as f:
+            return _dump_json(obj, f)
+
+    json.dump(obj, fobj, indent=1)
+    fobj.write('\n')
@@ -0,0 +1,319 @@
+import sys
+import struct
+from array import array
+from bisect import bisect_right
+from core.cell import CellStatus
+from core.gridgraph import NEIGHBOUR_OFFSETS
+
+# Every event of a recording is a 32 bit word: the index of the cell
+# shifted by EVENT_BITS and an event code in the low bits. Codes below
+# PARENT_NEIGHBOUR are new statuses (CellStatus values), then go
+# parents that are neighbours (at NEIGHBOUR_OFFSETS[code -
+# PARENT_NEIGHBOUR]), no parent and parents that are far away, whose
+# indices are kept apart (see SearchRecording.far_parents).
+EVENT_BITS = 4
+EVENT_MASK = (1 << EVENT_BITS) - 1
+PARENT_NEIGHBOUR = 4
+PARENT_NONE = PARENT_NEIGHBOUR + len(NEIGHBOUR_OFFSETS)
+PARENT_FAR = PARENT_NONE + 1
+# The search state of all the cells has been reset (see GridGraph.clear())
+RESET = PARENT_FAR + 1
+MAX_RECORDED_CELLS = 1 << (32 - EVENT_BITS)
+
+# A keyframe is made once there have been at least this many events
+# since the previous one, and at least as many as the cells touched
+# so far, so keyframes never take more room than the events.
+KEYFRAME_MIN_EVENTS = 4096
+
+# Recording file: RECORDING_HEADER (magic, rows, cols, checksum of the
+# map, source, destination, length of the name and numbers of events,
+# far parents, steps, path cells and keyframes), the name, raw little
+# endian arrays of events, far parents, steps and the path, then every
+# keyframe as KEYFRAME_HEADER (step, far parents offset, number of
+# cells) followed by arrays of cells' indices, statuses and parents.
+RECORDING_MAGIC = 'SPREC\x01\x00\x00'
+RECORDING_HEADER = struct.Struct('<8sIIIiiIIIIII')
+KEYFRAME_HEADER = struct.Struct('<III')
+
+
+class SearchRecording(object):
+    """
+    A compact record of a search: status changes and parent links set
+    by a walker, kept as an append-only log of events (see EVENT_BITS)
+    split into steps, with keyframes (the state of all the touched
+    cells) every now and then, so that Replay() can get to any step
+    by applying a keyframe and the events after it.
+
+    A recording gets the events from the graph it's attached to with
+    start(), and steps from a SearchProbe() it's a hook of:
+
+        recording = start_recording(graph, 'A*', src, dst)
+        probe = SearchProbe(AStarWalker, graph, src_cell, dst_cell,
+                            use_diags, hooks=[recording])
+        probe.advance()
+        recording.stop(probe.get_path())
+
+    Changes of walls aren't recorded, searches are
+    replayed on the map they have been recorded on.
+    """
+
+    def __init__(self, rows, cols, checksum, name='', src=-1, dst=-1):
+        """
+        Make an empty recording of a search from "src" to "dst"
+        (indices of the cells) made by "name" walker on a "rows" x
+        "cols" map with given checksum (see GridGraph.checksum()).
+        """
+        if rows * cols > MAX_RECORDED_CELLS:
+            raise ValueError("%dx%d map is too big to record" % (rows, cols))
+
+        self.rows = rows
+        self.cols = cols
+        self.checksum = checksum
+        self.name = name
+        self.src = src
+        self.dst = dst
+        self.events = array('I')
+        self.far_parents = array('i')
+        # Numbers of events before every step, the search starts at
+        # step 0 and the setup of the walker is step 1.
+        self.steps = array('I', [0])
+        # Indices of the path cells, if any
+        self.path = array('i')
+        # (step, offset of far parents, indices, statuses, parents)
+        self.keyframes = [(0, 0, array('I'), array('b'), array('i'))]
+        self.keyframe_steps = [0]
+
+        deltas = [dr * cols + dc for dr, dc in NEIGHBOUR_OFFSETS]
+        self._parent_codes = dict((d, PARENT_NEIGHBOUR + k)
+                                  for k, d in enumerate(deltas))
+        self._graph = None
+        # Cells touched before the last keyframe
+        self._touched = set()
+
+    def __call__(self, event, probe):
+        # SearchProbe() hook
+        if event in ('setup', 'step'):
+            self.end_step()
+
+    def length(self):
+        """Get the number of recorded steps"""
+        return len(self.steps) - 1
+
+    def start(self, graph):
+        """Record changes of the search state of the graph"""
+        self._graph = graph
+        graph.set_recorder(self)
+
+    def stop(self, path=None):
+        """
+        Stop recording, "path" is a list of cells
+        of the path the search has found.
+        """
+        if self._graph is None:
+            return
+
+        if len(self.events) > self.steps[-1]:
+            self.end_step()
+        self._graph.set_recorder(None)
+        self._graph = None
+        if path:
+            self.path = array('i', [c.index for c in path])
+
+    def end_step(self):
+        """Mark the end of a step of the walker"""
+        self.steps.append(len(self.events))
+        since = len(self.events) - self.steps[self.keyframe_steps[-1]]
+        if since >= max(KEYFRAME_MIN_EVENTS, len(self._touched)):
+            self._add_keyframe()
+
+    # Graph recorder interface, see GridGraph.set_recorder()
+
+    def set_status(self, idx, status):
+        self.events.append(idx << EVENT_BITS | status)
+
+    def set_parent(self, idx, pidx):
+        if pidx < 0:
+            code = PARENT_NONE
+        else:
+            code = self._parent_codes.get(pidx - idx, PARENT_FAR)
+            if code == PARENT_FAR:
+                self.far_parents.append(pidx)
+
+        self.events.append(idx << EVENT_BITS | code)
+
+    def reset(self):
+        self.events.append(RESET)
+
+    def save(self, fobj):
+        """Save the recording, "fobj" is either a file name or a file object"""
+        if isinstance(fobj, basestring):
+            with open(fobj, 'wb') as f:
+                return self.save(f)
+
+        name = self.name.encode('utf-8')
+        fobj.write(RECORDING_HEADER.pack(
+            RECORDING_MAGIC, self.rows, self.cols, self.checksum, self.src,
+            self.dst, len(name), len(self.events), len(self.far_parents),
+            len(self.steps), len(self.path), len(self.keyframes)))
+        fobj.write(name)
+        for arr in (self.events, self.far_parents, self.steps, self.path):
+            _write_array(fobj, arr)
+        for step, far, indices, statuses, parents in self.keyframes:
+            fobj.write(KEYFRAME_HEADER.pack(step, far, len(indices)))
+            for arr in (indices, statuses, parents):
+                _write_array(fobj, arr)
+
+    def _add_keyframe(self):
+        graph = self._graph
+        first = self.steps[self.keyframe_steps[-1]]
+        touched = self._touched
+        touched.update(word >> EVENT_BITS for word in self.events[first:]
+                       if word & EVENT_MASK != RESET)
+        # Walls are the map's business, they stay as they are on replays
+        indices = array('I', [idx for idx in sorted(touched)
+                              if graph.get_status(idx) != CellStatus.Blocked])
+        statuses = array('b', [graph.get_status(idx) for idx in indices])
+        parents = array('i', [graph.get_parent(idx) for idx in indices])
+
+        step = self.length()
+        self.keyframes.append((step, len(self.far_parents),
+                               indices, statuses, parents))
+        self.keyframe_steps.append(step)
+
+
+def start_recording(graph, name='', src=-1, dst=-1):
+    """Make a SearchRecording() of a search on the graph and start it"""
+    recording = SearchRecording(graph.get_rows(), graph.get_cols(),
+                                graph.checksum(), name, src, dst)
+    recording.start(graph)
+    return recording
+
+
+def load_recording(fobj):
+    """Load a SearchRecording() saved by SearchRecording.save()"""
+    if isinstance(fobj, basestring):
+        with open(fobj, 'rb') as f:
+            return load_recording(f)
+
+    raw = fobj.read(RECORDING_HEADER.size)
+    if len(raw) != RECORDING_HEADER.size:
+        raise ValueError("Truncated recording")
+
+    (magic, rows, cols, checksum, src, dst, name_len, nevents, nfar,
+     nsteps, npath, nkeyframes) = RECORDING_HEADER.unpack(raw)
+    if magic != RECORDING_MAGIC:
+        raise ValueError("Not a search recording")
+
+    recording = SearchRecording(rows, cols, checksum,
+                                fobj.read(name_len).decode('utf-8'), src, dst)
+    recording.events = _read_array(fobj, 'I', nevents)
+    recording.far_parents = _read_array(fobj, 'i', nfar)
+    recording.steps = _read_array(fobj, 'I', nsteps)
+    recording.path = _read_array(fobj, 'i', npath)
+    recording.keyframes = []
+    for i in xrange(0, nkeyframes):
+        raw = fobj.read(KEYFRAME_HEADER.size)
+        if len(raw) != KEYFRAME_HEADER.size:
+            raise ValueError("Truncated recording")
+
+        step, far, ncells = KEYFRAME_HEADER.unpack(raw)
+        recording.keyframes.append((step, far,
+                                    _read_array(fobj, 'I', ncells),
+                                    _read_array(fobj, 'b', ncells),
+                                    _read_array(fobj, 'i', ncells)))
+
+    recording.keyframe_steps = [k[0] for k in recording.keyframes]
+    if not recording.steps or recording.keyframe_steps[:1] != [0]:
+        raise ValueError("Broken recording")
+
+    return recording
+
+
+class Replay(object):
+    """
+    Plays a SearchRecording() back on a graph of the same map, setting
+    statuses and parents of its cells as they were after any step.
+    Going to a step costs as much as the events between it and the
+    current step if it's ahead, otherwise as much as the nearest
+    keyframe before it and the events in between.
+    """
+
+    def __init__(self, recording, graph):
+        if ((graph.get_rows(), graph.get_cols()) !=
+                (recording.rows, recording.cols) or
+                graph.checksum() != recording.checksum):
+            raise ValueError("The search has been recorded on another map")
+
+        self.recording = recording
+        self._graph = graph
+        cols = graph.get_cols()
+        self._deltas = [dr * cols + dc for dr, dc in NEIGHBOUR_OFFSETS]
+        # Current step and the number of far parents used so far
+        self.position = None
+        self._far = 0
+        self.seek(0)
+
+    def length(self):
+        return self.recording.length()
+
+    def finished(self):
+        """Check if the replay has reached the last step"""
+        return self.position == self.length()
+
+    def seek(self, position):
+        """Go to the step at "position", get the step it's gone to"""
+        recording = self.recording
+        position = max(0, min(position, recording.length()))
+        k = bisect_right(recording.keyframe_steps, position) - 1
+        step, far, indices, statuses, parents = recording.keyframes[k]
+        if self.position is None or not step <= self.position <= position:
+            graph = self._graph
+            graph.clear(False)
+            for i in xrange(0, len(indices)):
+                graph.set_status(indices[i], statuses[i])
+                graph.set_parent(indices[i], parents[i])
+            self.position = step
+            self._far = far
+
+        self._apply(recording.steps[self.position], recording.steps[position])
+        self.position = position
+        return position
+
+    def _apply(self, start, end):
+        graph = self._graph
+        deltas = self._deltas
+        far_parents = self.recording.far_parents
+        for word in self.recording.events[start:end]:
+            idx = word >> EVENT_BITS
+            code = word & EVENT_MASK
+            if code < PARENT_NEIGHBOUR:
+                graph.set_status(idx, code)
+            elif code < PARENT_NONE:
+                graph.set_parent(idx, idx + deltas[code - PARENT_NEIGHBOUR])
+            elif code == PARENT_NONE:
+                graph.set_parent(idx, -1)
+            elif code == PARENT_FAR:
+                graph.set_parent(idx, far_parents[self._far])
+                self._far += 1
+            else:
+                graph.clear(False)
+
+
+def _write_array(fobj, arr):
+    if sys.byteorder == 'big' and arr.itemsize > 1:
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+
+    fobj.write(arr.tostring())
+
+
+def _read_array(fobj, typecode, count):
+    arr = array(typecode)
+    raw = fobj.read(count * arr.itemsize)
+    if len(raw) != count * arr.itemsize:
+        raise ValueError("Truncated recording")
+
+    arr.fromstring(raw)
+    if sys.byteorder == 'big' and arr.itemsize > 1:
+        arr.byteswap()
+    return arr
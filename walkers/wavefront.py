@@ -0,0 +1,178 @@
+from core.cell import CellStatus
+from core.gridgraph import NEIGHBOUR_OFFSETS
+from walkers.basic import BasicWalker
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Distance of cells that can't be reached
+UNREACHABLE = -1
+# Direction of cells without a parent: the start
+# and cells that haven't been reached.
+NO_DIRECTION = 0xFF
+
+
+class Wavefront(object):
+    """
+    Breadth first search on NumPy arrays: every step expands the whole
+    frontier at once. The frontier is an array of cell indices, and
+    for every kind of move its cells having a free neighbour that way
+    (see GridGraph.neighbour_mask()) are picked by a vectorised bit
+    test, moved and filtered by the mask of unvisited cells. The work
+    done in Python depends on the number of waves (i.e. on the
+    distance) rather than on the number of cells, and every wave costs
+    as much as its cells. Weights are ignored, distances are numbers
+    of moves.
+
+    "distances" is an int32 (rows, cols) array, UNREACHABLE for cells
+    that haven't been reached. "directions" is an uint8 array, every
+    reached cell but the start has there an index of the
+    NEIGHBOUR_OFFSETS item leading to its parent.
+    """
+
+    def __init__(self, graph, start, use_diags):
+        """start - index of the start cell"""
+        if numpy is None:
+            raise ImportError("Wavefront search needs numpy")
+
+        weights, walls, masks = graph.get_arrays()
+        self._masks = numpy.frombuffer(masks, dtype=numpy.uint8)
+        self._unvisited = (numpy.frombuffer(walls, dtype=numpy.int8) !=
+                           CellStatus.Blocked)
+
+        rows, cols = graph.get_rows(), graph.get_cols()
+        self._cols = cols
+        self._dist = numpy.full(rows * cols, UNREACHABLE, dtype=numpy.int32)
+        self._dirs = numpy.full(rows * cols, NO_DIRECTION,
+                                dtype=numpy.uint8)
+        self.distances = self._dist.reshape(rows, cols)
+        self.directions = self._dirs.reshape(rows, cols)
+
+        # (neighbour bit, index difference, direction back)
+        # for every kind of move, straight ones go first
+        self._moves = [(1 << k, dr * cols + dc,
+                        NEIGHBOUR_OFFSETS.index((-dr, -dc)))
+                       for k, (dr, dc) in enumerate(NEIGHBOUR_OFFSETS)
+                       if use_diags or k < 4]
+
+        self.frontier = numpy.array([start], dtype=numpy.intp)
+        self._dist[start] = 0
+        self._unvisited[start] = False
+        self.wave = 0
+
+    def done(self):
+        return len(self.frontier) == 0
+
+    def expand(self):
+        """
+        Expand the frontier by one move, get the new frontier
+        (an array of indices of the reached cells).
+        """
+        self.wave += 1
+        frontier_masks = self._masks[self.frontier]
+        reached = []
+        for bit, delta, back in self._moves:
+            cells = self.frontier[(frontier_masks & bit) != 0] + delta
+            # Cells are reached by one move at most, straight
+            # moves win ties like in the other walkers.
+            cells = cells[self._unvisited[cells]]
+            self._unvisited[cells] = False
+            self._dist[cells] = self.wave
+            self._dirs[cells] = back
+            reached.append(cells)
+
+        self.frontier = numpy.concatenate(reached)
+        return self.frontier
+
+    def run(self, target=None):
+        """Expand the frontier until it reaches "target" or dies out"""
+        while not self.done():
+            if target is not None and self._dist[target] != UNREACHABLE:
+                break
+
+            self.expand()
+
+    def path(self, idx):
+        """
+        Get a list of indices of the path cells from the start
+        to "idx" (both included), empty if there's no path.
+        """
+        if self._dist[idx] == UNREACHABLE:
+            return []
+
+        cols = self._cols
+        path = [idx]
+        direction = self._dirs[idx]
+        while direction != NO_DIRECTION:
+            dr, dc = NEIGHBOUR_OFFSETS[direction]
+            idx += dr * cols + dc
+            path.append(idx)
+            direction = self._dirs[idx]
+
+        path.reverse()
+        return path
+
+
+def wavefront_distances(graph, start, use_diags):
+    """
+    Get an int32 (rows, cols) array of numbers of moves from
+    the cell at "start" index to every cell of the graph
+    (UNREACHABLE for unreachable cells), see Wavefront().
+    """
+    wavefront = Wavefront(graph, start, use_diags)
+    wavefront.run()
+    return wavefront.distances
+
+
+class WavefrontWalker(BasicWalker):
+    """
+    Breadth first search with Wavefront(), one wave per step.
+    Visited cells are marked in the graph, which takes a Python
+    call per cell, so for headless queries on big maps
+    wavefront_distances() is way faster.
+    """
+
+    def __init__(self, graph, src_cell, dst_cell, use_diags):
+        super(WavefrontWalker, self).__init__(graph, src_cell,
+                                              dst_cell, use_diags)
+        self._wavefront = Wavefront(graph, src_cell.index, use_diags)
+        graph.set_status(src_cell.index, CellStatus.Visited)
+        self._pushes = 1
+        self._pops = 0
+        self._peak_size = 1
+        self._finished = src_cell == dst_cell
+
+    def finished(self):
+        return self._finished
+
+    def queue_stats(self):
+        return {'pushes': self._pushes,
+                'pops': self._pops,
+                'peak_size': self._peak_size}
+
+    def step(self):
+        if self._finished:
+            return
+
+        graph = self._graph
+        wavefront = self._wavefront
+        # The whole frontier is expanded at once
+        self._pops += len(wavefront.frontier)
+        frontier = wavefront.expand()
+        self._pushes += len(frontier)
+        self._peak_size = max(self._peak_size, len(frontier))
+        for idx in frontier.tolist():
+            graph.set_status(idx, CellStatus.Visited)
+
+        dst = self._dst_cell
+        if wavefront.done() or wavefront.distances[dst.row, dst.col] >= 0:
+            self._finish()
+
+    def _finish(self):
+        self._finished = True
+        graph = self._graph
+        path = self._wavefront.path(self._dst_cell.index)
+        for pidx, idx in zip(path, path[1:]):
+            graph.set_parent(idx, pidx)